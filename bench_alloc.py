@@ -0,0 +1,120 @@
+"""Allocation report for move generation, measured with tracemalloc.
+
+Compares generating each node's legal moves as a list of move tuples
+(Board.generate_legal_moves) with writing them as 16-bit move codes into a
+reused array (Board.generate_move_codes), on the same seeded positions:
+
+- held: blocks and bytes still allocated per node once its moves are
+  generated, which is what a search keeps alive on every ply
+- transient: the tracemalloc peak above that while a node's moves are
+  being generated
+- perft: the speed of a full perft with each approach
+
+It also reports the size of a piece, which has __slots__, against the
+same piece with an instance dict.
+
+    python bench_alloc.py [positions] [depth]
+"""
+import random
+import sys
+import time
+import tracemalloc
+
+from chess_app import Board, ChessPiece, PieceColor, PieceType, move_buffer
+from perft import REFERENCE_POSITIONS, make_board, perft, perft_codes
+
+# tracemalloc's own bookkeeping isn't part of what's being measured
+IGNORE = [tracemalloc.Filter(False, tracemalloc.__file__)]
+
+
+def sample_positions(count, seed=5, max_plies=60):
+    """Play seeded random games and keep the final board of each"""
+    rng = random.Random(seed)
+    boards = []
+    for _ in range(count):
+        board = Board()
+        for _ in range(rng.randrange(max_plies)):
+            moves = list(board.generate_legal_moves(board.side_to_move))
+            if not moves:
+                break
+            board.make_move(*rng.choice(moves))
+        boards.append(board)
+    return boards
+
+
+def held_per_node(boards, generate):
+    """Average (blocks, bytes) still allocated per board after generating its moves"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot().filter_traces(IGNORE)
+    held = [generate(board) for board in boards]
+    after = tracemalloc.take_snapshot().filter_traces(IGNORE)
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    # The list that collects the results isn't part of any node
+    blocks = sum(stat.count_diff for stat in stats) - 1
+    size = sum(stat.size_diff for stat in stats) - sys.getsizeof(held)
+    return blocks / len(boards), size / len(boards)
+
+
+def transient_per_node(boards, generate):
+    """Average tracemalloc peak, above the starting point, while a board's moves are generated"""
+    tracemalloc.start()
+    total = 0
+    for board in boards:
+        start = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        generate(board)
+        total += tracemalloc.get_traced_memory()[1] - start
+    tracemalloc.stop()
+    return total / len(boards)
+
+
+def time_perft(func, fen, depth):
+    """Run func(board, depth); return (nodes, seconds)"""
+    board = make_board(fen)
+    start = time.perf_counter()
+    nodes = func(board, depth)
+    return nodes, time.perf_counter() - start
+
+
+class DictPiece(ChessPiece):
+    """A piece with an instance dict, the way ChessPiece was before it had __slots__"""
+
+
+def piece_size(cls, count=10000):
+    """Average bytes tracemalloc sees per piece"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    pieces = [cls(PieceColor.WHITE, PieceType.PAWN, 6, col % 8) for col in range(count)]
+    size = tracemalloc.get_traced_memory()[0] - before - sys.getsizeof(pieces)
+    tracemalloc.stop()
+    return size / count
+
+
+def run(positions=200, depth=3):
+    boards = sample_positions(positions)
+    buffer = move_buffer()
+    approaches = [
+        ("tuples", lambda board: list(board.generate_legal_moves(board.side_to_move))),
+        ("codes", lambda board: board.generate_move_codes(board.side_to_move, buffer)),
+    ]
+    moves = sum(board.generate_move_codes(board.side_to_move, buffer) for board in boards)
+    print(f"{positions} positions, {moves / positions:.1f} legal moves per node on average")
+    for name, generate in approaches:
+        blocks, size = held_per_node(boards, generate)
+        transient = transient_per_node(boards, generate)
+        print(f"{name:>7}: held {blocks:6.1f} blocks / {round(size):7} bytes per node, "
+              f"transient peak {transient:6.0f} bytes per node")
+
+    fen = REFERENCE_POSITIONS[1][1]
+    for name, func in (("tuples", perft), ("codes", perft_codes)):
+        nodes, elapsed = time_perft(func, fen, depth)
+        print(f"{name:>7}: perft kiwipete depth {depth}: {nodes} nodes in {elapsed:.2f}s "
+              f"({nodes / elapsed:,.0f} nodes/s)")
+
+    print(f"  piece: {piece_size(ChessPiece):.0f} bytes with __slots__, "
+          f"{piece_size(DictPiece):.0f} bytes with an instance dict")
+
+
+if __name__ == "__main__":
+    run(*(int(arg) for arg in sys.argv[1:3]))
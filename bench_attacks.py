@@ -0,0 +1,124 @@
+"""Micro-benchmark and consistency check for Board.is_square_attacked.
+
+Compares three ways of answering it, each queried for every square and both
+colors on the same fixed set of positions:
+
+- legacy: generate every enemy piece's moves and search the lists
+- reverse-ray: look outward from the square (Board._scan_attacked)
+- attack-map: read the incrementally maintained Board.attack_counts
+
+Before timing it plays seeded random games, making and unmaking every move,
+and checks after each step that the incremental attack maps equal a full
+recount (Board.compute_attack_counts). It exits with status 1 if they don't.
+
+    python bench_attacks.py [positions] [repeat]
+"""
+import random
+import sys
+import time
+
+from chess_app import Board, ChessGame, PieceColor
+
+
+def legacy_is_square_attacked(board, row, col, by_color):
+    """The original move-list based attack test"""
+    for r in range(8):
+        for c in range(8):
+            piece = board.board[r][c]
+            if piece and piece.color == by_color:
+                moves = piece.get_possible_moves(board.board)
+                if (row, col) in moves:
+                    return True
+    return False
+
+
+def fixed_positions(count, seed=7, max_plies=80):
+    """Play seeded random games and keep the final board of each"""
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(count):
+        game = ChessGame()
+        color = PieceColor.WHITE
+        for _ in range(rng.randrange(max_plies)):
+            moves = []
+            for row in range(8):
+                for col in range(8):
+                    piece = game.board.get_piece_at(row, col)
+                    if piece and piece.color == color:
+                        moves.extend((row, col, r, c) for r, c in game.get_legal_moves(piece))
+            if not moves:
+                break
+            game.board.move_piece(*rng.choice(moves))
+            color = PieceColor.BLACK if color == PieceColor.WHITE else PieceColor.WHITE
+        positions.append(game.board)
+    return positions
+
+
+def check_attack_maps(games, seed=11, max_plies=120):
+    """Count the positions where the incremental attack maps differ from a full recount"""
+    rng = random.Random(seed)
+    checked = mismatches = 0
+    for _ in range(games):
+        board = Board()
+        for _ in range(max_plies):
+            moves = list(board.generate_legal_moves(board.side_to_move))
+            if not moves:
+                break
+            # Make and take back every move, then play one of them
+            for move in moves:
+                board.make_move(*move)
+                checked += 1
+                mismatches += board.attack_counts != board.compute_attack_counts()
+                board.unmake_move()
+                checked += 1
+                mismatches += board.attack_counts != board.compute_attack_counts()
+            board.make_move(*rng.choice(moves))
+    return checked, mismatches
+
+
+def run(positions=40, repeat=3):
+    checked, map_mismatches = check_attack_maps(max(1, positions // 10))
+    print(f"Attack maps: {checked} make/unmake steps checked, {map_mismatches} differ from a full recount")
+
+    boards = fixed_positions(positions)
+    queries = [(board, row, col, color)
+               for board in boards
+               for row in range(8)
+               for col in range(8)
+               for color in (PieceColor.WHITE, PieceColor.BLACK)]
+
+    # The two definitions only coincide on squares held by the defending
+    # side: the old version counted pawn pushes as attacks and never
+    # counted defended pieces.
+    mismatches = 0
+    for board, row, col, color in queries:
+        piece = board.get_piece_at(row, col)
+        if piece and piece.color != color:
+            if Board.is_square_attacked(board, row, col, color) != legacy_is_square_attacked(board, row, col, color):
+                mismatches += 1
+        # The map and the scan must agree everywhere
+        if Board.is_square_attacked(board, row, col, color) != Board._scan_attacked(board, row, col, color):
+            map_mismatches += 1
+
+    timings = {}
+    for name, attacked in (("legacy", legacy_is_square_attacked), ("reverse-ray", Board._scan_attacked),
+                           ("attack-map", Board.is_square_attacked)):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for board, row, col, color in queries:
+                attacked(board, row, col, color)
+        timings[name] = time.perf_counter() - start
+        calls = len(queries) * repeat
+        print(f"{name:>12}: {calls} calls in {timings[name]:.3f}s ({calls / timings[name]:,.0f} calls/s)")
+
+    print(f"Speedup: {timings['legacy'] / timings['reverse-ray']:.1f}x reverse-ray, "
+          f"{timings['legacy'] / timings['attack-map']:.1f}x attack-map on {positions} positions")
+    if mismatches:
+        print(f"Warning: {mismatches} occupied-square results differ")
+    if map_mismatches:
+        print(f"Error: attack maps disagree with a full recount or the ray scan {map_mismatches} times")
+    return timings, map_mismatches
+
+
+if __name__ == "__main__":
+    sys.exit(1 if run(*(int(arg) for arg in sys.argv[1:3]))[1] else 0)
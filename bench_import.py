@@ -0,0 +1,48 @@
+"""Check the import-time budget of the headless rules core.
+
+Imports chess_app in fresh interpreters under `python -X importtime`,
+reports the best cumulative import time and fails if it is over budget or
+if pygame or numpy were imported along the way.
+
+    python bench_import.py [runs]
+"""
+import os
+import subprocess
+import sys
+
+MODULE = "chess_app"
+# Cumulative import time allowed for a headless worker, in milliseconds
+BUDGET_MS = 50
+FORBIDDEN = ("pygame", "numpy")
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure():
+    """Import the module once in a new interpreter; return (ms, forbidden modules loaded)"""
+    code = f"import sys, {MODULE}; print(','.join(m for m in {FORBIDDEN!r} if m in sys.modules))"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    for line in proc.stderr.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == MODULE:
+            return int(fields[1]) / 1000, [m for m in proc.stdout.strip().split(",") if m]
+    raise RuntimeError(f"no importtime line for {MODULE}")
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    # The first run may have to compile bytecode
+    results = [measure() for _ in range(runs + 1)][1:]
+    best = min(ms for ms, _ in results)
+    loaded = sorted({m for _, modules in results for m in modules})
+
+    print(f"import {MODULE}: best {best:.1f}ms of {runs} runs (budget {BUDGET_MS}ms)")
+    if loaded:
+        print(f"FAIL: headless import pulled in {', '.join(loaded)}")
+    if best > BUDGET_MS:
+        print("FAIL: over budget")
+    return 1 if loaded or best > BUDGET_MS else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""Throughput benchmark for position serialization.
+
+Times FEN export (Board.to_fen) and import (Board.load_fen) against the
+fixed-size binary encoding (Board.to_bytes / Board.load_bytes) on the
+same seeded set of positions, checks that both round-trip, and reports
+positions per second and bytes per position.
+
+    python bench_positions.py [positions] [repeat]
+"""
+import random
+import sys
+import time
+
+from chess_app import Board, POSITION_FORMAT
+
+
+def sample_positions(count, seed=11, max_plies=120):
+    """Play seeded random games and keep the final board of each"""
+    rng = random.Random(seed)
+    boards = []
+    for _ in range(count):
+        board = Board()
+        for _ in range(rng.randrange(max_plies)):
+            moves = list(board.generate_legal_moves(board.side_to_move))
+            if not moves:
+                break
+            board.make_move(*rng.choice(moves))
+        boards.append(board)
+    return boards
+
+
+def _time(label, count, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:>13}: {count} positions in {elapsed:.3f}s ({count / elapsed:,.0f} positions/s)")
+    return count / elapsed
+
+
+def run(positions=200, repeat=20):
+    boards = sample_positions(positions)
+    fens = [board.to_fen() for board in boards]
+    encoded = [board.to_bytes() for board in boards]
+
+    # Both formats must give back the same position, clocks included
+    failures = 0
+    target = Board()
+    for fen, data in zip(fens, encoded):
+        target.load_fen(fen)
+        if target.to_fen() != fen:
+            failures += 1
+        target.load_bytes(data)
+        if target.to_fen() != fen:
+            failures += 1
+
+    count = positions * repeat
+    results = {
+        "fen export": _time("fen export", count,
+                            lambda: [board.to_fen() for _ in range(repeat) for board in boards]),
+        "fen import": _time("fen import", count,
+                            lambda: [target.load_fen(fen) for _ in range(repeat) for fen in fens]),
+        "binary export": _time("binary export", count,
+                               lambda: [board.to_bytes() for _ in range(repeat) for board in boards]),
+        "binary import": _time("binary import", count,
+                               lambda: [target.load_bytes(data) for _ in range(repeat) for data in encoded]),
+    }
+
+    fen_bytes = sum(len(fen) for fen in fens) / positions
+    print(f"Size: FEN {fen_bytes:.1f} bytes on average, binary {POSITION_FORMAT.size} bytes fixed")
+    if failures:
+        print(f"FAIL: {failures} round trips changed the position")
+    return results, failures
+
+
+if __name__ == "__main__":
+    _, failures = run(*(int(arg) for arg in sys.argv[1:3]))
+    sys.exit(1 if failures else 0)
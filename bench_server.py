@@ -0,0 +1,173 @@
+"""Load generator for server.py.
+
+Opens --clients connections to a running server, each playing --games
+seeded random games one after another: it asks for the legal moves, plays
+a random one and repeats until the game ends or --max-plies. Before that,
+--idle connections open --idle-games games each and leave them open, so
+the server holds many boards at once. It reports moves per second, the
+latency of "move" requests (which include the server's validation and
+status check) and the server's peak memory per open game.
+
+    python bench_server.py [--clients 100] [--games 2] [--idle 10 --idle-games 100] [--spawn]
+
+--spawn starts a server on --port for the run and stops it afterwards.
+Exits with status 1 if any request got an error reply.
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+
+from server import DEFAULT_PORT
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+
+
+class Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, host, port):
+        return cls(*await asyncio.open_connection(host, port))
+
+    async def request(self, line):
+        """Send a command and return its reply split into words; raise RuntimeError on an error reply"""
+        self.writer.write(line.encode() + b"\n")
+        await self.writer.drain()
+        words = (await self.reader.readline()).decode().split()
+        if not words or words[0] != "ok":
+            raise RuntimeError(f"{line!r}: {' '.join(words) or 'connection closed'}")
+        return words[1:]
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def play_games(host, port, games, max_plies, seed, latencies):
+    """Play random games over one connection; return the number of moves played"""
+    rng = random.Random(seed)
+    connection = await Connection.open(host, port)
+    played = 0
+    try:
+        for _ in range(games):
+            game_id = (await connection.request("new"))[0]
+            for _ in range(max_plies):
+                moves = await connection.request(f"moves {game_id}")
+                if not moves:
+                    break
+                start = time.perf_counter()
+                status = await connection.request(f"move {game_id} {rng.choice(moves)}")
+                latencies.append(time.perf_counter() - start)
+                played += 1
+                if status and status[0] in ("checkmate", "stalemate"):
+                    break
+            await connection.request(f"close {game_id}")
+    finally:
+        await connection.close()
+    return played
+
+
+async def server_stats(host, port):
+    connection = await Connection.open(host, port)
+    try:
+        return dict(word.split("=") for word in await connection.request("stats"))
+    finally:
+        await connection.close()
+
+
+async def wait_for_server(host, port, timeout=15.0):
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            await (await Connection.open(host, port)).close()
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def run(host, port, clients=100, games=2, max_plies=100, seed=1, idle=0, idle_games=100):
+    before = await server_stats(host, port)
+    # Games nobody plays, held open so the server carries many boards
+    idle_connections = [await Connection.open(host, port) for _ in range(idle)]
+    for connection in idle_connections:
+        for _ in range(idle_games):
+            await connection.request("new")
+    held = await server_stats(host, port)
+
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    results = await asyncio.gather(*(play_games(host, port, games, max_plies, seed * 100003 + client, latencies)
+                                     for client in range(clients)), return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    moves = 0
+    for result in results:
+        if isinstance(result, Exception):
+            errors += 1
+            print(f"client error: {result}")
+        else:
+            moves += result
+    after = await server_stats(host, port)
+    for connection in idle_connections:
+        await connection.close()
+
+    latencies.sort()
+    print(f"{clients} clients, {clients * games} games, {moves} moves in {elapsed:.2f}s "
+          f"({moves / elapsed if elapsed > 0 else 0.0:,.0f} moves/s)")
+    if latencies:
+        def percentile(fraction):
+            return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000
+        print(f"move latency: p50 {percentile(0.5):.2f}ms  p90 {percentile(0.9):.2f}ms  "
+              f"p99 {percentile(0.99):.2f}ms  max {latencies[-1] * 1000:.2f}ms")
+    opened = int(held["sessions"]) - int(before["sessions"])
+    if opened:
+        grown = int(held["maxrss_kb"]) - int(before["maxrss_kb"])
+        print(f"server: {held['sessions']} open games, peak memory +{grown} kB for {opened} idle games "
+              f"({grown * 1024 / opened:,.0f} bytes per game)")
+    print(f"server: peak memory {after['maxrss_kb']} kB, {after['commands']} commands served")
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test a running server.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--clients", type=int, default=100, help="concurrent connections playing games")
+    parser.add_argument("--games", type=int, default=2, help="games per client, one after another")
+    parser.add_argument("--max-plies", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--idle", type=int, default=0, help="connections that only hold games open")
+    parser.add_argument("--idle-games", type=int, default=100, help="games opened per idle connection")
+    parser.add_argument("--spawn", action="store_true", help="start a server for the run")
+    parser.add_argument("--executor", choices=["process", "thread", "none"], default="process",
+                        help="executor of the spawned server")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.spawn:
+        server = subprocess.Popen([sys.executable, SERVER_SCRIPT, "--host", args.host, "--port", str(args.port),
+                                   "--executor", args.executor], stdout=subprocess.DEVNULL)
+    try:
+        async def session():
+            if server:
+                await wait_for_server(args.host, args.port)
+            return await run(args.host, args.port, args.clients, args.games, args.max_plies, args.seed,
+                             args.idle, args.idle_games)
+        errors = asyncio.run(session())
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,681 @@
+"""Bitboard board backend.
+
+BitBoard keeps one 64-bit integer per piece type and color plus occupancy
+masks, and answers the same questions as chess_app.Board (move_piece,
+get_piece_at, get_possible_moves, is_king_in_check, has_legal_moves, ...),
+so it can be handed to ChessGame in place of the 8x8 object grid:
+
+    game = ChessGame(board=BitBoard())
+
+Squares are numbered row * 8 + col, using the same rows and columns as
+Board (row 0 is black's back rank).
+
+Run this file directly to benchmark legal move generation against Board.
+"""
+import random
+import sys
+import time
+
+from chess_app import (BLACK_KINGSIDE, BLACK_QUEENSIDE, MOVE_PROMOTIONS, PROMOTION_FLAGS, WHITE_KINGSIDE,
+                       WHITE_QUEENSIDE, ZOBRIST_BLACK_TO_MOVE, ZOBRIST_CASTLING, ZOBRIST_EN_PASSANT,
+                       ZOBRIST_PIECES, Board, ChessPiece, PieceColor, PieceType)
+
+WHITE, BLACK = 0, 1
+PAWN, ROOK, KNIGHT, BISHOP, QUEEN, KING = range(6)
+
+# Index <-> enum conversions (piece indices follow PieceType.value - 1)
+COLORS = (PieceColor.WHITE, PieceColor.BLACK)
+PIECE_TYPES = (PieceType.PAWN, PieceType.ROOK, PieceType.KNIGHT,
+               PieceType.BISHOP, PieceType.QUEEN, PieceType.KING)
+COLOR_INDEX = {PieceColor.WHITE: WHITE, PieceColor.BLACK: BLACK}
+
+FULL = (1 << 64) - 1
+
+BACK_RANK = (ROOK, KNIGHT, BISHOP, QUEEN, KING, BISHOP, KNIGHT, ROOK)
+
+
+def _leaper_table(offsets):
+    """Build a 64-entry attack table for a piece that jumps by fixed offsets"""
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        bb = 0
+        for dr, dc in offsets:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                bb |= 1 << (r * 8 + c)
+        table.append(bb)
+    return table
+
+
+def _ray_table(dr, dc):
+    """Build the squares reached from each square in one direction on an empty board"""
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        bb = 0
+        r, c = row + dr, col + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            bb |= 1 << (r * 8 + c)
+            r, c = r + dr, c + dc
+        table.append(bb)
+    return table
+
+
+KNIGHT_ATTACKS = _leaper_table([(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)])
+KING_ATTACKS = _leaper_table([(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)])
+# Indexed by the pawn's color: white pawns capture towards row 0
+PAWN_ATTACKS = (_leaper_table([(-1, -1), (-1, 1)]), _leaper_table([(1, -1), (1, 1)]))
+
+# (ray table, positive) pairs; on a positive ray the nearest blocker is the
+# lowest set bit, on a negative ray it is the highest
+ROOK_RAYS = [(_ray_table(dr, dc), dr * 8 + dc > 0) for dr, dc in [(0, 1), (0, -1), (1, 0), (-1, 0)]]
+BISHOP_RAYS = [(_ray_table(dr, dc), dr * 8 + dc > 0) for dr, dc in [(1, 1), (1, -1), (-1, 1), (-1, -1)]]
+
+
+def slider_attacks(sq, occupied, rays):
+    """Squares attacked along the given rays, stopping at the first blocker"""
+    attacks = 0
+    for table, positive in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= table[blocker]
+        attacks |= ray
+    return attacks
+
+
+def iter_squares(bb):
+    """Yield the index of every set bit, lowest first"""
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+class BitBoard:
+    def __init__(self):
+        # pieces[color][piece] is the bitboard of that piece type
+        self.pieces = [[0] * 6, [0] * 6]
+        self.occupancy = [0, 0]
+        # (color, piece) for each square, for O(1) lookups
+        self.mailbox = [None] * 64
+        # Squares whose piece has not moved yet (replaces ChessPiece.has_moved)
+        self.unmoved = 0
+        self.undo_stack = []
+        self.side_to_move = PieceColor.WHITE
+        # Square index a pawn can capture en passant on, or None
+        self.en_passant = None
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.setup_pieces()
+
+    @classmethod
+    def from_board(cls, board):
+        """Build a BitBoard from a chess_app.Board"""
+        bitboard = cls.__new__(cls)
+        bitboard._copy_from(board)
+        return bitboard
+
+    def _copy_from(self, board):
+        """Replace the position with the one on a chess_app.Board"""
+        self.pieces = [[0] * 6, [0] * 6]
+        self.occupancy = [0, 0]
+        self.mailbox = [None] * 64
+        self.unmoved = 0
+        self.undo_stack = []
+        self.side_to_move = board.side_to_move
+        ep = board.en_passant_square
+        self.en_passant = ep[0] * 8 + ep[1] if ep else None
+        self.halfmove_clock = board.halfmove_clock
+        self.fullmove_number = board.fullmove_number
+        for row in range(8):
+            for col in range(8):
+                piece = board.get_piece_at(row, col)
+                if piece:
+                    sq = row * 8 + col
+                    self._place(COLOR_INDEX[piece.color], piece.piece_type.value - 1, sq)
+                    if not piece.has_moved:
+                        self.unmoved |= 1 << sq
+        self.zobrist_hash = self.compute_hash()
+
+    def to_board(self):
+        """Build a chess_app.Board of the same position"""
+        board = Board()
+        pieces = [(sq >> 3, sq & 7, COLORS[entry[0]], PIECE_TYPES[entry[1]])
+                  for sq, entry in enumerate(self.mailbox) if entry is not None]
+        board._set_position(pieces, self.side_to_move, self.castling_rights(), self.en_passant_square,
+                            self.halfmove_clock, self.fullmove_number)
+        return board
+
+    # FEN and the binary encoding go through Board, so both backends read
+    # and write exactly the same strings and bytes
+    def load_fen(self, fen):
+        """Setup the board from a FEN string"""
+        board = Board()
+        board.load_fen(fen)
+        self._copy_from(board)
+
+    def to_fen(self):
+        """Get the FEN string of the position"""
+        return self.to_board().to_fen()
+
+    def load_bytes(self, data):
+        """Setup the board from the encoding made by to_bytes"""
+        board = Board()
+        board.load_bytes(data)
+        self._copy_from(board)
+
+    def to_bytes(self):
+        """Encode the position like Board.to_bytes"""
+        return self.to_board().to_bytes()
+
+    def setup_pieces(self):
+        """Setup the chess board with all pieces in starting positions"""
+        for col in range(8):
+            self._place(BLACK, BACK_RANK[col], col)
+            self._place(BLACK, PAWN, 8 + col)
+            self._place(WHITE, PAWN, 48 + col)
+            self._place(WHITE, BACK_RANK[col], 56 + col)
+        self.unmoved = self.occupancy[WHITE] | self.occupancy[BLACK]
+        self.zobrist_hash = self.compute_hash()
+
+    def castling_rights(self):
+        """Get the castling rights mask, using the same bits as Board"""
+        rights = 0
+        for color, king_sq, kingside, queenside in ((WHITE, 60, WHITE_KINGSIDE, WHITE_QUEENSIDE),
+                                                    (BLACK, 4, BLACK_KINGSIDE, BLACK_QUEENSIDE)):
+            if self.mailbox[king_sq] != (color, KING) or not (self.unmoved >> king_sq) & 1:
+                continue
+            for rook_sq, right in ((king_sq + 3, kingside), (king_sq - 4, queenside)):
+                if self.mailbox[rook_sq] == (color, ROOK) and (self.unmoved >> rook_sq) & 1:
+                    rights |= right
+        return rights
+
+    def compute_hash(self):
+        """Compute the Zobrist hash of the position from scratch (matches Board)"""
+        h = ZOBRIST_CASTLING[self.castling_rights()]
+        if self.side_to_move == PieceColor.BLACK:
+            h ^= ZOBRIST_BLACK_TO_MOVE
+        for sq, entry in enumerate(self.mailbox):
+            if entry is not None:
+                h ^= ZOBRIST_PIECES[entry[0]][entry[1]][sq]
+        if self.en_passant is not None:
+            h ^= ZOBRIST_EN_PASSANT[self.en_passant & 7]
+        return h
+
+    @property
+    def en_passant_square(self):
+        """The (row, col) a pawn can capture en passant on, like Board.en_passant_square"""
+        return divmod(self.en_passant, 8) if self.en_passant is not None else None
+
+    def _place(self, color, piece, sq):
+        bit = 1 << sq
+        self.pieces[color][piece] |= bit
+        self.occupancy[color] |= bit
+        self.mailbox[sq] = (color, piece)
+
+    def _remove(self, sq):
+        color, piece = self.mailbox[sq]
+        bit = 1 << sq
+        self.pieces[color][piece] &= ~bit
+        self.occupancy[color] &= ~bit
+        self.mailbox[sq] = None
+
+    def move_piece(self, from_row, from_col, to_row, to_col, promotion=None):
+        """Move a piece from one position to another"""
+        return self.make_move(from_row, from_col, to_row, to_col, promotion)
+
+    def make_move(self, from_row, from_col, to_row, to_col, promotion=None):
+        """Make a move and push an undo record so it can be taken back
+
+        A pawn reaching the last row is promoted to promotion (a PieceType),
+        or to a queen if none is given.
+        """
+        from_sq = from_row * 8 + from_col
+        to_sq = to_row * 8 + to_col
+        entry = self.mailbox[from_sq]
+        if entry is None:
+            return False
+        color, piece = entry
+
+        # Castling also moves the rook
+        rook_from = rook_to = None
+        if piece == KING and abs(to_col - from_col) == 2:
+            row_base = from_row * 8
+            if to_col == 6:
+                rook_from, rook_to = row_base + 7, row_base + 5
+            else:
+                rook_from, rook_to = row_base, row_base + 3
+
+        # En passant captures the pawn beside the moving pawn
+        captured_sq = to_sq
+        captured = self.mailbox[to_sq]
+        if piece == PAWN and from_col != to_col and captured is None:
+            captured_sq = from_row * 8 + to_col
+            captured = self.mailbox[captured_sq]
+
+        placed = piece
+        if piece == PAWN and to_row in (0, 7):
+            placed = promotion.value - 1 if promotion else QUEEN
+
+        # (from, to, captured (color, piece), captured square, unmoved mask,
+        #  rook from, rook to, hash, en passant square, promoted, halfmove clock)
+        self.undo_stack.append((from_sq, to_sq, captured, captured_sq, self.unmoved,
+                                rook_from, rook_to, self.zobrist_hash, self.en_passant, placed != piece,
+                                self.halfmove_clock))
+
+        keys = ZOBRIST_PIECES[color]
+        h = self.zobrist_hash ^ ZOBRIST_CASTLING[self.castling_rights()] ^ ZOBRIST_BLACK_TO_MOVE
+        if self.en_passant is not None:
+            h ^= ZOBRIST_EN_PASSANT[self.en_passant & 7]
+        h ^= keys[piece][from_sq] ^ keys[placed][to_sq]
+        if rook_from is not None:
+            self._remove(rook_from)
+            self._place(color, ROOK, rook_to)
+            self.unmoved &= ~(1 << rook_from)
+            h ^= keys[ROOK][rook_from] ^ keys[ROOK][rook_to]
+        if captured is not None:
+            self._remove(captured_sq)
+            h ^= ZOBRIST_PIECES[captured[0]][captured[1]][captured_sq]
+        self._remove(from_sq)
+        self._place(color, placed, to_sq)
+        self.unmoved &= ~((1 << from_sq) | (1 << to_sq))
+
+        if piece == PAWN and abs(to_sq - from_sq) == 16:
+            self.en_passant = (from_sq + to_sq) // 2
+            h ^= ZOBRIST_EN_PASSANT[from_col]
+        else:
+            self.en_passant = None
+        self.halfmove_clock = 0 if captured is not None or piece == PAWN else self.halfmove_clock + 1
+        if color == BLACK:
+            self.fullmove_number += 1
+        self.side_to_move = COLORS[1 - COLOR_INDEX[self.side_to_move]]
+        self.zobrist_hash = h ^ ZOBRIST_CASTLING[self.castling_rights()]
+        return True
+
+    def unmake_move(self):
+        """Take back the last move made with make_move"""
+        record = self.undo_stack.pop()
+        (from_sq, to_sq, captured, captured_sq, unmoved, rook_from, rook_to, zobrist_hash, en_passant, promoted,
+         halfmove_clock) = record
+        color, piece = self.mailbox[to_sq]
+        self._remove(to_sq)
+        self._place(color, PAWN if promoted else piece, from_sq)
+        if captured is not None:
+            self._place(captured[0], captured[1], captured_sq)
+        if rook_from is not None:
+            self._remove(rook_to)
+            self._place(color, ROOK, rook_from)
+        self.unmoved = unmoved
+        self.en_passant = en_passant
+        self.halfmove_clock = halfmove_clock
+        if color == BLACK:
+            self.fullmove_number -= 1
+        self.side_to_move = COLORS[1 - COLOR_INDEX[self.side_to_move]]
+        self.zobrist_hash = zobrist_hash
+        return record
+
+    def get_piece_at(self, row, col):
+        """Get piece at specific position"""
+        entry = self.mailbox[row * 8 + col]
+        if entry is None:
+            return None
+        piece = ChessPiece(COLORS[entry[0]], PIECE_TYPES[entry[1]], row, col)
+        piece.has_moved = not (self.unmoved >> (row * 8 + col)) & 1
+        return piece
+
+    def find_king(self, color):
+        """Find the king of a given color"""
+        kings = self.pieces[COLOR_INDEX[color]][KING]
+        if not kings:
+            return None
+        return divmod((kings & -kings).bit_length() - 1, 8)
+
+    def _target_squares(self, sq, color, piece):
+        """Pseudo-legal destination bitboard for a piece, without castling"""
+        own = self.occupancy[color]
+        occupied = own | self.occupancy[1 - color]
+        if piece == PAWN:
+            targets = PAWN_ATTACKS[color][sq] & self.occupancy[1 - color]
+            if self.en_passant is not None:
+                targets |= PAWN_ATTACKS[color][sq] & (1 << self.en_passant)
+            row = sq >> 3
+            if color == WHITE:
+                if row > 0 and not (occupied >> (sq - 8)) & 1:
+                    targets |= 1 << (sq - 8)
+                    if row == 6 and not (occupied >> (sq - 16)) & 1:
+                        targets |= 1 << (sq - 16)
+            else:
+                if row < 7 and not (occupied >> (sq + 8)) & 1:
+                    targets |= 1 << (sq + 8)
+                    if row == 1 and not (occupied >> (sq + 16)) & 1:
+                        targets |= 1 << (sq + 16)
+            return targets
+        if piece == KNIGHT:
+            return KNIGHT_ATTACKS[sq] & ~own
+        if piece == KING:
+            return KING_ATTACKS[sq] & ~own
+        if piece == ROOK:
+            return slider_attacks(sq, occupied, ROOK_RAYS) & ~own
+        if piece == BISHOP:
+            return slider_attacks(sq, occupied, BISHOP_RAYS) & ~own
+        return (slider_attacks(sq, occupied, ROOK_RAYS) | slider_attacks(sq, occupied, BISHOP_RAYS)) & ~own
+
+    def _castling_targets(self, sq):
+        """Castling destinations for an unmoved king on the e-file"""
+        targets = 0
+        if not (self.unmoved >> sq) & 1 or sq & 7 != 4:
+            return targets
+        occupied = self.occupancy[WHITE] | self.occupancy[BLACK]
+        row_base = sq - 4
+        # Kingside: rook on h-file, f and g empty
+        rook = self.mailbox[row_base + 7]
+        if rook and rook[1] == ROOK and (self.unmoved >> (row_base + 7)) & 1:
+            if not occupied & (0b01100000 << row_base):
+                targets |= 1 << (row_base + 6)
+        # Queenside: rook on a-file, b, c and d empty
+        rook = self.mailbox[row_base]
+        if rook and rook[1] == ROOK and (self.unmoved >> row_base) & 1:
+            if not occupied & (0b00001110 << row_base):
+                targets |= 1 << (row_base + 2)
+        return targets
+
+    def get_possible_moves(self, row, col):
+        """Get pseudo-legal moves for the piece at a position"""
+        sq = row * 8 + col
+        entry = self.mailbox[sq]
+        if entry is None:
+            return []
+        color, piece = entry
+        targets = self._target_squares(sq, color, piece)
+        if piece == KING:
+            targets |= self._castling_targets(sq)
+        return [divmod(to_sq, 8) for to_sq in iter_squares(targets)]
+
+    def generate_moves(self, color):
+        """Get all pseudo-legal (from_sq, to_sq) moves for a color"""
+        color = COLOR_INDEX[color]
+        moves = []
+        for sq in iter_squares(self.occupancy[color]):
+            piece = self.mailbox[sq][1]
+            targets = self._target_squares(sq, color, piece)
+            if piece == KING:
+                targets |= self._castling_targets(sq)
+            for to_sq in iter_squares(targets):
+                moves.append((sq, to_sq))
+        return moves
+
+    def get_checks_and_pins(self, color):
+        """Find the checks against a color's king and which of its pieces are pinned
+
+        Returns (checkers, pins). checkers holds, for each checking piece, a
+        bitboard of the squares that capture or block it. pins maps the
+        square of each pinned piece to a bitboard of the squares it may
+        still move to along the pin.
+        """
+        us = COLOR_INDEX[color]
+        checkers = []
+        pins = {}
+        kings = self.pieces[us][KING]
+        if not kings:
+            return checkers, pins
+        king_sq = (kings & -kings).bit_length() - 1
+        enemy = self.pieces[1 - us]
+        occupied = self.occupancy[WHITE] | self.occupancy[BLACK]
+
+        for rays, sliders in ((ROOK_RAYS, enemy[ROOK] | enemy[QUEEN]), (BISHOP_RAYS, enemy[BISHOP] | enemy[QUEEN])):
+            if not sliders:
+                continue
+            for table, positive in rays:
+                ray = table[king_sq]
+                blockers = ray & occupied
+                if not blockers:
+                    continue
+                first = (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+                if (sliders >> first) & 1:
+                    checkers.append(ray ^ table[first])
+                elif (self.occupancy[us] >> first) & 1:
+                    # Our piece is pinned if the next piece behind it is an enemy slider
+                    blockers = table[first] & occupied
+                    if blockers:
+                        second = (blockers & -blockers).bit_length() - 1 if positive else blockers.bit_length() - 1
+                        if (sliders >> second) & 1:
+                            pins[first] = ray ^ table[second]
+
+        leapers = (KNIGHT_ATTACKS[king_sq] & enemy[KNIGHT]) | (PAWN_ATTACKS[us][king_sq] & enemy[PAWN])
+        for sq in iter_squares(leapers):
+            checkers.append(1 << sq)
+        return checkers, pins
+
+    def generate_legal_moves(self, color, from_square=None):
+        """Yield legal moves of a color as (from_row, from_col, to_row, to_col)
+
+        Checks and pins are found once per call, so moves are filtered
+        with bitmasks instead of being tried on the board.
+        """
+        for code in self.iter_move_codes(color, from_square):
+            from_sq, to_sq = code & 63, code >> 6 & 63
+            if code >> 12:
+                yield (from_sq >> 3, from_sq & 7, to_sq >> 3, to_sq & 7, MOVE_PROMOTIONS[code >> 12])
+            else:
+                yield (from_sq >> 3, from_sq & 7, to_sq >> 3, to_sq & 7)
+
+    def generate_move_codes(self, color, buffer):
+        """Write the legal moves of a color into buffer as move codes and return how many there are"""
+        count = 0
+        for code in self.iter_move_codes(color):
+            buffer[count] = code
+            count += 1
+        return count
+
+    def make_move_code(self, code):
+        """Make a move given as a move code, see chess_app.pack_move"""
+        from_sq, to_sq = code & 63, code >> 6 & 63
+        return self.make_move(from_sq >> 3, from_sq & 7, to_sq >> 3, to_sq & 7, MOVE_PROMOTIONS[code >> 12])
+
+    def iter_move_codes(self, color, from_square=None):
+        """Yield the legal moves of a color as move codes, see generate_legal_moves"""
+        us = COLOR_INDEX[color]
+        them = 1 - us
+        checkers, pins = self.get_checks_and_pins(color)
+        evasions = checkers[0] if len(checkers) == 1 else FULL
+
+        if from_square:
+            own = self.occupancy[us] & (1 << (from_square[0] * 8 + from_square[1]))
+        else:
+            own = self.occupancy[us]
+        for from_sq in iter_squares(own):
+            piece = self.mailbox[from_sq][1]
+            targets = self._target_squares(from_sq, us, piece)
+
+            if piece == KING:
+                # Lift the king so sliders checking it also cover the squares behind it
+                occupied = (self.occupancy[WHITE] | self.occupancy[BLACK]) & ~(1 << from_sq)
+                enemy = self.pieces[them]
+                for to_sq in iter_squares(targets):
+                    if not self._is_attacked(to_sq, them, occupied, enemy):
+                        yield from_sq | to_sq << 6
+                if not checkers:
+                    for to_sq in iter_squares(self._castling_targets(from_sq)):
+                        step = 1 if to_sq > from_sq else -1
+                        if not self._is_attacked(from_sq + step, them, occupied, enemy) and \
+                                not self._is_attacked(to_sq, them, occupied, enemy):
+                            yield from_sq | to_sq << 6
+                continue
+
+            # Only the king can answer a double check
+            if len(checkers) > 1:
+                continue
+            if piece == PAWN and self.en_passant is not None and (targets >> self.en_passant) & 1:
+                # En passant takes two pawns off one line at once, which the
+                # pin scan doesn't cover, so test it separately
+                targets ^= 1 << self.en_passant
+                if not self.would_be_in_check_after_move(from_sq >> 3, from_sq & 7, self.en_passant >> 3,
+                                                         self.en_passant & 7, color):
+                    yield from_sq | self.en_passant << 6
+            targets &= evasions & pins.get(from_sq, FULL)
+            for to_sq in iter_squares(targets):
+                if piece == PAWN and to_sq >> 3 in (0, 7):
+                    for flag in PROMOTION_FLAGS:
+                        yield from_sq | to_sq << 6 | flag
+                else:
+                    yield from_sq | to_sq << 6
+
+    def _is_attacked(self, sq, by, occupied, attackers):
+        """Check if a square is attacked by the given piece bitboards"""
+        if KNIGHT_ATTACKS[sq] & attackers[KNIGHT]:
+            return True
+        if KING_ATTACKS[sq] & attackers[KING]:
+            return True
+        if PAWN_ATTACKS[1 - by][sq] & attackers[PAWN]:
+            return True
+        rooks = attackers[ROOK] | attackers[QUEEN]
+        if rooks and slider_attacks(sq, occupied, ROOK_RAYS) & rooks:
+            return True
+        bishops = attackers[BISHOP] | attackers[QUEEN]
+        if bishops and slider_attacks(sq, occupied, BISHOP_RAYS) & bishops:
+            return True
+        return False
+
+    def is_square_attacked(self, row, col, by_color):
+        """Check if a square is attacked by pieces of given color"""
+        by = COLOR_INDEX[by_color]
+        occupied = self.occupancy[WHITE] | self.occupancy[BLACK]
+        return self._is_attacked(row * 8 + col, by, occupied, self.pieces[by])
+
+    def threatened_squares(self, color):
+        """Get the squares of color's pieces that the other side attacks"""
+        us = COLOR_INDEX[color]
+        occupied = self.occupancy[WHITE] | self.occupancy[BLACK]
+        enemy = self.pieces[1 - us]
+        return {sq for sq in iter_squares(self.occupancy[us]) if self._is_attacked(sq, 1 - us, occupied, enemy)}
+
+    def is_king_in_check(self, color):
+        """Check if king of given color is in check"""
+        king_pos = self.find_king(color)
+        if not king_pos:
+            return False
+        enemy_color = PieceColor.BLACK if color == PieceColor.WHITE else PieceColor.WHITE
+        return self.is_square_attacked(king_pos[0], king_pos[1], enemy_color)
+
+    def has_legal_moves(self, color):
+        """Check if a player has any legal moves"""
+        for _ in self.iter_move_codes(color):
+            return True
+        return False
+
+    def is_checkmate(self, color):
+        """Check if a player is in checkmate"""
+        return self.is_king_in_check(color) and not self.has_legal_moves(color)
+
+    def is_stalemate(self, color):
+        """Check if a player is in stalemate (not in check but no legal moves)"""
+        return not self.is_king_in_check(color) and not self.has_legal_moves(color)
+
+    def is_castling_move(self, from_row, from_col, to_row, to_col):
+        """Check if a move is a castling move"""
+        entry = self.mailbox[from_row * 8 + from_col]
+        return entry is not None and entry[1] == KING and abs(to_col - from_col) == 2
+
+    def is_valid_castling(self, from_row, from_col, to_row, to_col, color):
+        """Validate castling move (king can't castle out of, through or into check)"""
+        if not self.is_castling_move(from_row, from_col, to_row, to_col):
+            return True
+        check_cols = [from_col, 5, 6] if to_col == 6 else [from_col, 3, 2]
+        enemy_color = PieceColor.BLACK if color == PieceColor.WHITE else PieceColor.WHITE
+        for col in check_cols:
+            if self.is_square_attacked(from_row, col, enemy_color):
+                return False
+        return True
+
+    def would_be_in_check_after_move(self, from_row, from_col, to_row, to_col, color):
+        """Check if a move would leave the king in check, without touching the board"""
+        us = COLOR_INDEX[color]
+        them = 1 - us
+        from_sq = from_row * 8 + from_col
+        to_sq = to_row * 8 + to_col
+        piece = self.mailbox[from_sq][1]
+
+        occupied = ((self.occupancy[WHITE] | self.occupancy[BLACK]) & ~(1 << from_sq)) | (1 << to_sq)
+        if piece == KING and abs(to_col - from_col) == 2:
+            row_base = from_row * 8
+            if to_col == 6:
+                occupied ^= (1 << (row_base + 7)) | (1 << (row_base + 5))
+            else:
+                occupied ^= (1 << row_base) | (1 << (row_base + 3))
+
+        attackers = self.pieces[them]
+        captured_sq = to_sq
+        captured = self.mailbox[to_sq]
+        if piece == PAWN and from_col != to_col and captured is None:
+            # En passant: the captured pawn is beside the moving pawn
+            captured_sq = from_row * 8 + to_col
+            captured = self.mailbox[captured_sq]
+            occupied &= ~(1 << captured_sq)
+        if captured is not None:
+            attackers = list(attackers)
+            attackers[captured[1]] &= ~(1 << captured_sq)
+
+        if piece == KING:
+            king_sq = to_sq
+        else:
+            kings = self.pieces[us][KING]
+            if not kings:
+                return False
+            king_sq = (kings & -kings).bit_length() - 1
+        return self._is_attacked(king_sq, them, occupied, attackers)
+
+
+def _sample_positions(count, seed=2024, max_plies=60):
+    """Play seeded random games and return (Board, BitBoard, side to move) samples"""
+    rng = random.Random(seed)
+    samples = []
+    while len(samples) < count:
+        board, bitboard = Board(), BitBoard()
+        color = PieceColor.WHITE
+        for _ in range(rng.randrange(max_plies)):
+            moves = list(board.generate_legal_moves(color))
+            if not moves:
+                break
+            move = rng.choice(moves)
+            board.move_piece(*move)
+            bitboard.move_piece(*move)
+            color = PieceColor.BLACK if color == PieceColor.WHITE else PieceColor.WHITE
+        samples.append((board, bitboard, color))
+    return samples
+
+
+def benchmark(positions=50, repeat=5):
+    """Compare legal move generation throughput of Board and BitBoard"""
+    samples = _sample_positions(positions)
+
+    mismatches = 0
+    for board, bitboard, color in samples:
+        if set(board.generate_legal_moves(color)) != set(bitboard.generate_legal_moves(color)):
+            mismatches += 1
+
+    results = {}
+    for name, generate in (("Board", lambda s: list(s[0].generate_legal_moves(s[2]))),
+                           ("BitBoard", lambda s: list(s[1].generate_legal_moves(s[2])))):
+        moves = 0
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for sample in samples:
+                moves += len(generate(sample))
+        elapsed = time.perf_counter() - start
+        results[name] = moves / elapsed
+        print(f"{name:>8}: {moves} legal moves in {elapsed:.3f}s ({moves / elapsed:,.0f} moves/s)")
+
+    print(f"Speedup: {results['BitBoard'] / results['Board']:.1f}x over {positions} positions")
+    if mismatches:
+        print(f"Warning: move lists differ in {mismatches} positions")
+    return results
+
+
+if __name__ == "__main__":
+    benchmark(*(int(arg) for arg in sys.argv[1:3]))
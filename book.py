@@ -0,0 +1,203 @@
+"""Opening books of fixed-size entries, read through mmap.
+
+A book is a sorted array of 16-byte big-endian entries:
+
+    key (8 bytes)  move (2 bytes)  weight (2 bytes)  learn (4 bytes)
+
+The key is Board.zobrist_hash. Moves are packed to file, to rank, from
+file, from rank, promotion, with castling written as the king taking its
+own rook. The entry and move layout borrow Polyglot's, but the keys are
+not Polyglot keys, so these books aren't Polyglot books: Polyglot .bin
+files won't match any position here, and other tools can't read these.
+Build books with this module.
+
+OpeningBook maps the file read-only and binary searches it, so lookups cost
+microseconds, nothing is loaded up front, and every process using the same
+book shares its pages.
+
+    python book.py build games.pgn [more.pgn ...] -o book.bin [--plies 20]
+    python book.py probe book.bin [--fen FEN]
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+
+from chess_app import START_FEN, Board, PieceColor, PieceType, move_to_uci
+from pgn import read_games, san_to_move
+
+ENTRY = struct.Struct(">QHHI")
+KEY = struct.Struct(">Q")
+
+# Promotion codes of a packed move
+PROMOTION_CODES = {None: 0, PieceType.KNIGHT: 1, PieceType.BISHOP: 2, PieceType.ROOK: 3, PieceType.QUEEN: 4}
+PROMOTION_PIECES = {code: piece_type for piece_type, code in PROMOTION_CODES.items()}
+
+
+def encode_move(board, move):
+    """Pack a move tuple into a book move"""
+    from_row, from_col, to_row, to_col = move[:4]
+    piece = board.get_piece_at(from_row, from_col)
+    if piece.piece_type == PieceType.KING and abs(to_col - from_col) == 2:
+        to_col = 7 if to_col == 6 else 0
+    promotion = move[4] if len(move) > 4 else None
+    return (PROMOTION_CODES[promotion] << 12 | (7 - from_row) << 9 | from_col << 6
+            | (7 - to_row) << 3 | to_col)
+
+
+def decode_move(board, code):
+    """Unpack a book move into the matching legal move tuple, or None if it isn't legal"""
+    to_col, to_row = code & 7, 7 - (code >> 3 & 7)
+    from_col, from_row = code >> 6 & 7, 7 - (code >> 9 & 7)
+    promotion = PROMOTION_PIECES.get(code >> 12 & 7)
+    piece = board.get_piece_at(from_row, from_col)
+    if piece and piece.piece_type == PieceType.KING and from_col == 4 and to_row == from_row \
+            and to_col in (0, 7):
+        to_col = 6 if to_col == 7 else 2
+    move = (from_row, from_col, to_row, to_col, promotion) if promotion else (from_row, from_col, to_row, to_col)
+    for legal in board.generate_legal_moves(board.side_to_move, (from_row, from_col)):
+        if legal == move:
+            return legal
+    return None
+
+
+class OpeningBook:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self.entries = size // ENTRY.size
+        # An empty file can't be mapped
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def close(self):
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _key_at(self, index):
+        return KEY.unpack_from(self._map, index * ENTRY.size)[0]
+
+    def lookup(self, key):
+        """List the (book move, weight) entries stored for a position key"""
+        low, high = 0, self.entries
+        while low < high:
+            mid = (low + high) // 2
+            if self._key_at(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        found = []
+        while low < self.entries:
+            entry_key, move, weight, _ = ENTRY.unpack_from(self._map, low * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((move, weight))
+            low += 1
+        return found
+
+    def moves(self, board):
+        """List (move, weight) for the side to move, skipping entries that aren't legal here"""
+        moves = []
+        for code, weight in self.lookup(board.zobrist_hash):
+            move = decode_move(board, code)
+            if move is not None:
+                moves.append((move, weight))
+        return moves
+
+    def choose(self, board, rng=random):
+        """Pick a book move with probability proportional to its weight, or None when out of book"""
+        moves = [(move, weight) for move, weight in self.moves(board) if weight > 0]
+        if not moves:
+            return None
+        return rng.choices([move for move, _ in moves], weights=[weight for _, weight in moves])[0]
+
+
+def build_book(pgn_paths, out_path, max_plies=20, min_count=1):
+    """Write a book of the moves played in the first max_plies of PGN games
+
+    A move scores 1 for every game it was played in, plus 2 more if the
+    side that played it won and 1 more for a draw. Weights are scaled to
+    fit 16 bits. Moves played fewer than min_count times are left out.
+    Returns the number of entries written.
+    """
+    stats = {}
+    for path in pgn_paths:
+        with open(path) as f:
+            for game in read_games(f):
+                if "FEN" in game.headers:
+                    continue
+                board = Board()
+                for san in game.moves[:max_plies]:
+                    try:
+                        move = san_to_move(board, san)
+                    except ValueError:
+                        break
+                    points = {"1-0": 2, "0-1": 0, "1/2-1/2": 1}.get(game.result, 0)
+                    if board.side_to_move == PieceColor.BLACK and game.result in ("1-0", "0-1"):
+                        points = 2 - points
+                    points += 1
+                    key = (board.zobrist_hash, encode_move(board, move))
+                    count, score = stats.get(key, (0, 0))
+                    stats[key] = (count + 1, score + points)
+                    board.make_move(*move)
+
+    entries = [(key, move, score) for (key, move), (count, score) in stats.items() if count >= min_count]
+    top = max((score for _, _, score in entries), default=0)
+    scale = max(1, -(-top // 0xFFFF))
+    # Sorted by key for the binary search, best moves first within a position
+    entries.sort(key=lambda entry: (entry[0], -entry[2]))
+    with open(out_path, "wb") as f:
+        for key, move, score in entries:
+            f.write(ENTRY.pack(key, move, max(1, score // scale), 0))
+    return len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or probe an opening book")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="build a book from PGN files")
+    build.add_argument("pgn", nargs="+")
+    build.add_argument("-o", "--output", required=True)
+    build.add_argument("--plies", type=int, default=20, help="book depth in plies (default 20)")
+    build.add_argument("--min-count", type=int, default=1, help="leave out moves played fewer times")
+    probe = sub.add_parser("probe", help="list the book moves of a position and time lookups")
+    probe.add_argument("book")
+    probe.add_argument("--fen", default=START_FEN)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        start = time.perf_counter()
+        count = build_book(args.pgn, args.output, args.plies, args.min_count)
+        print(f"{count} entries written to {args.output} in {time.perf_counter() - start:.2f}s")
+        return 0
+
+    board = Board()
+    board.load_fen(args.fen)
+    with OpeningBook(args.book) as book:
+        moves = book.moves(board)
+        total = sum(weight for _, weight in moves) or 1
+        for move, weight in sorted(moves, key=lambda entry: -entry[1]):
+            print(f"{move_to_uci(move):6} weight {weight:5} ({weight / total:.0%})")
+        if not moves:
+            print("not in book")
+        repeat = 10000
+        start = time.perf_counter()
+        for _ in range(repeat):
+            book.lookup(board.zobrist_hash)
+        elapsed = time.perf_counter() - start
+        print(f"{book.entries} entries; lookup {elapsed / repeat * 1e6:.1f}us")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
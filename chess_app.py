@@ -1,10 +1,14 @@
-import pygame
+import random
+import struct
 import sys
+import time
+from array import array
+from collections import namedtuple
 from enum import Enum
-import numpy as np
 
-pygame.init()
-pygame.mixer.init()
+# pygame and numpy are only imported by init_display(), so the rules
+# (PieceType, ChessPiece, Board, ChessGame) load without a display or sound card
+pygame = None
 
 # Screen dimensions
 WIDTH, HEIGHT = 800, 900
@@ -20,30 +24,74 @@ GREEN = (0, 255, 0)
 YELLOW = (255, 255, 0)
 RED = (255, 0, 0)
 BLUE = (0, 100, 255)
+ORANGE = (255, 140, 0)
 DARK_BLUE = (0, 50, 150)
 
-# Create screen and status bar
-screen = pygame.display.set_mode((WIDTH, HEIGHT + STATUS_BAR_HEIGHT))
-pygame.display.set_caption("Chess Game")
-clock = pygame.time.Clock()
-FPS = 60
+# Created by init_display()
+screen = None
+sounds = {}
+# Event type posted by post_user_event()
+USER_EVENT = None
+# How long the engine thinks per move, and how often its progress is redrawn
+ENGINE_THINK_MS = 2000
+PROGRESS_TICK_MS = 100
+# Events that can change what is on screen; everything else (mouse motion,
+# key releases, ...) is dropped so it never wakes the main loop
+WAKE_EVENTS = ("QUIT", "MOUSEBUTTONDOWN", "KEYDOWN", "VIDEOEXPOSE", "WINDOWEXPOSED")
+
+def init_display():
+    """Initialize pygame, open the window and create the sound bank"""
+    global pygame, screen, USER_EVENT
+    import pygame
+    
+    pygame.init()
+    screen = pygame.display.set_mode((WIDTH, HEIGHT + STATUS_BAR_HEIGHT))
+    pygame.display.set_caption("Chess Game")
+    USER_EVENT = pygame.event.custom_type()
+    pygame.event.set_blocked(None)
+    pygame.event.set_allowed([getattr(pygame, name) for name in WAKE_EVENTS] + [USER_EVENT])
+    
+    # Play without sound if there is no audio device
+    try:
+        pygame.mixer.init()
+    except pygame.error:
+        return
+    sounds["capture"] = create_beep_sound(frequency=800, duration=80)
+    sounds["check"] = create_beep_sound(frequency=1000, duration=150)
+    sounds["checkmate"] = create_beep_sound(frequency=600, duration=200)
+    sounds["move"] = create_beep_sound(frequency=500, duration=50)
+
+def post_user_event(kind, **data):
+    """Wake the main loop with a USER_EVENT carrying kind and data
+
+    Safe to call from any thread, so background work (an engine search, a
+    network opponent) can hand its result to the UI. Does nothing before
+    init_display().
+    """
+    if USER_EVENT is not None:
+        pygame.event.post(pygame.event.Event(USER_EVENT, kind=kind, **data))
+
+def play_sound(name):
+    """Play a sound from the sound bank, if there is one"""
+    sound = sounds.get(name)
+    if sound:
+        sound.play()
 
 # Audio helper function
 def create_beep_sound(frequency=440, duration=100):
     """Create a simple beep sound"""
-    sample_rate = 22050
+    import numpy as np
+    
+    # Match the mixer's format, which is usually stereo
+    sample_rate, _, channels = pygame.mixer.get_init()
     frames = int(duration * sample_rate / 1000)
     arr = np.sin(2 * np.pi * frequency * np.arange(frames) / sample_rate)
     arr = (arr * 32767).astype(np.int16)
+    if channels > 1:
+        arr = np.ascontiguousarray(np.repeat(arr[:, None], channels, axis=1))
     sound = pygame.sndarray.make_sound(arr)
     return sound
 
-# Create sound effects
-capture_sound = create_beep_sound(frequency=800, duration=80)
-check_sound = create_beep_sound(frequency=1000, duration=150)
-checkmate_sound = create_beep_sound(frequency=600, duration=200)
-move_sound = create_beep_sound(frequency=500, duration=50)
-
 # Piece types
 class PieceType(Enum):
     PAWN = 1
@@ -53,12 +101,85 @@ class PieceType(Enum):
     QUEEN = 5
     KING = 6
 
+# Letters the GUI draws for each piece type
+PIECE_SYMBOLS = {
+    PieceType.PAWN: 'P',
+    PieceType.ROOK: 'R',
+    PieceType.KNIGHT: 'K',
+    PieceType.BISHOP: 'B',
+    PieceType.QUEEN: 'Q',
+    PieceType.KING: 'K',
+}
+
 # Piece colors
 class PieceColor(Enum):
     WHITE = 1
     BLACK = 2
 
+# Movement directions as (row, col) steps
+ROOK_DIRECTIONS = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+BISHOP_DIRECTIONS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+KNIGHT_OFFSETS = [(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)]
+KING_OFFSETS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+
+def _step_squares(offsets):
+    """For every square (row * 8 + col), the squares one step of offsets away"""
+    return [[(row + dr) * 8 + col + dc for dr, dc in offsets if 0 <= row + dr < 8 and 0 <= col + dc < 8]
+            for row in range(8) for col in range(8)]
+
+def _ray_squares(directions):
+    """For every square, the squares along each direction, nearest first"""
+    rays = []
+    for row in range(8):
+        for col in range(8):
+            square_rays = []
+            for dr, dc in directions:
+                ray = []
+                r, c = row + dr, col + dc
+                while 0 <= r < 8 and 0 <= c < 8:
+                    ray.append(r * 8 + c)
+                    r, c = r + dr, c + dc
+                if ray:
+                    square_rays.append(ray)
+            rays.append(square_rays)
+    return rays
+
+# Attack tables indexed by square, used for the attack maps (see Board.attack_counts)
+KNIGHT_SQUARES = _step_squares(KNIGHT_OFFSETS)
+KING_SQUARES = _step_squares(KING_OFFSETS)
+ROOK_RAYS = _ray_squares(ROOK_DIRECTIONS)
+BISHOP_RAYS = _ray_squares(BISHOP_DIRECTIONS)
+QUEEN_RAYS = [rook + bishop for rook, bishop in zip(ROOK_RAYS, BISHOP_RAYS)]
+# Squares a pawn attacks, indexed [color.value - 1][square]
+PAWN_ATTACK_SQUARES = [_step_squares([(-1, -1), (-1, 1)]), _step_squares([(1, -1), (1, 1)])]
+
+def _axis_rays():
+    """For every square, (ray one way, ray the other way, slider moving along them) for each of the 4 lines"""
+    axes = [((0, 1), (0, -1), PieceType.ROOK), ((1, 0), (-1, 0), PieceType.ROOK),
+            ((1, 1), (-1, -1), PieceType.BISHOP), ((1, -1), (-1, 1), PieceType.BISHOP)]
+    rays = []
+    for row in range(8):
+        for col in range(8):
+            square_axes = []
+            for (dr_a, dc_a), (dr_b, dc_b), slider in axes:
+                lines = []
+                for dr, dc in ((dr_a, dc_a), (dr_b, dc_b)):
+                    line = []
+                    r, c = row + dr, col + dc
+                    while 0 <= r < 8 and 0 <= c < 8:
+                        line.append(r * 8 + c)
+                        r, c = r + dr, c + dc
+                    lines.append(line)
+                square_axes.append((lines[0], lines[1], slider))
+            rays.append(square_axes)
+    return rays
+
+AXIS_RAYS = _axis_rays()
+
 class ChessPiece:
+    # Boards create a piece per square and per promotion; slots keep each one small
+    __slots__ = ("color", "piece_type", "row", "col", "has_moved", "symbol")
+    
     def __init__(self, color, piece_type, row, col):
         self.color = color
         self.piece_type = piece_type
@@ -68,152 +189,252 @@ class ChessPiece:
         self.symbol = self._get_symbol()
     
     def _get_symbol(self):
-        symbols = {
-            PieceType.PAWN: 'P',
-            PieceType.ROOK: 'R',
-            PieceType.KNIGHT: 'K',
-            PieceType.BISHOP: 'B',
-            PieceType.QUEEN: 'Q',
-            PieceType.KING: 'K',
-        }
-        return symbols[self.piece_type]
+        return PIECE_SYMBOLS[self.piece_type]
     
-    def get_possible_moves(self, board):
-        """Returns list of possible moves for this piece"""
-        moves = []
-        
-        if self.piece_type == PieceType.PAWN:
-            moves = self._get_pawn_moves(board)
-        elif self.piece_type == PieceType.ROOK:
-            moves = self._get_rook_moves(board)
-        elif self.piece_type == PieceType.KNIGHT:
-            moves = self._get_knight_moves(board)
-        elif self.piece_type == PieceType.BISHOP:
-            moves = self._get_bishop_moves(board)
-        elif self.piece_type == PieceType.QUEEN:
-            moves = self._get_queen_moves(board)
-        elif self.piece_type == PieceType.KING:
-            moves = self._get_king_moves(board)
-        
-        return moves
+    def get_possible_moves(self, board, en_passant=None):
+        """Returns list of possible moves for this piece as (row, col)
+
+        en_passant is the (row, col) a pawn may capture en passant on, if any.
+        """
+        return [(sq >> 3, sq & 7) for sq in self.iter_targets(board, en_passant)]
     
-    def _get_pawn_moves(self, board):
-        moves = []
+    def iter_targets(self, board, en_passant=None):
+        """Yield the squares (row * 8 + col) this piece can move to, ignoring checks
+
+        The _get_*_moves helpers are generators, so nothing is built up
+        for callers that filter the squares or stop early.
+        """
+        piece_type = self.piece_type
+        if piece_type == PieceType.PAWN:
+            return self._get_pawn_moves(board, en_passant)
+        if piece_type == PieceType.ROOK:
+            return self._get_slider_moves(board, ROOK_DIRECTIONS)
+        if piece_type == PieceType.KNIGHT:
+            return self._get_step_moves(board, KNIGHT_OFFSETS)
+        if piece_type == PieceType.BISHOP:
+            return self._get_slider_moves(board, BISHOP_DIRECTIONS)
+        if piece_type == PieceType.QUEEN:
+            return self._get_slider_moves(board, KING_OFFSETS)
+        return self._get_king_moves(board)
+    
+    def iter_attacks(self, board):
+        """Yield the squares (row * 8 + col) this piece attacks
+
+        Unlike iter_targets this includes squares held by its own side,
+        which it defends, and only the diagonal captures of pawns.
+        """
+        piece_type = self.piece_type
+        sq = self.row * 8 + self.col
+        if piece_type == PieceType.PAWN:
+            row = self.row - 1 if self.color == PieceColor.WHITE else self.row + 1
+            if 0 <= row < 8:
+                if self.col > 0:
+                    yield row * 8 + self.col - 1
+                if self.col < 7:
+                    yield row * 8 + self.col + 1
+        elif piece_type == PieceType.KNIGHT:
+            yield from KNIGHT_SQUARES[sq]
+        elif piece_type == PieceType.KING:
+            yield from KING_SQUARES[sq]
+        else:
+            rays = ROOK_RAYS if piece_type == PieceType.ROOK else BISHOP_RAYS if piece_type == PieceType.BISHOP \
+                else QUEEN_RAYS
+            for ray in rays[sq]:
+                for target in ray:
+                    yield target
+                    if board[target >> 3][target & 7]:
+                        break
+    
+    def _get_pawn_moves(self, board, en_passant=None):
         direction = -1 if self.color == PieceColor.WHITE else 1
         start_row = 6 if self.color == PieceColor.WHITE else 1
         
-        # Move forward
         next_row = self.row + direction
-        if 0 <= next_row < 8 and board[next_row][self.col] is None:
-            moves.append((next_row, self.col))
+        if not 0 <= next_row < 8:
+            return
+        
+        # Move forward
+        if board[next_row][self.col] is None:
+            yield next_row * 8 + self.col
             
             # Double move from start
             if self.row == start_row:
                 next_next_row = self.row + 2 * direction
                 if board[next_next_row][self.col] is None:
-                    moves.append((next_next_row, self.col))
+                    yield next_next_row * 8 + self.col
         
         # Captures
-        for dc in [-1, 1]:
+        for dc in (-1, 1):
             next_col = self.col + dc
-            next_row = self.row + direction
-            if 0 <= next_row < 8 and 0 <= next_col < 8:
+            if 0 <= next_col < 8:
                 target = board[next_row][next_col]
-                if target and target.color != self.color:
-                    moves.append((next_row, next_col))
-        
-        return moves
+                if target:
+                    if target.color != self.color:
+                        yield next_row * 8 + next_col
+                elif en_passant and en_passant[0] == next_row and en_passant[1] == next_col:
+                    yield next_row * 8 + next_col
     
-    def _get_rook_moves(self, board):
-        moves = []
-        directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+    def _get_slider_moves(self, board, directions):
         for dr, dc in directions:
-            for i in range(1, 8):
-                new_row, new_col = self.row + dr * i, self.col + dc * i
-                if not (0 <= new_row < 8 and 0 <= new_col < 8):
-                    break
+            new_row, new_col = self.row + dr, self.col + dc
+            while 0 <= new_row < 8 and 0 <= new_col < 8:
                 target = board[new_row][new_col]
                 if target is None:
-                    moves.append((new_row, new_col))
+                    yield new_row * 8 + new_col
                 else:
                     if target.color != self.color:
-                        moves.append((new_row, new_col))
+                        yield new_row * 8 + new_col
                     break
-        return moves
+                new_row += dr
+                new_col += dc
     
-    def _get_knight_moves(self, board):
-        moves = []
-        knight_moves = [(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)]
-        for dr, dc in knight_moves:
+    def _get_step_moves(self, board, offsets):
+        for dr, dc in offsets:
             new_row, new_col = self.row + dr, self.col + dc
             if 0 <= new_row < 8 and 0 <= new_col < 8:
                 target = board[new_row][new_col]
                 if target is None or target.color != self.color:
-                    moves.append((new_row, new_col))
-        return moves
-    
-    def _get_bishop_moves(self, board):
-        moves = []
-        directions = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
-        for dr, dc in directions:
-            for i in range(1, 8):
-                new_row, new_col = self.row + dr * i, self.col + dc * i
-                if not (0 <= new_row < 8 and 0 <= new_col < 8):
-                    break
-                target = board[new_row][new_col]
-                if target is None:
-                    moves.append((new_row, new_col))
-                else:
-                    if target.color != self.color:
-                        moves.append((new_row, new_col))
-                    break
-        return moves
-    
-    def _get_queen_moves(self, board):
-        # Queen moves like both rook and bishop
-        return self._get_rook_moves(board) + self._get_bishop_moves(board)
+                    yield new_row * 8 + new_col
     
     def _get_king_moves(self, board):
-        moves = []
-        king_moves = [(0, 1), (0, -1), (1, 0), (-1, 0), (1, 1), (1, -1), (-1, 1), (-1, -1)]
-        for dr, dc in king_moves:
-            new_row, new_col = self.row + dr, self.col + dc
-            if 0 <= new_row < 8 and 0 <= new_col < 8:
-                target = board[new_row][new_col]
-                if target is None or target.color != self.color:
-                    moves.append((new_row, new_col))
+        yield from self._get_step_moves(board, KING_OFFSETS)
         
         # Castling moves
         if not self.has_moved:
-            castling_moves = self._get_castling_moves(board)
-            moves.extend(castling_moves)
-        
-        return moves
+            yield from self._get_castling_moves(board)
     
     def _get_castling_moves(self, board):
-        """Get castling moves for the king"""
-        moves = []
+        """Yield the castling targets of the king"""
+        if self.col != 4:  # King must be on e-file
+            return
+        row = board[self.row]
         
         # Kingside castling (O-O)
-        if self.col == 4:  # King must be on e-file
-            rook_col = 7
-            if board[self.row][rook_col] and board[self.row][rook_col].piece_type == PieceType.ROOK and not board[self.row][rook_col].has_moved:
-                # Check if path is clear
-                if board[self.row][5] is None and board[self.row][6] is None:
-                    moves.append((self.row, 6))  # King lands on g-file
-            
-            # Queenside castling (O-O-O)
-            rook_col = 0
-            if board[self.row][rook_col] and board[self.row][rook_col].piece_type == PieceType.ROOK and not board[self.row][rook_col].has_moved:
-                # Check if path is clear
-                if board[self.row][1] is None and board[self.row][2] is None and board[self.row][3] is None:
-                    moves.append((self.row, 2))  # King lands on c-file
+        rook = row[7]
+        if rook and rook.piece_type == PieceType.ROOK and not rook.has_moved:
+            # Check if path is clear
+            if row[5] is None and row[6] is None:
+                yield self.row * 8 + 6  # King lands on g-file
         
-        return moves
+        # Queenside castling (O-O-O)
+        rook = row[0]
+        if rook and rook.piece_type == PieceType.ROOK and not rook.has_moved:
+            # Check if path is clear
+            if row[1] is None and row[2] is None and row[3] is None:
+                yield self.row * 8 + 2  # King lands on c-file
+
+# Zobrist keys, seeded so hashes are stable between runs and processes.
+# ZOBRIST_PIECES is indexed [color.value - 1][piece_type.value - 1][row * 8 + col],
+# ZOBRIST_CASTLING by a castling rights mask (see Board.castling_rights) and
+# ZOBRIST_EN_PASSANT by the column of the en passant square.
+_zobrist_rng = random.Random(0x5EED)
+ZOBRIST_PIECES = [[[_zobrist_rng.getrandbits(64) for _ in range(64)] for _ in range(6)] for _ in range(2)]
+ZOBRIST_BLACK_TO_MOVE = _zobrist_rng.getrandbits(64)
+ZOBRIST_CASTLING = [_zobrist_rng.getrandbits(64) for _ in range(16)]
+ZOBRIST_EN_PASSANT = [_zobrist_rng.getrandbits(64) for _ in range(8)]
+
+# Castling rights bits
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+
+# Pieces a pawn can promote to, best first
+PROMOTION_TYPES = [PieceType.QUEEN, PieceType.ROOK, PieceType.BISHOP, PieceType.KNIGHT]
+
+# Notation helpers. Row 0 is the 8th rank.
+# Fixed-size binary position encoding, see Board.to_bytes
+POSITION_FORMAT = struct.Struct(">Q16sBBBH")
+
+FILES = "abcdefgh"
+FEN_PIECE_TYPES = {
+    'p': PieceType.PAWN,
+    'n': PieceType.KNIGHT,
+    'b': PieceType.BISHOP,
+    'r': PieceType.ROOK,
+    'q': PieceType.QUEEN,
+    'k': PieceType.KING,
+}
+FEN_PIECE_LETTERS = {piece_type: letter for letter, piece_type in FEN_PIECE_TYPES.items()}
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+def square_name(row, col):
+    """Get the algebraic name of a square, e.g. (7, 4) -> 'e1'"""
+    return FILES[col] + str(8 - row)
+
+def parse_square(name):
+    """Get the (row, col) of an algebraic square name, e.g. 'e1' -> (7, 4)"""
+    if len(name) != 2 or name[0] not in FILES or name[1] not in "12345678":
+        raise ValueError(f"Invalid square: {name!r}")
+    return 8 - int(name[1]), FILES.index(name[0])
+
+def move_to_uci(move):
+    """Format a (from_row, from_col, to_row, to_col[, promotion]) move as e.g. 'e7e8q'"""
+    text = square_name(move[0], move[1]) + square_name(move[2], move[3])
+    if len(move) > 4 and move[4] is not None:
+        text += FEN_PIECE_LETTERS[move[4]]
+    return text
+
+def uci_to_move(text):
+    """Parse a move like 'e2e4' or 'e7e8q' into a move tuple"""
+    from_row, from_col = parse_square(text[0:2])
+    to_row, to_col = parse_square(text[2:4])
+    if len(text) == 5:
+        promotion = FEN_PIECE_TYPES.get(text[4])
+        if promotion not in PROMOTION_TYPES:
+            raise ValueError(f"Invalid promotion: {text!r}")
+        return (from_row, from_col, to_row, to_col, promotion)
+    if len(text) != 4:
+        raise ValueError(f"Invalid move: {text!r}")
+    return (from_row, from_col, to_row, to_col)
+
+# Moves packed into 16 bits: from square in bits 0-5, to square in bits
+# 6-11 (squares are row * 8 + col) and the promoted PieceType value in bits
+# 12-15, 0 if there is none. Board.generate_move_codes fills an array of
+# these, so generating a node's moves allocates no tuples.
+MAX_MOVES = 256
+MOVE_PROMOTIONS = [None] * 16
+for _piece_type in PROMOTION_TYPES:
+    MOVE_PROMOTIONS[_piece_type.value] = _piece_type
+PROMOTION_FLAGS = [piece_type.value << 12 for piece_type in PROMOTION_TYPES]
+
+def pack_move(move):
+    """Pack a move tuple into a 16-bit move code"""
+    code = move[0] * 8 + move[1] | (move[2] * 8 + move[3]) << 6
+    if len(move) > 4 and move[4]:
+        code |= move[4].value << 12
+    return code
+
+def unpack_move(code):
+    """Unpack a 16-bit move code into a move tuple"""
+    from_sq, to_sq, promotion = code & 63, code >> 6 & 63, code >> 12
+    if promotion:
+        return (from_sq >> 3, from_sq & 7, to_sq >> 3, to_sq & 7, MOVE_PROMOTIONS[promotion])
+    return (from_sq >> 3, from_sq & 7, to_sq >> 3, to_sq & 7)
+
+def move_buffer():
+    """Make an array big enough for the move codes of any position"""
+    return array("H", bytes(2 * MAX_MOVES))
+
+# Everything needed to take back one move made with Board.make_move.
+# The has_moved flags of the king and rook are the castling rights.
+# captured_row differs from to_row for en passant, and promoted_pawn is the
+# pawn that was replaced by a promoted piece.
+UndoRecord = namedtuple("UndoRecord", [
+    "from_row", "from_col", "to_row", "to_col",
+    "captured", "captured_row", "had_moved",
+    "rook_from_col", "rook_to_col", "rook_had_moved",
+    "zobrist_hash", "en_passant_square", "promoted_pawn", "halfmove_clock",
+])
 
 class Board:
     def __init__(self):
         self.board = [[None for _ in range(8)] for _ in range(8)]
+        self.king_squares = {}
+        self.undo_stack = []
+        self.side_to_move = PieceColor.WHITE
+        # Square a pawn can capture en passant on, set after a double pawn move
+        self.en_passant_square = None
+        # Plies since the last capture or pawn move, and the FEN move number
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
         self.setup_pieces()
     
     def setup_pieces(self):
@@ -243,60 +464,464 @@ class Board:
         self.board[7][5] = ChessPiece(PieceColor.WHITE, PieceType.BISHOP, 7, 5)
         self.board[7][6] = ChessPiece(PieceColor.WHITE, PieceType.KNIGHT, 7, 6)
         self.board[7][7] = ChessPiece(PieceColor.WHITE, PieceType.ROOK, 7, 7)
+        
+        self.king_squares = {PieceColor.WHITE: (7, 4), PieceColor.BLACK: (0, 4)}
+        self.zobrist_hash = self.compute_hash()
+        self.attack_counts = self.compute_attack_counts()
+    
+    def load_fen(self, fen):
+        """Setup the board from a FEN string
+
+        Castling rights become has_moved flags on the kings and rooks.
+        """
+        fields = fen.split()
+        if not fields:
+            raise ValueError("Empty FEN")
+        ranks = fields[0].split('/')
+        if len(ranks) != 8:
+            raise ValueError(f"FEN needs 8 ranks: {fen!r}")
+        
+        pieces = []
+        for row, rank in enumerate(ranks):
+            col = 0
+            for char in rank:
+                if char.isdigit():
+                    col += int(char)
+                    continue
+                if char.lower() not in FEN_PIECE_TYPES or col > 7:
+                    raise ValueError(f"Invalid FEN rank {rank!r}")
+                color = PieceColor.WHITE if char.isupper() else PieceColor.BLACK
+                pieces.append((row, col, color, FEN_PIECE_TYPES[char.lower()]))
+                col += 1
+            if col != 8:
+                raise ValueError(f"Invalid FEN rank {rank!r}")
+        
+        castling = fields[2] if len(fields) > 2 else '-'
+        rights = 0
+        for char, right in (('K', WHITE_KINGSIDE), ('Q', WHITE_QUEENSIDE), ('k', BLACK_KINGSIDE), ('q', BLACK_QUEENSIDE)):
+            if char in castling:
+                rights |= right
+        side_to_move = PieceColor.BLACK if len(fields) > 1 and fields[1] == 'b' else PieceColor.WHITE
+        en_passant = fields[3] if len(fields) > 3 else '-'
+        try:
+            halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f"Invalid FEN move counters: {fen!r}") from None
+        self._set_position(pieces, side_to_move, rights,
+                           parse_square(en_passant) if en_passant != '-' else None,
+                           halfmove_clock, fullmove_number)
+    
+    def _set_position(self, pieces, side_to_move, rights, en_passant_square, halfmove_clock, fullmove_number):
+        """Replace the position with pieces, given as (row, col, color, piece_type)
+
+        rights is a castling rights mask; it becomes has_moved flags on the
+        kings and rooks.
+        """
+        self.board = [[None for _ in range(8)] for _ in range(8)]
+        self.king_squares = {}
+        self.undo_stack = []
+        
+        for row, col, color, piece_type in pieces:
+            piece = ChessPiece(color, piece_type, row, col)
+            # Kings and rooks only get the castling rights granted below
+            if piece_type in (PieceType.KING, PieceType.ROOK):
+                piece.has_moved = True
+            elif piece_type == PieceType.PAWN:
+                piece.has_moved = row != (6 if color == PieceColor.WHITE else 1)
+            if piece_type == PieceType.KING:
+                self.king_squares[color] = (row, col)
+            self.board[row][col] = piece
+        
+        for right, row, rook_col in ((WHITE_KINGSIDE, 7, 7), (WHITE_QUEENSIDE, 7, 0),
+                                     (BLACK_KINGSIDE, 0, 7), (BLACK_QUEENSIDE, 0, 0)):
+            if rights & right:
+                king, rook = self.board[row][4], self.board[row][rook_col]
+                if king and rook and king.piece_type == PieceType.KING and rook.piece_type == PieceType.ROOK \
+                        and king.color == rook.color:
+                    king.has_moved = False
+                    rook.has_moved = False
+        
+        self.side_to_move = side_to_move
+        self.en_passant_square = en_passant_square
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.zobrist_hash = self.compute_hash()
+        self.attack_counts = self.compute_attack_counts()
+    
+    def to_fen(self):
+        """Get the FEN string of the position"""
+        ranks = []
+        for row in range(8):
+            rank = ""
+            empty = 0
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                letter = FEN_PIECE_LETTERS[piece.piece_type]
+                rank += letter.upper() if piece.color == PieceColor.WHITE else letter
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        
+        rights = self.castling_rights()
+        castling = "".join(char for char, right in (('K', WHITE_KINGSIDE), ('Q', WHITE_QUEENSIDE),
+                                                    ('k', BLACK_KINGSIDE), ('q', BLACK_QUEENSIDE))
+                           if rights & right) or '-'
+        side = 'w' if self.side_to_move == PieceColor.WHITE else 'b'
+        en_passant = square_name(*self.en_passant_square) if self.en_passant_square else '-'
+        return f"{'/'.join(ranks)} {side} {castling} {en_passant} {self.halfmove_clock} {self.fullmove_number}"
+    
+    def to_bytes(self):
+        """Encode the position in POSITION_FORMAT.size (29) bytes
+
+        Layout: a 64-bit occupancy mask (bit n = square row * 8 + col), one
+        nibble per occupied square in square order (color << 3 | piece type
+        - 1), then flags (bit 0 black to move, bits 1-4 castling rights), the
+        en passant square or 255, the halfmove clock (capped at 255) and the
+        fullmove number.
+        """
+        occupancy = 0
+        nibbles = []
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece:
+                    occupancy |= 1 << (row * 8 + col)
+                    nibbles.append((piece.color == PieceColor.BLACK) << 3 | (piece.piece_type.value - 1))
+        if len(nibbles) > 32:
+            raise ValueError("Too many pieces to encode")
+        nibbles.append(0)
+        packed = bytes(nibbles[i] << 4 | nibbles[i + 1] for i in range(0, len(nibbles) - 1, 2))
+        flags = (self.side_to_move == PieceColor.BLACK) | self.castling_rights() << 1
+        en_passant = self.en_passant_square[0] * 8 + self.en_passant_square[1] if self.en_passant_square else 255
+        return POSITION_FORMAT.pack(occupancy, packed, flags, en_passant,
+                                    min(self.halfmove_clock, 255), min(self.fullmove_number, 65535))
+    
+    def load_bytes(self, data):
+        """Setup the board from the encoding made by to_bytes"""
+        occupancy, packed, flags, en_passant, halfmove_clock, fullmove_number = POSITION_FORMAT.unpack(data)
+        pieces = []
+        index = 0
+        while occupancy:
+            low = occupancy & -occupancy
+            sq = low.bit_length() - 1
+            occupancy ^= low
+            nibble = packed[index >> 1] >> (4 - 4 * (index & 1)) & 15
+            index += 1
+            pieces.append((sq >> 3, sq & 7, PieceColor.BLACK if nibble & 8 else PieceColor.WHITE,
+                           PieceType((nibble & 7) + 1)))
+        self._set_position(pieces, PieceColor.BLACK if flags & 1 else PieceColor.WHITE, flags >> 1,
+                           divmod(en_passant, 8) if en_passant != 255 else None,
+                           halfmove_clock, fullmove_number)
+    
+    def castling_rights(self):
+        """Get the castling rights mask from the has_moved flags of kings and rooks"""
+        rights = 0
+        for color, row, kingside, queenside in ((PieceColor.WHITE, 7, WHITE_KINGSIDE, WHITE_QUEENSIDE),
+                                                (PieceColor.BLACK, 0, BLACK_KINGSIDE, BLACK_QUEENSIDE)):
+            king = self.board[row][4]
+            if not king or king.piece_type != PieceType.KING or king.color != color or king.has_moved:
+                continue
+            for col, right in ((7, kingside), (0, queenside)):
+                rook = self.board[row][col]
+                if rook and rook.piece_type == PieceType.ROOK and rook.color == color and not rook.has_moved:
+                    rights |= right
+        return rights
+    
+    def compute_hash(self):
+        """Compute the Zobrist hash of the position from scratch"""
+        h = ZOBRIST_CASTLING[self.castling_rights()]
+        if self.side_to_move == PieceColor.BLACK:
+            h ^= ZOBRIST_BLACK_TO_MOVE
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece:
+                    h ^= ZOBRIST_PIECES[piece.color.value - 1][piece.piece_type.value - 1][row * 8 + col]
+        if self.en_passant_square:
+            h ^= ZOBRIST_EN_PASSANT[self.en_passant_square[1]]
+        return h
+    
+    def compute_attack_counts(self):
+        """Count from scratch how many pieces of each color attack every square
+
+        Returns [white counts, black counts], 64 entries each indexed by
+        row * 8 + col. make_move and unmake_move keep self.attack_counts
+        equal to this without recounting the board, see _lift and _put.
+        """
+        counts = [[0] * 64, [0] * 64]
+        for row in self.board:
+            for piece in row:
+                if piece:
+                    color_counts = counts[piece.color.value - 1]
+                    for target in piece.iter_attacks(self.board):
+                        color_counts[target] += 1
+        return counts
+    
+    def _count_piece(self, piece, delta):
+        """Add delta to the attack counts of the squares a piece attacks"""
+        counts = self.attack_counts[piece.color.value - 1]
+        sq = piece.row * 8 + piece.col
+        piece_type = piece.piece_type
+        if piece_type is PieceType.PAWN:
+            targets = PAWN_ATTACK_SQUARES[piece.color.value - 1][sq]
+        elif piece_type is PieceType.KNIGHT:
+            targets = KNIGHT_SQUARES[sq]
+        elif piece_type is PieceType.KING:
+            targets = KING_SQUARES[sq]
+        else:
+            board = self.board
+            rays = ROOK_RAYS if piece_type is PieceType.ROOK else BISHOP_RAYS if piece_type is PieceType.BISHOP \
+                else QUEEN_RAYS
+            for ray in rays[sq]:
+                for target in ray:
+                    counts[target] += delta
+                    if board[target >> 3][target & 7]:
+                        break
+            return
+        for target in targets:
+            counts[target] += delta
+    
+    def _update_rays(self, sq, delta):
+        """Extend (delta 1) or cut back (delta -1) the slider rays through sq when it empties or fills"""
+        board = self.board
+        for ray_a, ray_b, slider in AXIS_RAYS[sq]:
+            # The nearest piece on each side of sq along the line
+            piece_a = None
+            end_a = 0
+            for target in ray_a:
+                end_a += 1
+                piece_a = board[target >> 3][target & 7]
+                if piece_a:
+                    break
+            piece_b = None
+            end_b = 0
+            for target in ray_b:
+                end_b += 1
+                piece_b = board[target >> 3][target & 7]
+                if piece_b:
+                    break
+            # A slider on one side sees through sq up to the piece on the other side
+            if piece_a and (piece_a.piece_type is slider or piece_a.piece_type is PieceType.QUEEN):
+                counts = self.attack_counts[piece_a.color.value - 1]
+                for target in ray_b[:end_b]:
+                    counts[target] += delta
+            if piece_b and (piece_b.piece_type is slider or piece_b.piece_type is PieceType.QUEEN):
+                counts = self.attack_counts[piece_b.color.value - 1]
+                for target in ray_a[:end_a]:
+                    counts[target] += delta
+    
+    def _lift(self, row, col):
+        """Take the piece off a square, keeping the attack maps up to date"""
+        piece = self.board[row][col]
+        self._count_piece(piece, -1)
+        self.board[row][col] = None
+        self._update_rays(row * 8 + col, 1)
+        return piece
     
-    def move_piece(self, from_row, from_col, to_row, to_col):
+    def _put(self, piece, row, col):
+        """Put a piece on a square, replacing any piece there, keeping the attack maps up to date"""
+        replaced = self.board[row][col]
+        if replaced:
+            self._count_piece(replaced, -1)
+        else:
+            self._update_rays(row * 8 + col, -1)
+        piece.row = row
+        piece.col = col
+        self.board[row][col] = piece
+        self._count_piece(piece, 1)
+    
+    def move_piece(self, from_row, from_col, to_row, to_col, promotion=None):
         """Move a piece from one position to another"""
+        return self.make_move(from_row, from_col, to_row, to_col, promotion)
+    
+    def make_move(self, from_row, from_col, to_row, to_col, promotion=None):
+        """Make a move and push an undo record so it can be taken back
+
+        A pawn reaching the last row is promoted to promotion (a PieceType),
+        or to a queen if none is given.
+        """
         piece = self.board[from_row][from_col]
-        if piece:
-            # Check for castling
-            if piece.piece_type == PieceType.KING and abs(to_col - from_col) == 2:
-                # Castling move
-                if to_col == 6:  # Kingside castling
-                    # Move rook from h-file to f-file
-                    rook = self.board[from_row][7]
-                    rook.col = 5
-                    rook.has_moved = True
-                    self.board[from_row][5] = rook
-                    self.board[from_row][7] = None
-                elif to_col == 2:  # Queenside castling
-                    # Move rook from a-file to d-file
-                    rook = self.board[from_row][0]
-                    rook.col = 3
-                    rook.has_moved = True
-                    self.board[from_row][3] = rook
-                    self.board[from_row][0] = None
-            
-            piece.row = to_row
-            piece.col = to_col
-            piece.has_moved = True
-            self.board[to_row][to_col] = piece
-            self.board[from_row][from_col] = None
-            return True
-        return False
+        if not piece:
+            return False
+        
+        rook = None
+        rook_from_col = rook_to_col = None
+        rook_had_moved = False
+        
+        # Castling also moves the rook
+        if piece.piece_type == PieceType.KING and abs(to_col - from_col) == 2:
+            if to_col == 6:  # Kingside: rook from h-file to f-file
+                rook_from_col, rook_to_col = 7, 5
+            else:  # Queenside: rook from a-file to d-file
+                rook_from_col, rook_to_col = 0, 3
+            rook = self.board[from_row][rook_from_col]
+            rook_had_moved = rook.has_moved
+        
+        # En passant captures the pawn beside the moving pawn, not on the target square
+        captured_row = to_row
+        captured = self.board[to_row][to_col]
+        if piece.piece_type == PieceType.PAWN and from_col != to_col and captured is None:
+            captured_row = from_row
+            captured = self.board[from_row][to_col]
+        
+        moved = piece
+        promoted_pawn = None
+        if piece.piece_type == PieceType.PAWN and to_row in (0, 7):
+            moved = ChessPiece(piece.color, promotion or PieceType.QUEEN, to_row, to_col)
+            moved.has_moved = True
+            promoted_pawn = piece
+        
+        self.undo_stack.append(UndoRecord(
+            from_row, from_col, to_row, to_col,
+            captured, captured_row, piece.has_moved,
+            rook_from_col, rook_to_col, rook_had_moved,
+            self.zobrist_hash, self.en_passant_square, promoted_pawn, self.halfmove_clock,
+        ))
+        
+        # Update the hash incrementally: old castling rights and en passant
+        # square out, pieces move, side to move flips, new rights and square in
+        keys = ZOBRIST_PIECES[piece.color.value - 1]
+        h = self.zobrist_hash ^ ZOBRIST_CASTLING[self.castling_rights()] ^ ZOBRIST_BLACK_TO_MOVE
+        if self.en_passant_square:
+            h ^= ZOBRIST_EN_PASSANT[self.en_passant_square[1]]
+        h ^= keys[piece.piece_type.value - 1][from_row * 8 + from_col]
+        h ^= keys[moved.piece_type.value - 1][to_row * 8 + to_col]
+        if captured:
+            h ^= ZOBRIST_PIECES[captured.color.value - 1][captured.piece_type.value - 1][captured_row * 8 + to_col]
+            # A normal capture is replaced by _put below
+            if captured_row != to_row:
+                self._lift(captured_row, to_col)
+        
+        if rook:
+            rook.has_moved = True
+            self._put(self._lift(from_row, rook_from_col), from_row, rook_to_col)
+            h ^= keys[PieceType.ROOK.value - 1][from_row * 8 + rook_from_col]
+            h ^= keys[PieceType.ROOK.value - 1][from_row * 8 + rook_to_col]
+        
+        self._lift(from_row, from_col)
+        piece.row = to_row
+        piece.col = to_col
+        piece.has_moved = True
+        self._put(moved, to_row, to_col)
+        
+        if piece.piece_type == PieceType.KING:
+            self.king_squares[piece.color] = (to_row, to_col)
+        if piece.piece_type == PieceType.PAWN and abs(to_row - from_row) == 2:
+            self.en_passant_square = ((from_row + to_row) // 2, from_col)
+            h ^= ZOBRIST_EN_PASSANT[from_col]
+        else:
+            self.en_passant_square = None
+        self.halfmove_clock = 0 if captured or piece.piece_type == PieceType.PAWN else self.halfmove_clock + 1
+        if piece.color == PieceColor.BLACK:
+            self.fullmove_number += 1
+        self.side_to_move = PieceColor.BLACK if self.side_to_move == PieceColor.WHITE else PieceColor.WHITE
+        self.zobrist_hash = h ^ ZOBRIST_CASTLING[self.castling_rights()]
+        return True
+    
+    def unmake_move(self):
+        """Take back the last move made with make_move"""
+        record = self.undo_stack.pop()
+        piece = record.promoted_pawn or self.board[record.to_row][record.to_col]
+        
+        self._lift(record.to_row, record.to_col)
+        piece.has_moved = record.had_moved
+        self._put(piece, record.from_row, record.from_col)
+        if record.captured:
+            self._put(record.captured, record.captured_row, record.to_col)
+        
+        if record.rook_from_col is not None:
+            rook = self._lift(record.from_row, record.rook_to_col)
+            rook.has_moved = record.rook_had_moved
+            self._put(rook, record.from_row, record.rook_from_col)
+        
+        if piece.piece_type == PieceType.KING:
+            self.king_squares[piece.color] = (record.from_row, record.from_col)
+        self.side_to_move = PieceColor.BLACK if self.side_to_move == PieceColor.WHITE else PieceColor.WHITE
+        if piece.color == PieceColor.BLACK:
+            self.fullmove_number -= 1
+        self.en_passant_square = record.en_passant_square
+        self.halfmove_clock = record.halfmove_clock
+        self.zobrist_hash = record.zobrist_hash
+        return record
     
     def get_piece_at(self, row, col):
         """Get piece at specific position"""
         return self.board[row][col]
     
+    def get_possible_moves(self, row, col):
+        """Get pseudo-legal moves for the piece at a position"""
+        piece = self.board[row][col]
+        if piece is None:
+            return []
+        return piece.get_possible_moves(self.board, self.en_passant_square)
+    
     def find_king(self, color):
         """Find the king of a given color"""
-        for row in range(8):
-            for col in range(8):
-                piece = self.board[row][col]
-                if piece and piece.piece_type == PieceType.KING and piece.color == color:
-                    return (row, col)
-        return None
+        return self.king_squares.get(color)
     
     def is_square_attacked(self, row, col, by_color):
-        """Check if a square is attacked by pieces of given color"""
-        for r in range(8):
-            for c in range(8):
-                piece = self.board[r][c]
-                if piece and piece.color == by_color:
-                    # Get all possible moves for this piece
-                    moves = piece.get_possible_moves(self.board)
-                    if (row, col) in moves:
+        """Check if a square is attacked by pieces of given color, from the attack maps"""
+        return self.attack_counts[by_color.value - 1][row * 8 + col] > 0
+    
+    def threatened_squares(self, color):
+        """Get the squares of color's pieces that the other side attacks"""
+        enemy_counts = self.attack_counts[2 - color.value]
+        return {row * 8 + col for row in range(8) for col in range(8)
+                if enemy_counts[row * 8 + col] and self.board[row][col] and self.board[row][col].color == color}
+    
+    def _scan_attacked(self, row, col, by_color):
+        """Check if a square is attacked by pieces of given color, without the attack maps
+
+        Looks outward from the square along knight, pawn, king, rook and
+        bishop lines, stopping each line at the first piece it meets, so it
+        also works while the board is being changed by hand.
+        """
+        board = self.board
+        
+        # Knights
+        for dr, dc in KNIGHT_OFFSETS:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                piece = board[r][c]
+                if piece and piece.color == by_color and piece.piece_type == PieceType.KNIGHT:
+                    return True
+        
+        # Pawns capture diagonally forward, so look one row back towards them
+        r = row + 1 if by_color == PieceColor.WHITE else row - 1
+        if 0 <= r < 8:
+            for c in (col - 1, col + 1):
+                if 0 <= c < 8:
+                    piece = board[r][c]
+                    if piece and piece.color == by_color and piece.piece_type == PieceType.PAWN:
                         return True
+        
+        # King
+        for dr, dc in KING_OFFSETS:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                piece = board[r][c]
+                if piece and piece.color == by_color and piece.piece_type == PieceType.KING:
+                    return True
+        
+        # Sliding pieces: the first piece on each line decides
+        for directions, slider in ((ROOK_DIRECTIONS, PieceType.ROOK), (BISHOP_DIRECTIONS, PieceType.BISHOP)):
+            for dr, dc in directions:
+                r, c = row + dr, col + dc
+                while 0 <= r < 8 and 0 <= c < 8:
+                    piece = board[r][c]
+                    if piece:
+                        if piece.color == by_color and piece.piece_type in (slider, PieceType.QUEEN):
+                            return True
+                        break
+                    r, c = r + dr, c + dc
+        
         return False
     
     def is_king_in_check(self, color):
@@ -309,18 +934,174 @@ class Board:
         row, col = king_pos
         return self.is_square_attacked(row, col, enemy_color)
     
+    def get_checks_and_pins(self, color):
+        """Find the checks against a color's king and which of its pieces are pinned
+
+        Returns (checkers, pins). checkers holds, for each checking piece,
+        the set of squares (row * 8 + col) that capture or block it. pins
+        maps the square of each pinned piece to the squares it may still
+        move to along the pin.
+        """
+        checkers = []
+        pins = {}
+        king_pos = self.king_squares.get(color)
+        if not king_pos:
+            return checkers, pins
+        
+        board = self.board
+        king_row, king_col = king_pos
+        
+        # Walk out from the king: an enemy slider is a check if nothing is in
+        # between, and a pin if exactly one of our own pieces is
+        for directions, slider in ((ROOK_DIRECTIONS, PieceType.ROOK), (BISHOP_DIRECTIONS, PieceType.BISHOP)):
+            for dr, dc in directions:
+                line = []
+                pinned = None
+                r, c = king_row + dr, king_col + dc
+                while 0 <= r < 8 and 0 <= c < 8:
+                    line.append(r * 8 + c)
+                    piece = board[r][c]
+                    if piece:
+                        if piece.color == color:
+                            if pinned is not None:
+                                break
+                            pinned = r * 8 + c
+                        else:
+                            if piece.piece_type in (slider, PieceType.QUEEN):
+                                if pinned is not None:
+                                    pins[pinned] = set(line)
+                                else:
+                                    checkers.append(set(line))
+                            break
+                    r, c = r + dr, c + dc
+        
+        for dr, dc in KNIGHT_OFFSETS:
+            r, c = king_row + dr, king_col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                piece = board[r][c]
+                if piece and piece.color != color and piece.piece_type == PieceType.KNIGHT:
+                    checkers.append({r * 8 + c})
+        
+        # Enemy pawns attack towards our side of the board
+        r = king_row - 1 if color == PieceColor.WHITE else king_row + 1
+        if 0 <= r < 8:
+            for c in (king_col - 1, king_col + 1):
+                if 0 <= c < 8:
+                    piece = board[r][c]
+                    if piece and piece.color != color and piece.piece_type == PieceType.PAWN:
+                        checkers.append({r * 8 + c})
+        
+        return checkers, pins
+    
+    def generate_legal_moves(self, color, from_square=None):
+        """Yield legal moves of a color as (from_row, from_col, to_row, to_col)
+
+        Promotions get the promoted PieceType as a fifth item, one move per
+        piece. Checks and pins are found once per call, so moves are
+        filtered without being tried on the board. Pass from_square to only
+        get the moves of the piece on that (row, col).
+        """
+        for code in self.iter_move_codes(color, from_square):
+            from_sq, to_sq = code & 63, code >> 6 & 63
+            if code >> 12:
+                yield (from_sq >> 3, from_sq & 7, to_sq >> 3, to_sq & 7, MOVE_PROMOTIONS[code >> 12])
+            else:
+                yield (from_sq >> 3, from_sq & 7, to_sq >> 3, to_sq & 7)
+    
+    def generate_move_codes(self, color, buffer):
+        """Write the legal moves of a color into buffer as move codes and return how many there are
+
+        buffer is an array from move_buffer(). Reusing one buffer per ply
+        keeps move generation from allocating anything per move.
+        """
+        count = 0
+        for code in self.iter_move_codes(color):
+            buffer[count] = code
+            count += 1
+        return count
+    
+    def make_move_code(self, code):
+        """Make a move given as a move code, see pack_move"""
+        from_sq, to_sq = code & 63, code >> 6 & 63
+        return self.make_move(from_sq >> 3, from_sq & 7, to_sq >> 3, to_sq & 7, MOVE_PROMOTIONS[code >> 12])
+    
+    def iter_move_codes(self, color, from_square=None):
+        """Yield the legal moves of a color as move codes, see generate_legal_moves"""
+        board = self.board
+        checkers, pins = self.get_checks_and_pins(color)
+        # Squares a non-king move must land on to answer a single check
+        evasions = checkers[0] if len(checkers) == 1 else None
+        en_passant = self.en_passant_square
+        en_passant_sq = en_passant[0] * 8 + en_passant[1] if en_passant else -1
+        
+        squares = (from_square[0] * 8 + from_square[1],) if from_square else range(64)
+        for sq in squares:
+            piece = board[sq >> 3][sq & 7]
+            if not piece or piece.color != color:
+                continue
+            
+            if piece.piece_type == PieceType.KING:
+                for target in self._get_legal_king_moves(piece, bool(checkers)):
+                    yield sq | target << 6
+                continue
+            
+            # Only the king can answer a double check
+            if len(checkers) > 1:
+                continue
+            
+            pin = pins.get(sq)
+            is_pawn = piece.piece_type == PieceType.PAWN
+            for target in piece.iter_targets(board, en_passant):
+                if is_pawn and target == en_passant_sq:
+                    # En passant takes two pawns off one line at once, which
+                    # the pin scan doesn't cover, so try it on the board
+                    if not self.would_be_in_check_after_move(sq >> 3, sq & 7, target >> 3, target & 7, color):
+                        yield sq | target << 6
+                    continue
+                if evasions is not None and target not in evasions:
+                    continue
+                if pin is not None and target not in pin:
+                    continue
+                if is_pawn and (target < 8 or target >= 56):
+                    for flag in PROMOTION_FLAGS:
+                        yield sq | target << 6 | flag
+                else:
+                    yield sq | target << 6
+    
+    def _get_legal_king_moves(self, king, in_check):
+        """Get the squares the king can move to without stepping onto an attacked square"""
+        enemy_color = PieceColor.BLACK if king.color == PieceColor.WHITE else PieceColor.WHITE
+        row, col = king.row, king.col
+        moves = []
+        
+        if not in_check:
+            # No slider reaches the king, so the attack maps are exact for
+            # the squares around it
+            enemy_counts = self.attack_counts[enemy_color.value - 1]
+            for target in king.iter_targets(self.board):
+                if enemy_counts[target]:
+                    continue
+                # Castling: not through check either
+                if abs((target & 7) - col) == 2 and enemy_counts[(row * 8 + col + target) // 2]:
+                    continue
+                moves.append(target)
+            return moves
+        
+        # Lift the king so sliders checking it also cover the squares behind
+        # it, which the attack maps can't see
+        self.board[row][col] = None
+        for target in king.iter_targets(self.board):
+            # No castling out of check
+            if abs((target & 7) - col) != 2 and not self._scan_attacked(target >> 3, target & 7, enemy_color):
+                moves.append(target)
+        self.board[row][col] = king
+        
+        return moves
+    
     def has_legal_moves(self, color):
         """Check if a player has any legal moves"""
-        for row in range(8):
-            for col in range(8):
-                piece = self.board[row][col]
-                if piece and piece.color == color:
-                    # Check all possible moves for this piece
-                    moves = piece.get_possible_moves(self.board)
-                    for move_row, move_col in moves:
-                        # Check if move would leave king in check
-                        if not self.would_be_in_check_after_move(row, col, move_row, move_col, color):
-                            return True
+        for _ in self.iter_move_codes(color):
+            return True
         return False
     
     def is_checkmate(self, color):
@@ -337,15 +1118,15 @@ class Board:
         return piece and piece.piece_type == PieceType.KING and abs(to_col - from_col) == 2
     
     def is_valid_castling(self, from_row, from_col, to_row, to_col, color):
-        """Validate castling move (king can't move through check)"""
+        """Validate castling move (king can't castle out of, through or into check)"""
         if not self.is_castling_move(from_row, from_col, to_row, to_col):
             return True
         
         # Check king's path for check
         if to_col == 6:  # Kingside
-            check_cols = [5, 6]
+            check_cols = [from_col, 5, 6]
         else:  # Queenside
-            check_cols = [2, 3]
+            check_cols = [from_col, 3, 2]
         
         for col in check_cols:
             if self.is_square_attacked(from_row, col, PieceColor.BLACK if color == PieceColor.WHITE else PieceColor.WHITE):
@@ -355,82 +1136,244 @@ class Board:
     
     def would_be_in_check_after_move(self, from_row, from_col, to_row, to_col, color):
         """Simulate a move and check if king would be in check"""
-        # Save current state
-        piece = self.board[from_row][from_col]
-        captured_piece = self.board[to_row][to_col]
-        rook = None
-        rook_from_col = None
-        rook_to_col = None
-        
-        # Handle castling simulation
-        if piece.piece_type == PieceType.KING and abs(to_col - from_col) == 2:
-            if to_col == 6:  # Kingside
-                rook = self.board[from_row][7]
-                rook_from_col = 7
-                rook_to_col = 5
-            else:  # Queenside
-                rook = self.board[from_row][0]
-                rook_from_col = 0
-                rook_to_col = 3
-        
-        # Simulate the move
-        self.board[to_row][to_col] = piece
-        self.board[from_row][from_col] = None
-        piece.row = to_row
-        piece.col = to_col
-        
-        # Simulate rook move if castling
-        if rook:
-            self.board[from_row][rook_to_col] = rook
-            self.board[from_row][rook_from_col] = None
-            rook.col = rook_to_col
-        
-        # Check if king is in check
+        self.make_move(from_row, from_col, to_row, to_col)
         in_check = self.is_king_in_check(color)
-        
-        # Restore board state
-        self.board[from_row][from_col] = piece
-        self.board[to_row][to_col] = captured_piece
-        piece.row = from_row
-        piece.col = from_col
-        
-        if rook:
-            self.board[from_row][rook_from_col] = rook
-            self.board[from_row][rook_to_col] = None
-            rook.col = rook_from_col
-        
+        self.unmake_move()
         return in_check
 
+# Outcome of a position for the side to move, see ChessGame.game_status.
+# legal_moves is an array of 16-bit move codes (see pack_move), so a cached
+# status takes about 2 bytes per move rather than a tuple per move.
+GameStatus = namedtuple("GameStatus", ["in_check", "checkmate", "stalemate", "legal_moves"])
+
+class PositionCache:
+    """Fixed-size table of game statuses keyed by Zobrist hash
+
+    The table has max_entries slots (rounded down to a power of two) that
+    are allocated once, and a new position always replaces whatever is in
+    its slot, so memory use never grows past that many entries. Statuses
+    hold their moves as packed move codes, so an entry is a few hundred
+    bytes at most.
+    """
+    
+    def __init__(self, max_entries=1 << 14):
+        size = 1
+        while size * 2 <= max_entries:
+            size *= 2
+        self.mask = size - 1
+        self.slots = [None] * size
+        self.hits = 0
+        self.misses = 0
+        self.replacements = 0
+    
+    def get(self, key):
+        """Get the cached status for a position hash, or None"""
+        entry = self.slots[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+    
+    def store(self, key, status):
+        """Cache the status of a position hash, replacing the slot's entry"""
+        index = key & self.mask
+        entry = self.slots[index]
+        if entry is not None and entry[0] != key:
+            self.replacements += 1
+        self.slots[index] = (key, status)
+    
+    def clear(self):
+        """Drop all entries and reset the statistics"""
+        self.slots = [None] * len(self.slots)
+        self.hits = self.misses = self.replacements = 0
+    
+    def stats(self):
+        """Get hit/miss statistics"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.slots),
+            "used": sum(1 for entry in self.slots if entry is not None),
+            "hits": self.hits,
+            "misses": self.misses,
+            "replacements": self.replacements,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+# Plies between the board snapshots of a MoveLog
+SNAPSHOT_INTERVAL = 16
+
+class MoveLog:
+    """The moves of a game as 16-bit codes, for taking them back and replaying them
+
+    Each ply keeps its move code (see pack_move) in an array('H') and what
+    it captured in an array('B'): 0 for nothing, else piece type value |
+    8 for a black piece. Every snapshot_interval plies the position is
+    saved with to_bytes. Going to a ply loads the snapshot at or before it
+    and replays the moves from there, so a jump anywhere in a game of any
+    length replays fewer than snapshot_interval moves. A log costs three
+    bytes per ply plus POSITION_FORMAT.size bytes per snapshot, and the
+    board's own undo stack is cleared at each snapshot so it never holds
+    more than snapshot_interval records.
+
+    ply is the position the board shows. Moves after it stay in the log, so
+    they can be replayed, until a different move is pushed there.
+    """
+    
+    def __init__(self, board, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.snapshot_interval = snapshot_interval
+        self.start_color = board.side_to_move
+        self.moves = array("H")
+        self.captures = array("B")
+        self.snapshots = bytearray(board.to_bytes())
+        self.ply = 0
+    
+    def __len__(self):
+        return len(self.moves)
+    
+    def push(self, board, move):
+        """Make a move on the board at the current ply and log it; returns the captured piece or None
+
+        Moves logged after the current ply are dropped.
+        """
+        self._truncate(self.ply)
+        from_row, from_col, to_row, to_col = move[:4]
+        piece = board.get_piece_at(from_row, from_col)
+        # En passant takes the pawn beside the moving pawn
+        captured = board.get_piece_at(to_row, to_col)
+        if not captured and piece.piece_type == PieceType.PAWN and to_col != from_col:
+            captured = board.get_piece_at(from_row, to_col)
+        self.moves.append(pack_move(move))
+        self.captures.append(captured.piece_type.value | (captured.color == PieceColor.BLACK) << 3 if captured else 0)
+        board.make_move(*move)
+        self.ply += 1
+        self._snapshot(board)
+        return captured
+    
+    def goto(self, board, ply):
+        """Set the board to the position after the first ply moves of the log"""
+        if not 0 <= ply <= len(self.moves):
+            raise IndexError(f"ply {ply} is outside the log (0-{len(self.moves)})")
+        interval = self.snapshot_interval
+        if ply < self.ply <= ply + len(board.undo_stack):
+            for _ in range(self.ply - ply):
+                board.unmake_move()
+        else:
+            start = ply // interval * interval
+            # Replay from the current position when no snapshot is in between
+            if not start <= self.ply <= ply:
+                offset = start // interval * POSITION_FORMAT.size
+                board.load_bytes(self.snapshots[offset:offset + POSITION_FORMAT.size])
+                self.ply = start
+            while self.ply < ply:
+                board.make_move_code(self.moves[self.ply])
+                self.ply += 1
+                self._snapshot(board)
+        self.ply = ply
+    
+    def side_to_move(self, ply):
+        """Get the color to move after ply moves"""
+        if ply % 2 == 0:
+            return self.start_color
+        return PieceColor.BLACK if self.start_color == PieceColor.WHITE else PieceColor.WHITE
+    
+    def line(self):
+        """List the moves up to the current ply as move tuples"""
+        return [unpack_move(code) for code in self.moves[:self.ply]]
+    
+    def captured_pieces(self, ply):
+        """List (color, piece type) of everything captured in the first ply moves"""
+        return [(PieceColor.BLACK if code & 8 else PieceColor.WHITE, PieceType(code & 7))
+                for code in self.captures[:ply] if code]
+    
+    def _snapshot(self, board):
+        # Called with self.ply just reached by a move
+        if self.ply % self.snapshot_interval:
+            return
+        index = self.ply // self.snapshot_interval
+        if len(self.snapshots) == index * POSITION_FORMAT.size:
+            self.snapshots += board.to_bytes()
+        del board.undo_stack[:]
+    
+    def _truncate(self, ply):
+        if ply < len(self.moves):
+            del self.moves[ply:]
+            del self.captures[ply:]
+            del self.snapshots[(ply // self.snapshot_interval + 1) * POSITION_FORMAT.size:]
+
 class ChessGame:
-    def __init__(self):
-        self.board = Board()
+    def __init__(self, board=None, cache=None, engine_color=None, think_time_ms=ENGINE_THINK_MS, book=None):
+        # Any object with the Board API works here, e.g. bitboard.BitBoard
+        self.board = board if board is not None else Board()
+        # Can be shared between games to reuse analysis of common positions
+        self.cache = cache if cache is not None else PositionCache()
         self.selected_piece = None
         self.possible_moves = []
-        self.current_player = PieceColor.WHITE
+        self.current_player = self.board.side_to_move
         self.in_check = False
         self.game_over = False
         self.winner = None
-        self.move_history = []
+        # The game starts from start_fen; move_log holds the moves played
+        # and lets the game go back and forth through them
+        self.start_fen = self.board.to_fen()
+        self.move_log = MoveLog(self.board)
         self.captured_pieces = {"white": [], "black": []}
         self.last_move = None
         self.last_capture = False
+        self._status = None
+        # Outline the side to move's pieces that are under attack (T key)
+        self.show_threats = False
+        # instrument.Instrumentation, loaded on the first F2 or F3 press or
+        # by --instrument, and the status bar note of its last F3 or F4 action
+        self.instrumentation = None
+        self.instrument_message = None
+        # Created on the first draw(), so headless games never touch pygame
+        self.renderer = None
+        # The engine plays engine_color on a background thread (GUI only)
+        self.engine_color = engine_color
+        self.think_time_ms = think_time_ms
+        # A book.OpeningBook the engine plays from while the position is in it
+        self.book = book
+        self.worker = None
+        self.engine_job = None
+        self.engine_progress = None
+        self.engine_started = None
+        # kind -> callable(event) for USER_EVENTs from post_user_event()
+        self.event_handlers = {
+            "engine_move": self._on_engine_move,
+            "engine_progress": self._on_engine_progress,
+        }
+        # A board set up from a FEN may already be in check or over
+        self._update_status()
+    
+    @property
+    def move_history(self):
+        """Moves played up to the shown position, with the promotion piece type if any"""
+        return self.move_log.line()
     
     def get_legal_moves(self, piece):
         """Get legal moves that don't leave king in check"""
-        all_moves = piece.get_possible_moves(self.board.board)
-        legal_moves = []
-        
-        for move in all_moves:
-            # Check castling validity
-            if self.board.is_castling_move(piece.row, piece.col, move[0], move[1]):
-                if not self.board.is_valid_castling(piece.row, piece.col, move[0], move[1], piece.color):
-                    continue
-            
-            # Check if move would leave king in check
-            if not self.board.would_be_in_check_after_move(piece.row, piece.col, move[0], move[1], piece.color):
-                legal_moves.append(move)
-        
-        return legal_moves
+        moves = self.board.generate_legal_moves(piece.color, (piece.row, piece.col))
+        return list(dict.fromkeys((move[2], move[3]) for move in moves))
+    
+    def game_status(self):
+        """Get check, checkmate, stalemate and the legal moves for the side to move
+
+        Computed once per position and reused until the next move is made.
+        Positions seen before, by any move order, come from the position cache.
+        """
+        if self._status is None:
+            key = self.board.zobrist_hash
+            status = self.cache.get(key)
+            if status is None:
+                color = self.current_player
+                legal_moves = array("H", self.board.iter_move_codes(color))
+                in_check = self.board.is_king_in_check(color)
+                status = GameStatus(in_check, in_check and not legal_moves,
+                                    not in_check and not legal_moves, legal_moves)
+                self.cache.store(key, status)
+            self._status = status
+        return self._status
     
     def handle_click(self, pos):
         """Handle mouse click to select/move pieces"""
@@ -445,176 +1388,425 @@ class ChessGame:
             piece = self.board.get_piece_at(row, col)
             if piece and piece.color == self.current_player:
                 self.selected_piece = (row, col)
-                self.possible_moves = self.get_legal_moves(piece)
+                # Promotions are shown once and always promote to a queen
+                moves = map(unpack_move, self.game_status().legal_moves)
+                self.possible_moves = [(move[2], move[3]) for move in moves
+                                       if move[:2] == (row, col) and (len(move) == 4 or move[4] == PieceType.QUEEN)]
         else:
             # Try to move the piece
             if (row, col) in self.possible_moves:
-                from_row, from_col = self.selected_piece
-                piece = self.board.get_piece_at(from_row, from_col)
-                
-                # Check if this is a capture
-                captured = self.board.get_piece_at(row, col)
-                if captured:
-                    self.last_capture = True
-                    captured_color = "white" if captured.color == PieceColor.WHITE else "black"
-                    self.captured_pieces[captured_color].append(captured.piece_type)
-                    capture_sound.play()
-                else:
-                    self.last_capture = False
-                    move_sound.play()
-                
-                self.board.move_piece(from_row, from_col, row, col)
-                self.last_move = (from_row, from_col, row, col)
-                self.move_history.append(self.last_move)
-                
-                self.current_player = PieceColor.BLACK if self.current_player == PieceColor.WHITE else PieceColor.WHITE
-                self.in_check = self.board.is_king_in_check(self.current_player)
-                
-                # Play check sound
-                if self.in_check:
-                    check_sound.play()
-                
-                # Check for checkmate or stalemate
-                if self.board.is_checkmate(self.current_player):
-                    self.game_over = True
-                    self.winner = PieceColor.BLACK if self.current_player == PieceColor.WHITE else PieceColor.WHITE
-                    checkmate_sound.play()
-                elif self.board.is_stalemate(self.current_player):
-                    self.game_over = True
-                    self.winner = None  # Draw
+                self.make_move(self.selected_piece + (row, col))
             
             self.selected_piece = None
             self.possible_moves = []
     
-    def draw_board(self):
-        """Draw the chessboard"""
+    def handle_key(self, key):
+        """Handle a key press: arrows take back and replay moves, Home and End jump to either end, T shows threats
+
+        F2 turns instrumentation on and off, F3 starts and stops a cProfile
+        capture and F4 writes the instrumentation statistics, see instrument.py.
+        """
+        if key == pygame.K_LEFT:
+            self.takeback()
+        elif key == pygame.K_RIGHT:
+            self.forward()
+        elif key == pygame.K_HOME:
+            self.goto_ply(0)
+        elif key == pygame.K_END:
+            self.goto_ply(len(self.move_log))
+        elif key == pygame.K_t:
+            self.show_threats = not self.show_threats
+        elif key in (pygame.K_F2, pygame.K_F3, pygame.K_F4):
+            self.handle_instrument_key(key)
+    
+    def handle_instrument_key(self, key):
+        """Toggle instrumentation (F2) or a cProfile capture (F3), or write the statistics (F4)"""
+        if self.instrumentation is None:
+            # Only loaded when asked for, it isn't needed to play
+            from instrument import instrumentation
+            self.instrumentation = instrumentation
+        if key == pygame.K_F2:
+            self.instrumentation.toggle()
+            self.instrument_message = None
+        elif key == pygame.K_F3:
+            from instrument import PROFILE_FILE
+            stats = self.instrumentation.toggle_profile(PROFILE_FILE)
+            self.instrument_message = "Profiling (F3 stops)" if stats is None else f"Profile written to {PROFILE_FILE}"
+        else:
+            from instrument import STATS_FILE
+            self.instrumentation.dump(STATS_FILE)
+            self.instrument_message = f"Statistics written to {STATS_FILE}"
+    
+    def make_move(self, move):
+        """Play a legal move for the side to move, as (from_row, from_col, to_row, to_col[, promotion])"""
+        captured = self.move_log.push(self.board, move)
+        if captured:
+            self.last_capture = True
+            captured_color = "white" if captured.color == PieceColor.WHITE else "black"
+            self.captured_pieces[captured_color].append(captured.piece_type)
+            play_sound("capture")
+        else:
+            self.last_capture = False
+            play_sound("move")
+        
+        self.last_move = tuple(move[:4])
+        
+        self.current_player = PieceColor.BLACK if self.current_player == PieceColor.WHITE else PieceColor.WHITE
+        status = self._update_status()
+        
+        # Play check sound
+        if self.in_check:
+            play_sound("check")
+        if status.checkmate:
+            play_sound("checkmate")
+        
+        # A search of the previous position is out of date, even if the
+        # user moved for the engine
+        self.start_engine()
+    
+    def _update_status(self):
+        """Recompute check and checkmate or stalemate after the position changed"""
+        self._status = None
+        status = self.game_status()
+        self.in_check = status.in_check
+        self.game_over = status.checkmate or status.stalemate
+        if status.checkmate:
+            self.winner = PieceColor.BLACK if self.current_player == PieceColor.WHITE else PieceColor.WHITE
+        else:
+            self.winner = None  # Draw, or still playing
+        return status
+    
+    def goto_ply(self, ply):
+        """Show the position after ply moves; the moves after it are kept for forward()"""
+        log = self.move_log
+        log.goto(self.board, ply)
+        self.current_player = self.board.side_to_move
+        self.selected_piece = None
+        self.possible_moves = []
+        self.captured_pieces = {"white": [], "black": []}
+        for color, piece_type in log.captured_pieces(ply):
+            self.captured_pieces["white" if color == PieceColor.WHITE else "black"].append(piece_type)
+        self.last_move = unpack_move(log.moves[ply - 1])[:4] if ply else None
+        self.last_capture = bool(ply and log.captures[ply - 1])
+        self._update_status()
+        self.start_engine()
+    
+    def takeback(self):
+        """Take back a move, or back to the user's previous turn when playing the engine"""
+        self.goto_ply(self._user_ply(self.move_log.ply - 1, -1))
+    
+    def forward(self):
+        """Replay the next logged move, or up to the user's next turn when playing the engine"""
+        self.goto_ply(self._user_ply(self.move_log.ply + 1, 1))
+    
+    def _user_ply(self, ply, step):
+        # The engine would just play again on its own turn, so step past it
+        log = self.move_log
+        if self.engine_color is not None and 0 < ply < len(log) and log.side_to_move(ply) == self.engine_color:
+            ply += step
+        return max(0, min(ply, len(log)))
+    
+    def start_engine(self):
+        """Start the engine thinking if it is its turn, otherwise stop it"""
+        if self.worker is not None:
+            self.worker.cancel()
+        self.engine_job = None
+        self.engine_progress = None
+        if self.engine_color != self.current_player or self.game_over:
+            return
+        if self.worker is None:
+            # engine imports this module, so it can only be imported here
+            from engine import EngineWorker
+            self.worker = EngineWorker(
+                lambda job, move, result: post_user_event("engine_move", job=job, move=move),
+                lambda job, info: post_user_event("engine_progress", job=job, depth=info.depth, score=info.score),
+                self.think_time_ms, book=self.book)
+        self.engine_job = self.worker.start(self.board.to_fen())
+        self.engine_started = time.perf_counter()
+    
+    def _on_engine_move(self, event):
+        # Results of cancelled or superseded searches may still be in the queue
+        if event.job != self.engine_job:
+            return
+        self.engine_job = None
+        self.engine_progress = None
+        if event.move:
+            self.make_move(uci_to_move(event.move))
+    
+    def _on_engine_progress(self, event):
+        if event.job == self.engine_job:
+            self.engine_progress = (event.depth, event.score)
+    
+    def engine_status(self):
+        """Get (depth, score, seconds thinking) while the engine thinks, else None
+
+        depth and score are None until the first iteration completes.
+        """
+        if self.engine_job is None:
+            return None
+        depth, score = self.engine_progress or (None, None)
+        return depth, score, time.perf_counter() - self.engine_started
+    
+    def handle_user_event(self, event):
+        """Pass a USER_EVENT from background work to the handler registered for its kind"""
+        handler = self.event_handlers.get(event.kind)
+        if handler:
+            handler(event)
+    
+    def wake_timeout(self):
+        """Milliseconds the main loop may sleep without events, 0 to sleep until the next one"""
+        # Keep the thinking time in the status bar moving
+        return PROGRESS_TICK_MS if self.engine_job is not None else 0
+    
+    def draw(self):
+        """Draw the game, updating only the parts of the screen that changed"""
+        if self.renderer is None:
+            self.renderer = Renderer(screen)
+        self.renderer.draw(self)
+
+class Renderer:
+    """Draws a ChessGame, repainting only what changed since the last frame
+
+    The empty board, piece glyphs and text are rendered once and reused.
+    Every frame, what each square should show (piece and highlights) is
+    compared with the previous frame, only differing squares are repainted,
+    and only their rects are passed to pygame.display.update.
+    """
+    
+    def __init__(self, surface):
+        self.surface = surface
+        self.piece_font = pygame.font.Font(None, SQUARE_SIZE - 10)
+        self.fonts = {size: pygame.font.Font(None, size) for size in (24, 28, 36)}
+        self.board_surface = self._render_board()
+        self.glyphs = {}
+        self.texts = {}
+        # What was drawn last frame
+        self.squares = [None] * 64
+        self.banner = None
+        self.status = None
+        self.full_redraw = True
+    
+    def invalidate(self):
+        """Repaint the whole window on the next frame, e.g. after it was exposed"""
+        self.full_redraw = True
+    
+    def _render_board(self):
+        """Draw the empty chessboard once"""
+        board_surface = pygame.Surface((8 * SQUARE_SIZE, 8 * SQUARE_SIZE))
         for row in range(8):
             for col in range(8):
                 rect = pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
                 color = LIGHT_GRAY if (row + col) % 2 == 0 else DARK_GRAY
-                pygame.draw.rect(screen, color, rect)
+                pygame.draw.rect(board_surface, color, rect)
+        return board_surface
     
-    def draw_pieces(self):
-        """Draw all pieces on the board"""
-        font = pygame.font.Font(None, SQUARE_SIZE - 10)
-        for row in range(8):
-            for col in range(8):
-                piece = self.board.get_piece_at(row, col)
-                if piece:
-                    text = font.render(piece.symbol, True, WHITE if piece.color == PieceColor.BLACK else BLACK)
-                    text_rect = text.get_rect(center=(col * SQUARE_SIZE + SQUARE_SIZE // 2, row * SQUARE_SIZE + SQUARE_SIZE // 2))
-                    screen.blit(text, text_rect)
-    
-    def draw_highlights(self):
-        """Highlight selected piece and possible moves"""
-        if self.selected_piece:
-            row, col = self.selected_piece
-            rect = pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
-            pygame.draw.rect(screen, GREEN, rect, 3)
-            
-            # Highlight possible moves
-            for move_row, move_col in self.possible_moves:
-                center_x = move_col * SQUARE_SIZE + SQUARE_SIZE // 2
-                center_y = move_row * SQUARE_SIZE + SQUARE_SIZE // 2
-                pygame.draw.circle(screen, YELLOW, (center_x, center_y), 5)
-        
-        # Highlight king if in check
-        if self.in_check:
-            king_pos = self.board.find_king(self.current_player)
-            if king_pos:
-                row, col = king_pos
-                rect = pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
-                pygame.draw.rect(screen, RED, rect, 4)
+    def _glyph(self, color, piece_type):
+        """Get the rendered letter of a piece"""
+        glyph = self.glyphs.get((color, piece_type))
+        if glyph is None:
+            glyph = self.piece_font.render(PIECE_SYMBOLS[piece_type], True, WHITE if color == PieceColor.BLACK else BLACK)
+            self.glyphs[(color, piece_type)] = glyph
+        return glyph
     
-    def draw(self):
-        """Draw the entire game"""
-        # Clear screen
-        screen.fill(BLACK)
-        
-        # Draw board and pieces
-        self.draw_board()
-        self.draw_pieces()
-        self.draw_highlights()
+    def _text(self, text, size, color):
+        """Get a rendered line of text"""
+        key = (text, size, color)
+        surface = self.texts.get(key)
+        if surface is None:
+            surface = self.fonts[size].render(text, True, color)
+            # Status bar text changes over a game, so don't keep every version
+            if len(self.texts) > 256:
+                self.texts.clear()
+            self.texts[key] = surface
+        return surface
+    
+    def draw(self, game):
+        """Draw the game and update the changed parts of the display"""
+        dirty = []
+        if self.full_redraw:
+            self.surface.fill(BLACK)
+            self.squares = [None] * 64
+            self.banner = self.status = None
         
-        # Draw status bar
-        self.draw_status_bar()
+        # Game end or check message, drawn on top of the board
+        banner = self._banner(game)
+        if banner != self.banner:
+            # Squares under the old and new message need repainting
+            for old_or_new in (self.banner, banner):
+                if old_or_new:
+                    self._forget_squares(old_or_new[2])
         
-        font = pygame.font.Font(None, 36)
+        check_square = game.board.find_king(game.current_player) if game.game_status().in_check else None
+        moves = set(game.possible_moves)
+        threatened = game.board.threatened_squares(game.current_player) if game.show_threats else ()
+        for row in range(8):
+            for col in range(8):
+                piece = game.board.get_piece_at(row, col)
+                key = ((piece.color, piece.piece_type) if piece else None,
+                       (row, col) == game.selected_piece, (row, col) in moves, (row, col) == check_square,
+                       row * 8 + col in threatened)
+                if key != self.squares[row * 8 + col]:
+                    self.squares[row * 8 + col] = key
+                    dirty.append(self._draw_square(row, col, key))
         
-        # Draw game end messages
-        if self.game_over:
-            if self.winner:
-                winner_name = "White" if self.winner == PieceColor.WHITE else "Black"
-                game_text = font.render(f"CHECKMATE! {winner_name} wins!", True, RED)
-            else:
-                game_text = font.render("STALEMATE! Game is a draw.", True, YELLOW)
-            
-            text_rect = game_text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
-            # Draw semi-transparent background
-            bg_rect = text_rect.inflate(40, 40)
-            pygame.draw.rect(screen, BLACK, bg_rect)
-            screen.blit(game_text, text_rect)
+        if banner and (banner != self.banner or any(banner[2].colliderect(rect) for rect in dirty)):
+            self._draw_banner(banner)
+            dirty.append(banner[2])
+        self.banner = banner
         
-        # Draw check status
-        elif self.in_check:
-            player_name = "White" if self.current_player == PieceColor.WHITE else "Black"
-            check_text = font.render(f"{player_name} is in CHECK!", True, RED)
-            screen.blit(check_text, (10, 10))
+        thinking = game.engine_status()
+        if thinking:
+            # Redraw the progress indicator every tenth of a second, not every frame
+            depth, score, seconds = thinking
+            thinking = (depth, score, int(seconds * 10), min(seconds * 1000 / game.think_time_ms, 1.0))
+        instrumentation = game.instrumentation
+        overlay = instrumentation.overlay_text() if instrumentation and instrumentation.enabled else None
+        if game.instrument_message:
+            overlay = game.instrument_message + ("  " + overlay if overlay else "")
+        status = (game.current_player, (game.move_log.ply, len(game.move_log)),
+                  tuple(game.captured_pieces["white"]), tuple(game.captured_pieces["black"]), thinking, overlay)
+        if status != self.status:
+            self.status = status
+            dirty.append(self._draw_status_bar(status))
         
-        pygame.display.flip()
+        if self.full_redraw:
+            pygame.display.flip()
+            self.full_redraw = False
+        elif dirty:
+            pygame.display.update(dirty)
+        return dirty
+    
+    def _forget_squares(self, rect):
+        """Mark the squares under a rect as needing a repaint"""
+        for row in range(max(rect.top // SQUARE_SIZE, 0), min((rect.bottom - 1) // SQUARE_SIZE, 7) + 1):
+            for col in range(max(rect.left // SQUARE_SIZE, 0), min((rect.right - 1) // SQUARE_SIZE, 7) + 1):
+                self.squares[row * 8 + col] = None
+    
+    def _draw_square(self, row, col, key):
+        """Repaint one square with its piece and highlights"""
+        piece, selected, possible_move, in_check, threatened = key
+        rect = pygame.Rect(col * SQUARE_SIZE, row * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
+        self.surface.blit(self.board_surface, rect, rect)
+        if piece:
+            glyph = self._glyph(*piece)
+            self.surface.blit(glyph, glyph.get_rect(center=rect.center))
+        if threatened:
+            pygame.draw.rect(self.surface, ORANGE, rect.inflate(-6, -6), 2)
+        if selected:
+            pygame.draw.rect(self.surface, GREEN, rect, 3)
+        if possible_move:
+            pygame.draw.circle(self.surface, YELLOW, rect.center, 5)
+        if in_check:
+            pygame.draw.rect(self.surface, RED, rect, 4)
+        return rect
+    
+    def _banner(self, game):
+        """Get the (text, color, rect, boxed) of the message to show over the board, if any"""
+        if game.game_over:
+            if game.winner:
+                winner_name = "White" if game.winner == PieceColor.WHITE else "Black"
+                text, color = f"CHECKMATE! {winner_name} wins!", RED
+            else:
+                text, color = "STALEMATE! Game is a draw.", YELLOW
+            rect = self._text(text, 36, color).get_rect(center=(WIDTH // 2, HEIGHT // 2)).inflate(40, 40)
+            return text, color, rect, True
+        if game.in_check:
+            player_name = "White" if game.current_player == PieceColor.WHITE else "Black"
+            text = f"{player_name} is in CHECK!"
+            return text, RED, self._text(text, 36, RED).get_rect(topleft=(10, 10)), False
+        return None
     
-    def draw_status_bar(self):
+    def _draw_banner(self, banner):
+        text, color, rect, boxed = banner
+        surface = self._text(text, 36, color)
+        if boxed:
+            pygame.draw.rect(self.surface, BLACK, rect)
+        self.surface.blit(surface, surface.get_rect(center=rect.center))
+    
+    def _draw_status_bar(self, status):
         """Draw the status bar with game information and captured pieces"""
-        # Status bar background
+        current_player, (ply, logged), white_captured, black_captured, thinking, overlay = status
         bar_rect = pygame.Rect(0, HEIGHT, WIDTH, STATUS_BAR_HEIGHT)
-        pygame.draw.rect(screen, DARK_BLUE, bar_rect)
-        pygame.draw.line(screen, BLUE, (0, HEIGHT), (WIDTH, HEIGHT), 2)
-        
-        font_small = pygame.font.Font(None, 24)
-        font_normal = pygame.font.Font(None, 28)
-        
-        # Current player info
-        current_player_text = f"Current: {'White' if self.current_player == PieceColor.WHITE else 'Black'}"
-        text = font_normal.render(current_player_text, True, WHITE)
-        screen.blit(text, (10, HEIGHT + 10))
-        
-        # Move count
-        move_count_text = f"Moves: {len(self.move_history)}"
-        text = font_small.render(move_count_text, True, WHITE)
-        screen.blit(text, (10, HEIGHT + 45))
-        
-        # Captured white pieces
-        white_captured_text = "White captured: "
-        for piece_type in self.captured_pieces["white"]:
-            symbols = {PieceType.PAWN: 'P', PieceType.ROOK: 'R', PieceType.KNIGHT: 'K', 
-                      PieceType.BISHOP: 'B', PieceType.QUEEN: 'Q', PieceType.KING: 'K'}
-            white_captured_text += symbols[piece_type] + " "
-        text = font_small.render(white_captured_text, True, WHITE)
-        screen.blit(text, (250, HEIGHT + 10))
-        
-        # Captured black pieces
-        black_captured_text = "Black captured: "
-        for piece_type in self.captured_pieces["black"]:
-            symbols = {PieceType.PAWN: 'P', PieceType.ROOK: 'R', PieceType.KNIGHT: 'K', 
-                      PieceType.BISHOP: 'B', PieceType.QUEEN: 'Q', PieceType.KING: 'K'}
-            black_captured_text += symbols[piece_type] + " "
-        text = font_small.render(black_captured_text, True, WHITE)
-        screen.blit(text, (250, HEIGHT + 45))
-
-def main():
-    game = ChessGame()
+        pygame.draw.rect(self.surface, DARK_BLUE, bar_rect)
+        pygame.draw.line(self.surface, BLUE, (0, HEIGHT), (WIDTH, HEIGHT), 2)
+        
+        player_name = "White" if current_player == PieceColor.WHITE else "Black"
+        self.surface.blit(self._text(f"Current: {player_name}", 28, WHITE), (10, HEIGHT + 10))
+        # While browsing back through the game, also show how many moves there are
+        moves_text = f"Moves: {ply}" if ply == logged else f"Moves: {ply}/{logged}"
+        self.surface.blit(self._text(moves_text, 24, WHITE), (10, HEIGHT + 45))
+        
+        white_text = "White captured: " + "".join(PIECE_SYMBOLS[t] + " " for t in white_captured)
+        black_text = "Black captured: " + "".join(PIECE_SYMBOLS[t] + " " for t in black_captured)
+        self.surface.blit(self._text(white_text, 24, WHITE), (250, HEIGHT + 10))
+        self.surface.blit(self._text(black_text, 24, WHITE), (250, HEIGHT + 45))
+        
+        # Engine progress: search depth and score so far, and the share of
+        # the think time used
+        if thinking:
+            depth, score, tenths, fraction = thinking
+            text = f"Thinking {tenths / 10:.1f}s"
+            if depth is not None:
+                text += f"  depth {depth}  score {score / 100:+.2f}"
+            self.surface.blit(self._text(text, 24, YELLOW), (10, HEIGHT + 75))
+            progress_rect = pygame.Rect(250, HEIGHT + 80, WIDTH - 260, 8)
+            pygame.draw.rect(self.surface, BLUE, progress_rect, 1)
+            pygame.draw.rect(self.surface, YELLOW, progress_rect.inflate(-2, -2).clip(
+                pygame.Rect(progress_rect.x, progress_rect.y, int(progress_rect.width * fraction), progress_rect.height)))
+        elif overlay:
+            # Instrumentation shares the bottom line with the engine progress
+            self.surface.blit(self._text(overlay, 24, GREEN), (10, HEIGHT + 75))
+        return bar_rect
+
+def main(argv=None):
+    # Imported here to keep headless imports of the rules fast
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Play chess")
+    parser.add_argument("--engine", choices=["white", "black"], help="let the engine play this color")
+    parser.add_argument("--think-ms", type=int, default=ENGINE_THINK_MS,
+                        help=f"engine think time per move in milliseconds (default {ENGINE_THINK_MS})")
+    parser.add_argument("--book", help="opening book for the engine, built with book.py")
+    parser.add_argument("--instrument", action="store_true",
+                        help="count and time the hot paths from the start (F2 toggles, see instrument.py)")
+    args = parser.parse_args(argv)
+    
+    book = None
+    if args.book:
+        from book import OpeningBook
+        book = OpeningBook(args.book)
+    
+    init_display()
+    engine_color = {"white": PieceColor.WHITE, "black": PieceColor.BLACK}.get(args.engine)
+    game = ChessGame(engine_color=engine_color, think_time_ms=args.think_ms, book=book)
+    if args.instrument:
+        game.handle_instrument_key(pygame.K_F2)
     running = True
     
+    game.draw()
+    game.start_engine()
+    
     while running:
-        for event in pygame.event.get():
+        # Sleep until an event arrives; wake_timeout() is only non-zero while
+        # something on screen changes by itself
+        events = [pygame.event.wait(game.wake_timeout())] + pygame.event.get()
+        for event in events:
             if event.type == pygame.QUIT:
                 running = False
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 game.handle_click(event.pos)
+            elif event.type == pygame.KEYDOWN:
+                game.handle_key(event.key)
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED) and game.renderer:
+                game.renderer.invalidate()
+            elif event.type == USER_EVENT:
+                game.handle_user_event(event)
         
+        # Only the squares and text that changed are repainted
         game.draw()
-        clock.tick(FPS)
     
+    if game.worker:
+        game.worker.cancel()
     pygame.quit()
     sys.exit()
 
@@ -0,0 +1 @@
+# Lets the tests in tests/ import the modules at the top of the repo
@@ -0,0 +1,338 @@
+"""Alpha-beta search engine built on the Board rules.
+
+Searcher runs a negamax alpha-beta search with iterative deepening under a
+millisecond budget, a capture-only quiescence search, and MVV-LVA, killer
+and history move ordering:
+
+    result = Searcher().search(board, time_limit_ms=2000)
+    result.best_move, result.score, result.depth, result.nps
+
+Moves are (from_row, from_col, to_row, to_col) tuples, as produced by
+Board.generate_legal_moves, and scores are in centipawns from the point of
+view of the side to move.
+
+EngineWorker runs searches on a background thread so a GUI stays
+responsive while the engine thinks.
+
+Run this file directly to search the starting position and print per-depth
+statistics.
+"""
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from chess_app import Board, PieceColor, PieceType, move_to_uci, pack_move
+
+PIECE_VALUES = {
+    PieceType.PAWN: 100,
+    PieceType.KNIGHT: 320,
+    PieceType.BISHOP: 330,
+    PieceType.ROOK: 500,
+    PieceType.QUEEN: 900,
+    PieceType.KING: 0,
+}
+
+MATE_SCORE = 100000
+INFINITY = 1000000
+MAX_PLY = 64
+
+# How many nodes to search between clock checks
+TIME_CHECK_INTERVAL = 1024
+
+SearchResult = namedtuple("SearchResult", ["best_move", "score", "depth", "nodes", "time_ms", "nps", "iterations"])
+# Statistics of one completed iterative deepening iteration
+DepthInfo = namedtuple("DepthInfo", ["depth", "best_move", "score", "nodes", "time_ms", "nps"])
+
+
+class SearchTimeout(Exception):
+    """Raised inside the search when the time budget runs out or stop() is called"""
+
+
+def evaluate(board):
+    """Score a position for the side to move: material plus a small centralization bonus"""
+    score = 0
+    for row in range(8):
+        for col in range(8):
+            piece = board.get_piece_at(row, col)
+            if piece:
+                value = PIECE_VALUES[piece.piece_type]
+                if piece.piece_type in (PieceType.KNIGHT, PieceType.BISHOP, PieceType.PAWN):
+                    # Up to 6 points for standing near the center
+                    value += 7 - (abs(2 * row - 7) + abs(2 * col - 7)) // 2
+                score += value if piece.color == PieceColor.WHITE else -value
+    return score if board.side_to_move == PieceColor.WHITE else -score
+
+
+def captured_piece(board, move):
+    """The piece a move takes, or None; en passant takes the pawn beside the target square"""
+    victim = board.get_piece_at(move[2], move[3])
+    if victim is None and move[1] != move[3]:
+        # A pawn changing file onto an empty square captures en passant
+        piece = board.get_piece_at(move[0], move[1])
+        if piece.piece_type == PieceType.PAWN:
+            return board.get_piece_at(move[0], move[3])
+    return victim
+
+
+class Searcher:
+    def __init__(self, evaluate=evaluate):
+        self.evaluate = evaluate
+        self.nodes = 0
+        self.deadline = None
+        self.stop_requested = False
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = {}
+
+    def stop(self):
+        """Ask a running search to return as soon as possible"""
+        self.stop_requested = True
+
+    def search(self, board, max_depth=MAX_PLY, time_limit_ms=None, on_iteration=None):
+        """Search the position for the side to move with iterative deepening
+
+        Stops after max_depth, when time_limit_ms runs out or when stop() is
+        called (even before the search started), and returns the result of
+        the deepest completed iteration. on_iteration, if given, is called
+        with a DepthInfo after every completed depth.
+        """
+        self.nodes = 0
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = {}
+        start = time.perf_counter()
+        self.deadline = start + time_limit_ms / 1000 if time_limit_ms is not None else None
+
+        best_move = None
+        best_score = 0
+        iterations = []
+        for depth in range(1, min(max_depth, MAX_PLY - 1) + 1):
+            depth_start = time.perf_counter()
+            nodes_before = self.nodes
+            try:
+                score, move = self._search_root(board, depth, best_move)
+            except SearchTimeout:
+                break
+            best_move, best_score = move, score
+
+            depth_time = time.perf_counter() - depth_start
+            depth_nodes = self.nodes - nodes_before
+            info = DepthInfo(depth, move, score, depth_nodes, depth_time * 1000,
+                             depth_nodes / depth_time if depth_time > 0 else 0.0)
+            iterations.append(info)
+            if on_iteration:
+                on_iteration(info)
+
+            # No point searching deeper once a forced mate is found or there is no move
+            if move is None or abs(score) >= MATE_SCORE - MAX_PLY:
+                break
+
+        elapsed = time.perf_counter() - start
+        self.stop_requested = False
+        if best_move is None:
+            # Out of time before depth 1 finished: play any legal move
+            best_move = next(iter(board.generate_legal_moves(board.side_to_move)), None)
+        return SearchResult(best_move, best_score, len(iterations), self.nodes, elapsed * 1000,
+                            self.nodes / elapsed if elapsed > 0 else 0.0, iterations)
+
+    def score_move(self, board, move, depth):
+        """Score one root move with a full-window search to the given depth
+
+        Used when root moves are searched independently, e.g. split across
+        processes. The score is from the point of view of the side to move.
+        """
+        self.nodes = 0
+        self.stop_requested = False
+        self.deadline = None
+        board.make_move(*move)
+        try:
+            return -self._negamax(board, depth - 1, -INFINITY, INFINITY, 1)
+        finally:
+            board.unmake_move()
+
+    def _search_root(self, board, depth, previous_best):
+        moves = self._order_moves(board, list(board.generate_legal_moves(board.side_to_move)), 0, previous_best)
+        if not moves:
+            return self._terminal_score(board, 0), None
+
+        alpha, beta = -INFINITY, INFINITY
+        best_move = moves[0]
+        for move in moves:
+            board.make_move(*move)
+            try:
+                score = -self._negamax(board, depth - 1, -beta, -alpha, 1)
+            finally:
+                board.unmake_move()
+            if score > alpha:
+                alpha, best_move = score, move
+        return alpha, best_move
+
+    def _negamax(self, board, depth, alpha, beta, ply):
+        self._count_node()
+        if depth <= 0:
+            return self._quiescence(board, alpha, beta, ply)
+
+        moves = list(board.generate_legal_moves(board.side_to_move))
+        if not moves:
+            return self._terminal_score(board, ply)
+
+        for move in self._order_moves(board, moves, ply):
+            capture = captured_piece(board, move) is not None
+            board.make_move(*move)
+            try:
+                score = -self._negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                board.unmake_move()
+            if score >= beta:
+                if not capture:
+                    self._store_killer(move, ply)
+                    key = (board.side_to_move, move)
+                    self.history[key] = self.history.get(key, 0) + depth * depth
+                return beta
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _quiescence(self, board, alpha, beta, ply):
+        """Search captures only, so the evaluation is never taken mid-exchange"""
+        # Mate and stalemate aren't in the evaluation, so a position without
+        # legal moves gets its terminal score before standing pat
+        stand_pat = self.evaluate(board)
+        if stand_pat >= beta:
+            return beta if board.has_legal_moves(board.side_to_move) else self._terminal_score(board, ply)
+        moves = list(board.generate_legal_moves(board.side_to_move))
+        if not moves:
+            return self._terminal_score(board, ply)
+        if stand_pat > alpha:
+            alpha = stand_pat
+        if ply >= MAX_PLY - 1:
+            return alpha
+
+        captures = [move for move in moves if captured_piece(board, move) is not None]
+        for move in self._order_moves(board, captures, ply):
+            self._count_node()
+            board.make_move(*move)
+            try:
+                score = -self._quiescence(board, -beta, -alpha, ply + 1)
+            finally:
+                board.unmake_move()
+            if score >= beta:
+                return beta
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def _terminal_score(self, board, ply):
+        """Score a position with no legal moves: mated (prefer slower mates) or stalemate"""
+        if board.is_king_in_check(board.side_to_move):
+            return -MATE_SCORE + ply
+        return 0
+
+    def _order_moves(self, board, moves, ply, first=None):
+        """Sort moves: previous best, captures by MVV-LVA, killers, then history
+
+        Ties go to the lowest move code, so the search doesn't depend on the
+        order the board generated the moves in (Board and BitBoard differ).
+        """
+        killers = self.killers[ply] if ply < MAX_PLY else (None, None)
+        color = board.side_to_move
+
+        def priority(move):
+            if move == first:
+                return 1 << 30
+            victim = captured_piece(board, move)
+            if victim:
+                attacker = board.get_piece_at(move[0], move[1])
+                # Most valuable victim first, least valuable attacker breaks ties
+                return (1 << 24) + PIECE_VALUES[victim.piece_type] * 16 - PIECE_VALUES[attacker.piece_type] // 100
+            if move == killers[0]:
+                return 1 << 22
+            if move == killers[1]:
+                return (1 << 22) - 1
+            return self.history.get((color, move), 0)
+
+        return sorted(moves, key=lambda move: (priority(move), -pack_move(move)), reverse=True)
+
+    def _store_killer(self, move, ply):
+        killers = self.killers[ply]
+        if killers[0] != move:
+            killers[1] = killers[0]
+            killers[0] = move
+
+    def _count_node(self):
+        self.nodes += 1
+        if self.stop_requested:
+            raise SearchTimeout()
+        if self.deadline is not None and self.nodes % TIME_CHECK_INTERVAL == 0 and time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+
+
+class EngineWorker:
+    """Searches positions on a background thread
+
+    start() snapshots the position as a FEN string, so the caller's board
+    can change while the search runs. Progress and results are passed to
+    the callbacks on the worker thread, tagged with the job number start()
+    returned, and moves are given in UCI notation; a GUI forwards them to
+    its own thread with chess_app.post_user_event. A cancelled search never
+    reports a result. With a book (a book.OpeningBook), positions in the
+    book are answered with a weighted book move instead of a search, with
+    None as the search result.
+    """
+    
+    def __init__(self, on_result, on_progress=None, think_time_ms=2000, max_depth=MAX_PLY, book=None):
+        self.on_result = on_result
+        self.on_progress = on_progress
+        self.think_time_ms = think_time_ms
+        self.max_depth = max_depth
+        self.book = book
+        self.job = 0
+        self._searcher = None
+    
+    def start(self, fen):
+        """Cancel any running search, start searching the position and return the job number"""
+        self.cancel()
+        self.job += 1
+        self._searcher = Searcher()
+        threading.Thread(target=self._run, args=(self.job, self._searcher, fen), daemon=True).start()
+        return self.job
+    
+    def cancel(self):
+        """Stop the running search without reporting its result"""
+        if self._searcher is not None:
+            self._searcher.stop()
+            self._searcher = None
+    
+    def _run(self, job, searcher, fen):
+        board = Board()
+        board.load_fen(fen)
+        if self.book is not None:
+            move = self.book.choose(board)
+            if move is not None:
+                if searcher is self._searcher:
+                    self.on_result(job, move_to_uci(move), None)
+                return
+        
+        def progress(info):
+            if self.on_progress and searcher is self._searcher:
+                self.on_progress(job, info)
+        
+        result = searcher.search(board, self.max_depth, self.think_time_ms, on_iteration=progress)
+        if searcher is self._searcher:
+            self.on_result(job, move_to_uci(result.best_move) if result.best_move else None, result)
+
+
+def main():
+    time_limit_ms = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    board = Board()
+
+    def report(info):
+        print(f"depth {info.depth:2}  score {info.score:6}  nodes {info.nodes:8}  "
+              f"time {info.time_ms:8.1f}ms  nps {info.nps:8.0f}  best {info.best_move}")
+
+    result = Searcher().search(board, time_limit_ms=time_limit_ms, on_iteration=report)
+    print(f"bestmove {result.best_move} score {result.score} depth {result.depth} "
+          f"nodes {result.nodes} time {result.time_ms:.0f}ms nps {result.nps:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,375 @@
+"""Position evaluation with piece-square tables, mobility and pawn structure.
+
+evaluate(board) scores one position in plain Python. evaluate_batch()
+scores many positions at once with NumPy, given the arrays made by
+encode_positions(). The two use the same terms, so they always return
+the same scores:
+
+    scores = evaluate_batch(*encode_positions(boards))
+
+- material and piece-square tables (the tables are for white, with row 0
+  being rank 8, and are mirrored for black)
+- mobility: squares each knight, bishop, rook and queen can move to,
+  ignoring pins
+- pawn structure: doubled, isolated and passed pawns
+
+Scores are in centipawns for the side to move, like engine.evaluate, so
+evaluate can be passed to engine.Searcher(evaluate=...).
+
+Run this file to check that both versions agree on seeded random positions
+and compare their speed:
+
+    python evaluation.py [positions]
+"""
+import random
+import sys
+import time
+
+import numpy as np
+
+from chess_app import KNIGHT_OFFSETS, Board, PieceColor, PieceType
+
+PIECE_VALUES = {
+    PieceType.PAWN: 100,
+    PieceType.KNIGHT: 320,
+    PieceType.BISHOP: 330,
+    PieceType.ROOK: 500,
+    PieceType.QUEEN: 900,
+    PieceType.KING: 0,
+}
+
+# From the simplified evaluation function on the Chess Programming Wiki
+PIECE_SQUARE_TABLES = {
+    PieceType.PAWN: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ],
+    PieceType.KNIGHT: [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ],
+    PieceType.BISHOP: [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ],
+    PieceType.ROOK: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0,
+    ],
+    PieceType.QUEEN: [
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20,
+    ],
+    PieceType.KING: [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20,
+    ],
+}
+
+# Centipawns per square a piece can move to
+MOBILITY_WEIGHTS = {PieceType.KNIGHT: 4, PieceType.BISHOP: 5, PieceType.ROOK: 2, PieceType.QUEEN: 1}
+DOUBLED_PAWN_PENALTY = 15
+ISOLATED_PAWN_PENALTY = 12
+# Bonus for a passed pawn by the number of ranks it has advanced (0-5)
+PASSED_PAWN_BONUS = [5, 10, 20, 35, 60, 100]
+
+ORTHOGONAL = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+DIAGONAL = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+SLIDER_DIRECTIONS = {
+    PieceType.BISHOP: DIAGONAL,
+    PieceType.ROOK: ORTHOGONAL,
+    PieceType.QUEEN: ORTHOGONAL + DIAGONAL,
+}
+
+
+def evaluate(board):
+    """Score one position for the side to move"""
+    pawn_rows = {PieceColor.WHITE: [[] for _ in range(8)], PieceColor.BLACK: [[] for _ in range(8)]}
+    score = 0
+    for row in range(8):
+        for col in range(8):
+            piece = board.get_piece_at(row, col)
+            if not piece:
+                continue
+            # Black reads the white tables upside down
+            table_row = row if piece.color == PieceColor.WHITE else 7 - row
+            value = PIECE_VALUES[piece.piece_type] + PIECE_SQUARE_TABLES[piece.piece_type][table_row * 8 + col]
+            if piece.piece_type in MOBILITY_WEIGHTS:
+                value += MOBILITY_WEIGHTS[piece.piece_type] * _mobility(board, piece, row, col)
+            elif piece.piece_type == PieceType.PAWN:
+                pawn_rows[piece.color][col].append(row)
+            score += value if piece.color == PieceColor.WHITE else -value
+    score += _pawn_structure(pawn_rows[PieceColor.WHITE], pawn_rows[PieceColor.BLACK], PieceColor.WHITE)
+    score -= _pawn_structure(pawn_rows[PieceColor.BLACK], pawn_rows[PieceColor.WHITE], PieceColor.BLACK)
+    return score if board.side_to_move == PieceColor.WHITE else -score
+
+
+def _mobility(board, piece, row, col):
+    """Count the empty or enemy squares a knight or slider can move to"""
+    count = 0
+    if piece.piece_type == PieceType.KNIGHT:
+        for dr, dc in KNIGHT_OFFSETS:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                target = board.get_piece_at(r, c)
+                if not target or target.color != piece.color:
+                    count += 1
+        return count
+    for dr, dc in SLIDER_DIRECTIONS[piece.piece_type]:
+        r, c = row + dr, col + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            target = board.get_piece_at(r, c)
+            if target:
+                if target.color != piece.color:
+                    count += 1
+                break
+            count += 1
+            r, c = r + dr, c + dc
+    return count
+
+
+def _pawn_structure(own, enemy, color):
+    """Score doubled, isolated and passed pawns; own and enemy list pawn rows by file"""
+    score = 0
+    for col in range(8):
+        rows = own[col]
+        if not rows:
+            continue
+        score -= DOUBLED_PAWN_PENALTY * (len(rows) - 1)
+        neighbours = [c for c in (col - 1, col + 1) if 0 <= c < 8]
+        if not any(own[c] for c in neighbours):
+            score -= ISOLATED_PAWN_PENALTY * len(rows)
+        blockers = [r for c in neighbours + [col] for r in enemy[c]]
+        for row in rows:
+            # Passed: no enemy pawn ahead on this or an adjacent file
+            if color == PieceColor.WHITE and all(r >= row for r in blockers):
+                score += PASSED_PAWN_BONUS[6 - row]
+            elif color == PieceColor.BLACK and all(r <= row for r in blockers):
+                score += PASSED_PAWN_BONUS[row - 1]
+    return score
+
+
+# Tables for the vectorized version, indexed by piece code (PieceType.value,
+# 0 for an empty square) and square
+_VALUES = np.array([0] + [PIECE_VALUES[t] for t in PieceType], dtype=np.int32)
+_PST = np.zeros((7, 64), dtype=np.int32)
+for _piece_type, _table in PIECE_SQUARE_TABLES.items():
+    _PST[_piece_type.value] = _table
+# Square a black piece reads from the white tables
+_MIRROR = np.array([(7 - sq // 8) * 8 + sq % 8 for sq in range(64)])
+_MOBILITY_WEIGHTS = np.zeros(7, dtype=np.int32)
+for _piece_type, _weight in MOBILITY_WEIGHTS.items():
+    _MOBILITY_WEIGHTS[_piece_type.value] = _weight
+_PASSED_BONUS_WHITE = np.array([0] + [PASSED_PAWN_BONUS[6 - row] for row in range(1, 7)] + [0], dtype=np.int32)
+_PASSED_BONUS_BLACK = _PASSED_BONUS_WHITE[::-1].copy()
+
+
+def _knight_targets():
+    """targets[sq] lists the squares a knight on sq jumps to, padded with -1"""
+    targets = np.full((64, 8), -1, dtype=np.int64)
+    for sq in range(64):
+        row, col = divmod(sq, 8)
+        jumps = [(row + dr) * 8 + col + dc for dr, dc in KNIGHT_OFFSETS if 0 <= row + dr < 8 and 0 <= col + dc < 8]
+        targets[sq, :len(jumps)] = jumps
+    return targets
+
+
+def _ray_targets(directions):
+    """targets[d, sq, k] is the square k + 1 steps from sq in direction d, or -1 off the board"""
+    targets = np.full((len(directions), 64, 7), -1, dtype=np.int64)
+    for d, (dr, dc) in enumerate(directions):
+        for sq in range(64):
+            row, col = divmod(sq, 8)
+            for k in range(7):
+                r, c = row + dr * (k + 1), col + dc * (k + 1)
+                if 0 <= r < 8 and 0 <= c < 8:
+                    targets[d, sq, k] = r * 8 + c
+    return targets
+
+
+_KNIGHT_TARGETS = _knight_targets()
+# _RAYS[sq, d, k]: orthogonal directions first, then diagonal
+_RAYS = _ray_targets(ORTHOGONAL + DIAGONAL).transpose(1, 0, 2).copy()
+
+
+def encode_positions(boards):
+    """Encode boards as (squares, side_to_move) arrays for evaluate_batch
+
+    squares[i, row * 8 + col] is the PieceType value of the piece there,
+    negative for black and 0 for empty. side_to_move[i] is 1 for white and
+    -1 for black.
+    """
+    squares = np.zeros((len(boards), 64), dtype=np.int8)
+    side_to_move = np.ones(len(boards), dtype=np.int32)
+    for i, board in enumerate(boards):
+        codes = squares[i]
+        for row in range(8):
+            for col in range(8):
+                piece = board.get_piece_at(row, col)
+                if piece:
+                    value = piece.piece_type.value
+                    codes[row * 8 + col] = value if piece.color == PieceColor.WHITE else -value
+        if board.side_to_move == PieceColor.BLACK:
+            side_to_move[i] = -1
+    return squares, side_to_move
+
+
+def evaluate_batch(squares, side_to_move):
+    """Score every encoded position for its side to move; returns an int32 array"""
+    squares = np.asarray(squares)
+    types = np.abs(squares).astype(np.int64)
+    white = squares > 0
+    black = squares < 0
+    sq = np.arange(64)
+
+    white_values = _VALUES[types] + _PST[types, sq]
+    black_values = _VALUES[types] + _PST[types, _MIRROR]
+    score = (white_values * white).sum(axis=1) - (black_values * black).sum(axis=1)
+
+    score += _batch_mobility(squares, types)
+    score += _batch_pawn_structure(squares == PieceType.PAWN.value, squares == -PieceType.PAWN.value)
+    return (score * side_to_move).astype(np.int32)
+
+
+def _batch_mobility(squares, types):
+    """White's weighted knight and slider mobility minus black's in every position
+
+    Works on the list of knights, bishops, rooks and queens of all the
+    positions rather than on every square, so the cost follows the number
+    of pieces.
+    """
+    positions, piece_squares = np.nonzero(_MOBILITY_WEIGHTS[types])
+    piece_types = types[positions, piece_squares]
+    # Multiplying a target square's code by this makes own pieces positive
+    signs = np.sign(squares[positions, piece_squares])
+    counts = np.zeros(len(positions), dtype=np.int64)
+
+    knights = np.flatnonzero(piece_types == PieceType.KNIGHT.value)
+    targets = _KNIGHT_TARGETS[piece_squares[knights]]
+    on_board = targets >= 0
+    codes = squares[positions[knights, None], np.where(on_board, targets, 0)] * signs[knights, None]
+    counts[knights] = (on_board & (codes <= 0)).sum(axis=1)
+
+    sliders = np.flatnonzero(piece_types != PieceType.KNIGHT.value)
+    # Every ray of every slider at once: (sliders, 8 directions, 7 steps)
+    targets = _RAYS[piece_squares[sliders]]
+    on_board = targets >= 0
+    codes = squares[positions[sliders, None, None], np.where(on_board, targets, 0)] * signs[sliders, None, None]
+    # A ray stops at the first piece or the edge; the extra last step always stops it
+    stops = np.concatenate([~on_board | (codes != 0), np.ones(targets.shape[:2] + (1,), dtype=bool)], axis=2)
+    captures = np.concatenate([on_board & (codes < 0), np.zeros(targets.shape[:2] + (1,), dtype=bool)], axis=2)
+    first = stops.argmax(axis=2)
+    ray_counts = first + np.take_along_axis(captures, first[..., None], axis=2)[..., 0]
+    slider_types = piece_types[sliders]
+    queens = slider_types == PieceType.QUEEN.value
+    counts[sliders] = (ray_counts[:, :4].sum(axis=1) * (queens | (slider_types == PieceType.ROOK.value))
+                       + ray_counts[:, 4:].sum(axis=1) * (queens | (slider_types == PieceType.BISHOP.value)))
+
+    weighted = counts * _MOBILITY_WEIGHTS[piece_types] * signs
+    return np.bincount(positions, weights=weighted, minlength=len(squares)).astype(np.int64)
+
+
+def _batch_pawn_structure(white_pawns, black_pawns):
+    """White's pawn structure score minus black's in every position"""
+    white_pawns = white_pawns.reshape(-1, 8, 8)
+    black_pawns = black_pawns.reshape(-1, 8, 8)
+    rows = np.arange(8).reshape(1, 8, 1)
+    score = np.zeros(white_pawns.shape[0], dtype=np.int64)
+
+    # Frontmost enemy pawn of each file, or a row no pawn can be ahead of
+    black_min_row = np.where(black_pawns, rows, 8).min(axis=1)
+    white_max_row = np.where(white_pawns, rows, -1).max(axis=1)
+
+    for pawns, sign, enemy_rows, fill, reduce, bonus in (
+            (white_pawns, 1, black_min_row, 8, np.minimum, _PASSED_BONUS_WHITE),
+            (black_pawns, -1, white_max_row, -1, np.maximum, _PASSED_BONUS_BLACK)):
+        counts = pawns.sum(axis=1)
+        padded = np.pad(counts, ((0, 0), (1, 1)))
+        isolated = (padded[:, :-2] + padded[:, 2:]) == 0
+        structure = -DOUBLED_PAWN_PENALTY * np.maximum(counts - 1, 0).sum(axis=1)
+        structure -= ISOLATED_PAWN_PENALTY * (counts * isolated).sum(axis=1)
+
+        # Nearest enemy pawn over this and the adjacent files
+        padded = np.pad(enemy_rows, ((0, 0), (1, 1)), constant_values=fill)
+        nearest = reduce(reduce(padded[:, :-2], padded[:, 1:-1]), padded[:, 2:])
+        if sign == 1:
+            passed = pawns & (nearest[:, None, :] >= rows)
+        else:
+            passed = pawns & (nearest[:, None, :] <= rows)
+        structure += (passed * bonus.reshape(1, 8, 1)).sum(axis=(1, 2))
+        score += sign * structure
+    return score
+
+
+def self_check(positions=2000, seed=5, max_plies=120):
+    """Compare evaluate and evaluate_batch on seeded random positions; return (positions, mismatches)"""
+    rng = random.Random(seed)
+    boards = []
+    for _ in range(positions):
+        board = Board()
+        for _ in range(rng.randrange(max_plies)):
+            moves = list(board.generate_legal_moves(board.side_to_move))
+            if not moves:
+                break
+            board.make_move(*rng.choice(moves))
+        boards.append(board)
+
+    start = time.perf_counter()
+    scalar = [evaluate(board) for board in boards]
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    squares, side_to_move = encode_positions(boards)
+    encode_time = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = evaluate_batch(squares, side_to_move)
+    batch_time = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(scalar, batch) if a != b)
+    print(f"{'scalar':>8}: {positions} positions in {scalar_time:.3f}s ({positions / scalar_time:,.0f} positions/s)")
+    print(f"{'encode':>8}: {positions} positions in {encode_time:.3f}s ({positions / encode_time:,.0f} positions/s)")
+    print(f"{'batch':>8}: {positions} positions in {batch_time:.3f}s ({positions / batch_time:,.0f} positions/s)")
+    if mismatches:
+        print(f"FAIL: {mismatches} positions score differently")
+    return positions, mismatches
+
+
+if __name__ == "__main__":
+    _, mismatches = self_check(*(int(arg) for arg in sys.argv[1:2]))
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,309 @@
+"""Opt-in instrumentation of the rules and drawing hot paths.
+
+While enabled, the methods in HOT_PATHS count their calls and cumulative
+time (including the methods they call; for the move generator, from the
+call until its last move is taken), and the calls in LATENCY_PATHS also
+record every call's duration in a histogram: one per move played
+(ChessGame.make_move) and one per frame drawn (Renderer.draw). Enabling
+replaces those methods on their classes with timing wrappers and disabling
+puts the originals back, so instrumentation costs nothing while it is off.
+It is process-wide: games on other threads, like the engine's search board,
+are counted too, and the counters are updated under a lock.
+
+A cProfile capture can be started and stopped at any time, independently.
+
+In the GUI, F2 turns instrumentation and its status bar overlay on and
+off, F3 starts and stops a cProfile capture (written to PROFILE_FILE) and
+F4 writes the statistics to STATS_FILE as JSON; the status bar says what
+was written.
+`python chess_app.py --instrument` starts with it on.
+
+From the command line it plays headless random games with instrumentation
+off and then on, and prints the statistics and the overhead:
+
+    python instrument.py [--games N] [--json PATH] [--profile PATH]
+"""
+import argparse
+import bisect
+import cProfile
+import functools
+import inspect
+import json
+import pstats
+import sys
+import threading
+import time
+
+from chess_app import Board, ChessGame, PositionCache, Renderer
+
+# (class, method) pairs that get call counts and cumulative time
+HOT_PATHS = [
+    (Board, "iter_move_codes"),
+    (Board, "_get_legal_king_moves"),
+    (Board, "make_move"),
+    (Board, "unmake_move"),
+    (ChessGame, "game_status"),
+    (Renderer, "_draw_square"),
+    (Renderer, "_draw_banner"),
+    (Renderer, "_draw_status_bar"),
+]
+# Histogram name -> (class, method) whose every call duration is recorded
+LATENCY_PATHS = {
+    "move": (ChessGame, "make_move"),
+    "frame": (Renderer, "draw"),
+}
+# Upper bounds of the histogram buckets in microseconds, 1-2-5 steps up to 1s;
+# the last bucket holds everything slower
+BUCKET_BOUNDS_US = [m * 10 ** e for e in range(7) for m in (1, 2, 5)][:-2]
+
+STATS_FILE = "chess_stats.json"
+PROFILE_FILE = "chess_profile.pstats"
+
+
+class CallStats:
+    __slots__ = ("calls", "seconds")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "seconds": self.seconds,
+            "mean_us": self.seconds / self.calls * 1e6 if self.calls else 0.0,
+        }
+
+
+class Histogram:
+    """Counts of durations in fixed buckets (BUCKET_BOUNDS_US)"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_US) + 1)
+        self.total = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS_US, seconds * 1e6)] += 1
+        self.total += 1
+        self.seconds += seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+
+    def percentile(self, fraction):
+        """Upper bound in microseconds of the bucket holding the given fraction of the durations, or None"""
+        if not self.total:
+            return None
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= fraction * self.total:
+                return BUCKET_BOUNDS_US[index] if index < len(BUCKET_BOUNDS_US) else self.max_seconds * 1e6
+        return self.max_seconds * 1e6
+
+    def to_dict(self):
+        return {
+            "count": self.total,
+            "mean_us": self.seconds / self.total * 1e6 if self.total else 0.0,
+            "max_us": self.max_seconds * 1e6,
+            "p50_us": self.percentile(0.5),
+            "p90_us": self.percentile(0.9),
+            "p99_us": self.percentile(0.99),
+            # Bucket upper bound in microseconds (None for the last) -> count
+            "buckets": [[bound, count] for bound, count in zip(BUCKET_BOUNDS_US + [None], self.counts) if count],
+        }
+
+
+class Instrumentation:
+    def __init__(self, hot_paths=HOT_PATHS, latency_paths=LATENCY_PATHS):
+        self.hot_paths = hot_paths
+        self.latency_paths = latency_paths
+        self.enabled = False
+        self.profiler = None
+        self._originals = {}
+        # Guards the counters, which the engine and UI threads both update
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Zero all counters and histograms"""
+        with self._lock:
+            self.calls = {f"{cls.__name__}.{name}": CallStats()
+                          for cls, name in self.hot_paths + list(self.latency_paths.values())}
+            self.histograms = {name: Histogram() for name in self.latency_paths}
+
+    def enable(self):
+        """Start counting: wrap the hot paths on their classes"""
+        if self.enabled:
+            return
+        targets = [(cls, name, None) for cls, name in self.hot_paths]
+        targets += [(cls, name, histogram) for histogram, (cls, name) in self.latency_paths.items()]
+        for cls, name, histogram in targets:
+            original = cls.__dict__[name]
+            self._originals[cls, name] = original
+            setattr(cls, name, self._wrap(original, f"{cls.__name__}.{name}", histogram))
+        self.enabled = True
+
+    def disable(self):
+        """Stop counting: put the original methods back; the statistics are kept"""
+        for (cls, name), original in self._originals.items():
+            setattr(cls, name, original)
+        self._originals.clear()
+        self.enabled = False
+
+    def toggle(self):
+        """Enable or disable; return whether it is now enabled"""
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+        return self.enabled
+
+    def _wrap(self, func, key, histogram):
+        perf_counter = time.perf_counter
+        instrumentation = self
+        lock = self._lock
+
+        def record(elapsed):
+            with lock:
+                # Looked up on every call so reset() takes effect immediately
+                stats = instrumentation.calls[key]
+                stats.calls += 1
+                stats.seconds += elapsed
+                if histogram:
+                    instrumentation.histograms[histogram].record(elapsed)
+
+        if inspect.isgeneratorfunction(func):
+            # Calling a generator only creates it, so time it until it is done
+            @functools.wraps(func)
+            def timed_generator(*args, **kwargs):
+                start = perf_counter()
+                try:
+                    yield from func(*args, **kwargs)
+                finally:
+                    record(perf_counter() - start)
+            return timed_generator
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(perf_counter() - start)
+        return timed
+
+    def start_profile(self):
+        """Start a cProfile capture of this thread"""
+        if self.profiler is None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stop_profile(self, path=None):
+        """Stop the cProfile capture and return its pstats.Stats, also written to path if given"""
+        if self.profiler is None:
+            return None
+        self.profiler.disable()
+        stats = pstats.Stats(self.profiler)
+        self.profiler = None
+        if path:
+            stats.dump_stats(path)
+        return stats
+
+    def toggle_profile(self, path=PROFILE_FILE):
+        """Start a cProfile capture, or stop the running one and return its statistics"""
+        if self.profiler is None:
+            self.start_profile()
+            return None
+        return self.stop_profile(path)
+
+    def stats(self):
+        """Get the counters and histograms as a JSON-serializable dict"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "calls": {key: stats.to_dict() for key, stats in self.calls.items()},
+                "histograms": {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+            }
+
+    def dump(self, path=STATS_FILE):
+        """Write stats() to a JSON file"""
+        with open(path, "w") as f:
+            json.dump(self.stats(), f, indent=2)
+
+    def overlay_text(self):
+        """One status bar line: median and 99th percentile move and frame times, and move generator calls"""
+        parts = []
+        with self._lock:
+            percentiles = [(name, histogram.percentile(0.5), histogram.percentile(0.99))
+                           for name, histogram in self.histograms.items()]
+            generated = self.calls["Board.iter_move_codes"].calls if "Board.iter_move_codes" in self.calls else 0
+        for name, p50, p99 in percentiles:
+            if p50 is None:
+                parts.append(f"{name} -")
+            else:
+                parts.append(f"{name} {p50 / 1000:g}/{p99 / 1000:g}ms")
+        return "p50/p99 " + "  ".join(parts) + f"  movegen {generated}"
+
+
+# The instrumentation the GUI uses
+instrumentation = Instrumentation()
+
+
+def print_stats(stats, out=sys.stdout):
+    for key, call in sorted(stats["calls"].items(), key=lambda item: -item[1]["seconds"]):
+        if not call["calls"]:
+            continue
+        print(f"{key:>34}: {call['calls']:9} calls {call['seconds'] * 1000:9.1f}ms "
+              f"({call['mean_us']:7.2f}us each)", file=out)
+    for name, histogram in stats["histograms"].items():
+        if histogram["count"]:
+            print(f"{name:>34}: {histogram['count']:9} timed, p50 {histogram['p50_us']}us "
+                  f"p90 {histogram['p90_us']}us p99 {histogram['p99_us']}us max {histogram['max_us']:.0f}us",
+                  file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Instrument headless random games")
+    parser.add_argument("--games", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", metavar="PATH", help="write the statistics to PATH")
+    parser.add_argument("--profile", metavar="PATH", help="also capture a cProfile of the instrumented run")
+    args = parser.parse_args(argv)
+
+    from tournament import play_game, schedule
+    tasks = schedule(args.games, "random", "random", args.seed)
+
+    def play_all():
+        # A fresh status cache, so the second run doesn't find every position cached
+        cache = PositionCache()
+        start = time.perf_counter()
+        for _, white, black, seed in tasks:
+            play_game(white, black, seed, cache=cache)
+        return time.perf_counter() - start
+
+    plain = play_all()
+    instrumentation.enable()
+    if args.profile:
+        instrumentation.start_profile()
+    timed = play_all()
+    if args.profile:
+        instrumentation.stop_profile(args.profile).sort_stats("tottime").print_stats(10)
+    instrumentation.disable()
+
+    stats = instrumentation.stats()
+    print_stats(stats)
+    print(f"{args.games} games in {plain:.2f}s plain, {timed:.2f}s instrumented "
+          f"({timed / plain - 1 if plain > 0 else 0.0:+.0%})")
+    unwrapped = all(cls.__dict__[name].__name__ == name and not hasattr(cls.__dict__[name], "__wrapped__")
+                    for cls, name in HOT_PATHS + list(LATENCY_PATHS.values()))
+    print(f"original methods restored: {unwrapped}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(stats, f, indent=2)
+    return 0 if unwrapped else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""Multi-core perft and root-split search on a process pool.
+
+The position is split into independent subtrees: every root move, or every
+two-move sequence with --split-depth 2. Each subtree is sent to a
+concurrent.futures process pool as a FEN string plus a list of UCI moves,
+so no ChessPiece objects are pickled. Results are merged in move generation
+order, so the output is the same for any number of workers. Unless
+--no-compare is given, the same work is timed on one core too and the
+speedup and efficiency (speedup per worker) are reported. For search that
+is the same independent full-window search of every root move, not the
+engine's iterative deepening, which shares its alpha-beta window between
+root moves and so searches far fewer nodes.
+
+    python parallel.py perft --depth 4 --workers 8
+    python parallel.py search --depth 3 --fen "<fen>"
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from chess_app import START_FEN, Board, move_to_uci, uci_to_move
+from engine import INFINITY, MATE_SCORE, Searcher
+from perft import perft
+
+
+def _load(fen, moves):
+    board = Board()
+    board.load_fen(fen)
+    for text in moves:
+        board.make_move(*uci_to_move(text))
+    return board
+
+
+def _perft_task(fen, moves, depth):
+    return perft(_load(fen, moves), depth)
+
+
+def _search_task(fen, move, depth):
+    board = Board()
+    board.load_fen(fen)
+    searcher = Searcher()
+    score = searcher.score_move(board, uci_to_move(move), depth)
+    return score, searcher.nodes
+
+
+def split_moves(board, split_depth):
+    """List the move sequences (as UCI strings) that reach split_depth plies below the position"""
+    if split_depth == 0:
+        return [[]]
+    lines = []
+    for move in list(board.generate_legal_moves(board.side_to_move)):
+        board.make_move(*move)
+        lines.extend([move_to_uci(move)] + line for line in split_moves(board, split_depth - 1))
+        board.unmake_move()
+    return lines
+
+
+def parallel_perft(fen, depth, workers=None, split_depth=1):
+    """Count perft leaf nodes with subtrees spread over a process pool
+
+    Returns (total nodes, {root move: nodes}) with root moves in move
+    generation order.
+    """
+    board = Board()
+    board.load_fen(fen)
+    split_depth = min(split_depth, depth)
+    lines = split_moves(board, split_depth)
+    # A split at depth 2 makes hundreds of small tasks, so send them a few at a time
+    chunksize = max(1, len(lines) // (4 * (workers or os.cpu_count() or 1)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        counts = list(pool.map(_perft_task, [fen] * len(lines), lines, [depth - split_depth] * len(lines),
+                               chunksize=chunksize))
+
+    divide = {}
+    for line, count in zip(lines, counts):
+        if line:
+            divide[line[0]] = divide.get(line[0], 0) + count
+    return sum(counts), divide
+
+
+def parallel_search(fen, depth, workers=None):
+    """Search every root move to the given depth on a process pool
+
+    Returns (best move, score, nodes). Ties go to the move generated first,
+    so the result doesn't depend on the number of workers or their timing.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return split_search(fen, depth, pool.map)
+
+
+def split_search(fen, depth, map_tasks=map):
+    """Search every root move independently, the tasks run by map_tasks; see parallel_search"""
+    board = Board()
+    board.load_fen(fen)
+    moves = [move_to_uci(move) for move in board.generate_legal_moves(board.side_to_move)]
+    if not moves:
+        return None, -MATE_SCORE if board.is_king_in_check(board.side_to_move) else 0, 0
+    results = list(map_tasks(_search_task, [fen] * len(moves), moves, [depth] * len(moves)))
+
+    best_move, best_score = None, -INFINITY
+    for move, (score, _) in zip(moves, results):
+        if score > best_score:
+            best_move, best_score = move, score
+    return best_move, best_score, sum(nodes for _, nodes in results)
+
+
+def _report(label, elapsed, nodes):
+    nps = nodes / elapsed if elapsed > 0 else 0.0
+    print(f"{label:>12}: {nodes} nodes in {elapsed:.2f}s ({nps:,.0f} nodes/s)")
+
+
+def _report_speedup(single, multi, workers):
+    speedup = single / multi if multi > 0 else 0.0
+    print(f"Speedup: {speedup:.2f}x on {workers} workers, efficiency {speedup / workers:.0%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parallel perft and root-split search")
+    parser.add_argument("mode", choices=["perft", "search"])
+    parser.add_argument("--depth", type=int, default=None, help="depth (default 4 for perft, 3 for search)")
+    parser.add_argument("--fen", default=START_FEN)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--split-depth", type=int, default=1, choices=[1, 2],
+                        help="plies below the root at which perft work is split")
+    parser.add_argument("--no-compare", action="store_true", help="skip timing the single-core path")
+    args = parser.parse_args(argv)
+
+    if args.mode == "perft":
+        depth = args.depth or 4
+        start = time.perf_counter()
+        nodes, _ = parallel_perft(args.fen, depth, args.workers, args.split_depth)
+        multi = time.perf_counter() - start
+        _report(f"{args.workers} workers", multi, nodes)
+        if not args.no_compare:
+            board = Board()
+            board.load_fen(args.fen)
+            start = time.perf_counter()
+            single_nodes = perft(board, depth)
+            single = time.perf_counter() - start
+            _report("1 core", single, single_nodes)
+            if single_nodes != nodes:
+                print(f"Mismatch: single-core counted {single_nodes} nodes")
+                return 1
+            _report_speedup(single, multi, args.workers)
+    else:
+        depth = args.depth or 3
+        start = time.perf_counter()
+        move, score, nodes = parallel_search(args.fen, depth, args.workers)
+        multi = time.perf_counter() - start
+        print(f"bestmove {move} score {score}")
+        _report(f"{args.workers} workers", multi, nodes)
+        if not args.no_compare:
+            start = time.perf_counter()
+            single_move, single_score, single_nodes = split_search(args.fen, depth)
+            single = time.perf_counter() - start
+            _report("1 core", single, single_nodes)
+            if (single_move, single_score, single_nodes) != (move, score, nodes):
+                print(f"Mismatch: single-core found bestmove {single_move} score {single_score}")
+                return 1
+            _report_speedup(single, multi, args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""Perft: count the leaf nodes of the legal move tree to a fixed depth.
+
+Checks move generation against the published counts for the standard
+reference positions and reports nodes per second, so changes to the move
+generator can be judged for both correctness and speed.
+
+    python perft.py                                  # all reference positions, depth 3
+    python perft.py --position kiwipete --depth 4 --divide
+    python perft.py --fen "<fen>" --depth 3 --divide
+    python perft.py --backend bitboard --json perft.json
+    python perft.py --codes                          # move codes in reused buffers
+
+Exits with status 1 if any count differs from the reference.
+"""
+import argparse
+import json
+import sys
+import time
+
+from chess_app import START_FEN, Board, move_buffer, move_to_uci
+
+# (name, FEN, node counts for depth 1, 2, ...) from the Chess Programming Wiki
+REFERENCE_POSITIONS = [
+    ("startpos", START_FEN,
+     [20, 400, 8902, 197281, 4865609, 119060324]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603, 193690690]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624, 11030083]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333, 15833292]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487, 89941194]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594, 164075551]),
+]
+
+
+def make_board(fen, backend="board"):
+    """Set up a position on the requested board backend"""
+    board = Board()
+    board.load_fen(fen)
+    if backend == "bitboard":
+        from bitboard import BitBoard
+        board = BitBoard.from_board(board)
+    return board
+
+
+def perft(board, depth):
+    """Count the leaf nodes of the legal move tree below the position"""
+    if depth == 0:
+        return 1
+    moves = list(board.generate_legal_moves(board.side_to_move))
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        board.make_move(*move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move()
+    return nodes
+
+
+def perft_codes(board, depth, buffers=None):
+    """perft over move codes, with one preallocated move buffer per ply"""
+    if buffers is None:
+        buffers = [move_buffer() for _ in range(depth)]
+    if depth == 0:
+        return 1
+    buffer = buffers[depth - 1]
+    count = board.generate_move_codes(board.side_to_move, buffer)
+    if depth == 1:
+        return count
+    nodes = 0
+    for i in range(count):
+        board.make_move_code(buffer[i])
+        nodes += perft_codes(board, depth - 1, buffers)
+        board.unmake_move()
+    return nodes
+
+
+def divide(board, depth):
+    """Count the leaf nodes below each root move, keyed by the move in UCI notation"""
+    counts = {}
+    for move in list(board.generate_legal_moves(board.side_to_move)):
+        board.make_move(*move)
+        counts[move_to_uci(move)] = perft(board, depth - 1)
+        board.unmake_move()
+    return counts
+
+
+def run(name, fen, depth, expected=None, backend="board", show_divide=False, codes=False):
+    """Run perft on one position and return a JSON-serializable result"""
+    board = make_board(fen, backend)
+    start = time.perf_counter()
+    if show_divide:
+        counts = divide(board, depth)
+        nodes = sum(counts.values())
+    else:
+        counts = None
+        nodes = perft_codes(board, depth) if codes else perft(board, depth)
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "name": name,
+        "fen": fen,
+        "backend": backend,
+        "codes": codes,
+        "depth": depth,
+        "nodes": nodes,
+        "expected": expected,
+        "passed": expected is None or nodes == expected,
+        "seconds": elapsed,
+        "nps": nodes / elapsed if elapsed > 0 else 0.0,
+    }
+    if counts is not None:
+        result["divide"] = counts
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count and time legal move generation")
+    parser.add_argument("--depth", type=int, default=3, help="search depth (default 3)")
+    parser.add_argument("--position", action="append",
+                        help="reference position to run (repeatable, default all): "
+                             + ", ".join(name for name, _, _ in REFERENCE_POSITIONS))
+    parser.add_argument("--fen", help="run a custom position instead of the reference set")
+    parser.add_argument("--divide", action="store_true", help="print node counts per root move")
+    parser.add_argument("--backend", choices=["board", "bitboard"], default="board")
+    parser.add_argument("--codes", action="store_true",
+                        help="generate moves as 16-bit codes into reused buffers instead of tuples")
+    parser.add_argument("--json", metavar="PATH", help="write machine-readable results to PATH")
+    args = parser.parse_args(argv)
+
+    if args.fen:
+        jobs = [("custom", args.fen, None)]
+    else:
+        positions = [p for p in REFERENCE_POSITIONS if not args.position or p[0] in args.position]
+        if args.position and len(positions) != len(set(args.position)):
+            parser.error("unknown position name")
+        jobs = [(name, fen, counts[args.depth - 1] if args.depth <= len(counts) else None)
+                for name, fen, counts in positions]
+
+    results = []
+    for name, fen, expected in jobs:
+        result = run(name, fen, args.depth, expected, args.backend, args.divide, args.codes)
+        results.append(result)
+        if args.divide:
+            for move, count in sorted(result["divide"].items()):
+                print(f"  {move}: {count}")
+        status = "" if expected is None else ("  ok" if result["passed"] else f"  FAIL (expected {expected})")
+        print(f"{name:>10} depth {args.depth}: {result['nodes']:>10} nodes "
+              f"in {result['seconds']:7.2f}s ({result['nps']:>9,.0f} nodes/s){status}")
+
+    total_nodes = sum(r["nodes"] for r in results)
+    total_seconds = sum(r["seconds"] for r in results)
+    total_nps = total_nodes / total_seconds if total_seconds > 0 else 0.0
+    print(f"{'total':>10}: {total_nodes} nodes in {total_seconds:.2f}s ({total_nps:,.0f} nodes/s)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"backend": args.backend, "codes": args.codes, "depth": args.depth, "results": results,
+                       "total_nodes": total_nodes, "total_seconds": total_seconds,
+                       "nps": total_nps}, f, indent=2)
+
+    return 0 if all(r["passed"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,364 @@
+"""PGN reading and writing, SAN notation and bulk replay validation.
+
+read_games() is a generator over a PGN file object that holds one game in
+memory at a time, so archives of any size can be streamed. Moves are
+parsed from SAN by matching them against Board.generate_legal_moves and
+replayed on a Board; game_to_pgn() turns a ChessGame's move_history back
+into PGN.
+
+    python pgn.py validate games.pgn [--workers 8]   # replay every game, report games/s
+    python pgn.py generate games.pgn [--games 1000]  # write seeded random games
+
+validate exits with status 1 if any game contains an illegal or
+unreadable move.
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from chess_app import FEN_PIECE_LETTERS, FILES, START_FEN, Board, PieceColor, PieceType, parse_square, square_name
+
+# headers is a dict of tag pairs, moves a list of SAN strings
+PgnGame = namedtuple("PgnGame", ["headers", "moves", "result"])
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+# Written first and in this order, as the PGN standard asks
+SEVEN_TAG_ROSTER = ("Event", "Site", "Date", "Round", "White", "Black", "Result")
+
+SAN_PIECE_TYPES = {'N': PieceType.KNIGHT, 'B': PieceType.BISHOP, 'R': PieceType.ROOK,
+                   'Q': PieceType.QUEEN, 'K': PieceType.KING}
+
+HEADER_RE = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+# Comments, NAGs, variation brackets, or any other run of characters
+TOKEN_RE = re.compile(r"\{[^}]*\}|;[^\n]*|\$\d+|[()]|[^\s(){};]+")
+MOVE_NUMBER_RE = re.compile(r"^\d+\.+")
+SAN_RE = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+
+# Games per task sent to a replay worker
+BATCH_SIZE = 64
+
+
+def move_to_san(board, move, legal_moves=None):
+    """Format a legal move for the side to move in Standard Algebraic Notation
+
+    A pawn move to the last rank without a promotion piece is a queen
+    promotion, as Board.make_move plays it.
+    """
+    if legal_moves is None:
+        legal_moves = list(board.generate_legal_moves(board.side_to_move))
+    from_row, from_col, to_row, to_col = move[:4]
+    piece = board.get_piece_at(from_row, from_col)
+    promotion = move[4] if len(move) > 4 else None
+
+    if piece.piece_type == PieceType.KING and abs(to_col - from_col) == 2:
+        san = "O-O" if to_col == 6 else "O-O-O"
+    elif piece.piece_type == PieceType.PAWN:
+        san = FILES[from_col] + "x" if from_col != to_col else ""
+        san += square_name(to_row, to_col)
+        if to_row in (0, 7):
+            promotion = promotion or PieceType.QUEEN
+            san += "=" + FEN_PIECE_LETTERS[promotion].upper()
+    else:
+        # Name the file, the rank or both if another piece of the same type can go there too
+        others = [m for m in legal_moves if m[2:4] == (to_row, to_col) and m[:2] != (from_row, from_col)
+                  and board.get_piece_at(m[0], m[1]).piece_type == piece.piece_type]
+        san = FEN_PIECE_LETTERS[piece.piece_type].upper()
+        if others:
+            if all(m[1] != from_col for m in others):
+                san += FILES[from_col]
+            elif all(m[0] != from_row for m in others):
+                san += str(8 - from_row)
+            else:
+                san += square_name(from_row, from_col)
+        if board.get_piece_at(to_row, to_col):
+            san += "x"
+        san += square_name(to_row, to_col)
+
+    board.make_move(from_row, from_col, to_row, to_col, promotion)
+    if board.is_king_in_check(board.side_to_move):
+        san += "#" if not board.has_legal_moves(board.side_to_move) else "+"
+    board.unmake_move()
+    return san
+
+
+def san_to_move(board, san, legal_moves=None):
+    """Find the legal move for the side to move that a SAN string describes"""
+    if legal_moves is None:
+        legal_moves = list(board.generate_legal_moves(board.side_to_move))
+    text = san.rstrip("+#!?")
+    if text.replace("0", "O") in ("O-O", "O-O-O"):
+        row = 7 if board.side_to_move == PieceColor.WHITE else 0
+        target = (row, 4, row, 6 if text.replace("0", "O") == "O-O" else 2)
+        king = board.get_piece_at(row, 4)
+        if target in legal_moves and king.piece_type == PieceType.KING:
+            return target
+        raise ValueError(f"Illegal castling: {san!r}")
+
+    match = SAN_RE.match(text)
+    if not match:
+        raise ValueError(f"Invalid SAN: {san!r}")
+    letter, from_file, from_rank, target, promotion = match.groups()
+    piece_type = SAN_PIECE_TYPES[letter] if letter else PieceType.PAWN
+    to_row, to_col = parse_square(target)
+    promotion = SAN_PIECE_TYPES[promotion] if promotion else None
+
+    candidates = []
+    for move in legal_moves:
+        if move[2] != to_row or move[3] != to_col:
+            continue
+        if board.get_piece_at(move[0], move[1]).piece_type != piece_type:
+            continue
+        if from_file and move[1] != FILES.index(from_file):
+            continue
+        if from_rank and move[0] != 8 - int(from_rank):
+            continue
+        if (move[4] if len(move) > 4 else None) != promotion:
+            continue
+        candidates.append(move)
+    if len(candidates) != 1:
+        raise ValueError(f"{'Ambiguous' if candidates else 'Illegal'} move: {san!r}")
+    return candidates[0]
+
+
+def read_games(stream):
+    """Yield a PgnGame for every game in a PGN text stream, reading one game at a time"""
+    headers = {}
+    movetext = []
+    for line in stream:
+        stripped = line.strip()
+        # Tag pairs start the next game once the current one has moves
+        if stripped.startswith("[") and not _in_comment(movetext):
+            if movetext:
+                yield _make_game(headers, movetext)
+                headers, movetext = {}, []
+            match = HEADER_RE.match(stripped)
+            if match:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+        elif stripped and not stripped.startswith("%"):
+            movetext.append(stripped)
+    if headers or movetext:
+        yield _make_game(headers, movetext)
+
+
+def _in_comment(movetext):
+    """Check if the movetext so far ends inside an unclosed {comment}"""
+    text = "\n".join(movetext)
+    return text.rfind("{") > text.rfind("}")
+
+
+def _make_game(headers, movetext):
+    moves = []
+    result = headers.get("Result", "*")
+    depth = 0
+    for token in TOKEN_RE.findall("\n".join(movetext)):
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        elif depth or token[0] in "{;$":
+            continue
+        elif token in RESULTS:
+            result = token
+        else:
+            # Move numbers may be glued to the move, as in 12...Nf6
+            token = MOVE_NUMBER_RE.sub("", token)
+            if token:
+                moves.append(token)
+    return PgnGame(headers, moves, result)
+
+
+def replay(game):
+    """Play a PgnGame's moves on a Board and return the final position
+
+    Raises ValueError naming the first move that is not legal.
+    """
+    board = Board()
+    if "FEN" in game.headers:
+        board.load_fen(game.headers["FEN"])
+    for ply, san in enumerate(game.moves):
+        try:
+            move = san_to_move(board, san)
+        except ValueError as error:
+            raise ValueError(f"ply {ply + 1}: {error}") from None
+        board.make_move(*move)
+    return board
+
+
+def write_game(moves, headers=None, result="*", line_width=80):
+    """Format SAN moves as PGN text; moves start from headers["FEN"] if it is given"""
+    headers = dict(headers or {})
+    headers["Result"] = result
+    for tag in SEVEN_TAG_ROSTER:
+        headers.setdefault(tag, "?")
+    lines = [f'[{tag} "{_escape(headers[tag])}"]' for tag in SEVEN_TAG_ROSTER]
+    lines += [f'[{tag} "{_escape(value)}"]' for tag, value in headers.items() if tag not in SEVEN_TAG_ROSTER]
+    lines.append("")
+
+    # Move numbers continue from the FEN, which may start with black to move
+    fields = headers.get("FEN", START_FEN).split()
+    number = int(fields[5]) if len(fields) > 5 else 1
+    black = len(fields) > 1 and fields[1] == "b"
+    tokens = []
+    for i, san in enumerate(moves):
+        if not black:
+            tokens.append(f"{number}.")
+        elif i == 0:
+            tokens.append(f"{number}...")
+        tokens.append(san)
+        if black:
+            number += 1
+        black = not black
+    tokens.append(result)
+
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > line_width:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def game_to_pgn(game, headers=None):
+    """Write a ChessGame's move_history as PGN"""
+    board = Board()
+    board.load_fen(game.start_fen)
+    headers = dict(headers or {})
+    if game.start_fen != START_FEN:
+        headers.setdefault("SetUp", "1")
+        headers.setdefault("FEN", game.start_fen)
+    moves = []
+    for move in game.move_history:
+        moves.append(move_to_san(board, move))
+        board.make_move(*move)
+
+    if game.game_over and game.winner:
+        result = "1-0" if game.winner == PieceColor.WHITE else "0-1"
+    else:
+        result = "1/2-1/2" if game.game_over else "*"
+    return write_game(moves, headers, result)
+
+
+def _validate_batch(games):
+    """Replay games; return (plies, error or None) for each"""
+    results = []
+    for game in games:
+        try:
+            replay(game)
+            results.append((len(game.moves), None))
+        except ValueError as error:
+            results.append((len(game.moves), str(error)))
+    return results
+
+
+def _batches(games, size):
+    batch = []
+    for game in games:
+        batch.append(game)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def validate(stream, workers=1, on_error=None):
+    """Replay every game in a PGN stream and return (games, plies, bad games)
+
+    With more than one worker, batches of games are replayed on a process
+    pool. Only a few batches per worker are in flight at a time, so the
+    file is still read as a stream. on_error, if given, is called with the
+    game number, headers and error message of each bad game.
+    """
+    games = plies = bad = 0
+    numbered = enumerate(read_games(stream), 1)
+
+    def record(batch, results):
+        nonlocal games, plies, bad
+        for (number, game), (count, error) in zip(batch, results):
+            games += 1
+            plies += count
+            if error:
+                bad += 1
+                if on_error:
+                    on_error(number, game.headers, error)
+
+    if workers <= 1:
+        for batch in _batches(numbered, BATCH_SIZE):
+            record(batch, _validate_batch([game for _, game in batch]))
+        return games, plies, bad
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for batch in _batches(numbered, BATCH_SIZE):
+            pending.append((batch, pool.submit(_validate_batch, [game for _, game in batch])))
+            if len(pending) >= 2 * workers:
+                done, future = pending.pop(0)
+                record(done, future.result())
+        for done, future in pending:
+            record(done, future.result())
+    return games, plies, bad
+
+
+def random_games(count, seed=1, max_plies=200):
+    """Yield seeded random games as PGN text, for benchmarking validate"""
+    rng = random.Random(seed)
+    for number in range(1, count + 1):
+        board = Board()
+        moves = []
+        result = "*"
+        for _ in range(max_plies):
+            legal_moves = list(board.generate_legal_moves(board.side_to_move))
+            if not legal_moves:
+                if board.is_king_in_check(board.side_to_move):
+                    result = "0-1" if board.side_to_move == PieceColor.WHITE else "1-0"
+                else:
+                    result = "1/2-1/2"
+                break
+            move = rng.choice(legal_moves)
+            moves.append(move_to_san(board, move, legal_moves))
+            board.make_move(*move)
+        yield write_game(moves, {"Event": "Random game", "Round": str(number)}, result)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate or generate PGN game archives")
+    parser.add_argument("command", choices=["validate", "generate"])
+    parser.add_argument("path", help="PGN file to read, or to write with generate")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="replay processes for validate")
+    parser.add_argument("--games", type=int, default=1000, help="number of games for generate")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        with open(args.path, "w") as f:
+            for text in random_games(args.games, args.seed):
+                f.write(text + "\n")
+        return 0
+
+    def report(number, headers, error):
+        print(f"game {number} ({headers.get('White', '?')} - {headers.get('Black', '?')}): {error}")
+
+    start = time.perf_counter()
+    with open(args.path) as f:
+        games, plies, bad = validate(f, args.workers, report)
+    elapsed = time.perf_counter() - start
+    rate = games / elapsed if elapsed > 0 else 0.0
+    print(f"{games} games, {plies} plies in {elapsed:.2f}s ({rate:,.1f} games/s, "
+          f"{plies / elapsed if elapsed > 0 else 0.0:,.0f} plies/s) on {args.workers} workers; {bad} bad")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""Asyncio server hosting many independent games in one process.
+
+Games are plain Boards, with no ChessGame and no pygame. Clients connect
+over TCP and send one command per line; every command gets one reply line,
+"ok ..." or "error <message>":
+
+    new [FEN]          ok <game id>           start a game (default: start position)
+    move <id> <uci>    ok [check|checkmate|stalemate]
+    moves <id>         ok <uci> <uci> ...     legal moves, none once the game is over
+    fen <id>           ok <fen>
+    close <id>         ok
+    stats              ok sessions=N commands=N maxrss_kb=N
+
+Moves are checked against the legal moves of the piece that moves, on the
+event loop. Finding the side to move's legal moves and whether it is in
+check, which "move" and "moves" need, is sent to an executor as the 29-byte
+Board.to_bytes encoding of the position, so the loop keeps serving other
+connections meanwhile. With --executor process it runs on a process pool
+and doesn't hold the server's GIL either.
+
+A FEN for "new" must have one king of each color, at most 32 pieces, no
+pawns on the first or last rank and the side not to move out of check.
+If a move's analysis fails, the move is taken back before the error reply.
+
+A game belongs to the connection that created it: only that connection
+can play, read or close it, and it is dropped when the connection closes.
+A game keeps its Board, with only the last move's undo record, and its
+moves as 16-bit move codes. --measure reports the memory one game takes,
+from tracemalloc.
+
+    python server.py [--host 127.0.0.1] [--port 8765] [--executor process|thread|none] [--workers N]
+    python server.py --measure [games]
+
+bench_server.py is a load generator for it.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import threading
+import tracemalloc
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from chess_app import Board, PieceColor, PieceType, move_to_uci, pack_move, uci_to_move
+
+DEFAULT_PORT = 8765
+MAX_SESSIONS = 100000
+
+
+class Session:
+    """One game: its board and the moves played, as move codes"""
+    __slots__ = ("board", "moves")
+
+    def __init__(self, fen=None):
+        self.board = Board()
+        if fen:
+            self.board.load_fen(fen)
+            check_position(self.board)
+        self.moves = array("H")
+
+    def play(self, text):
+        """Play a move given in UCI notation; raise ValueError if it isn't legal"""
+        move = uci_to_move(text)
+        board = self.board
+        if move not in board.generate_legal_moves(board.side_to_move, move[:2]):
+            raise ValueError(f"illegal move {text}")
+        # Only the last move can be taken back, so older undo records would only pile up
+        del board.undo_stack[:]
+        board.make_move(*move)
+        self.moves.append(pack_move(move))
+
+    def take_back(self):
+        """Undo the move play() just made"""
+        self.board.unmake_move()
+        self.moves.pop()
+
+
+def check_position(board):
+    """Raise ValueError unless a game can be played from the position on board"""
+    kings = []
+    count = 0
+    for row in board.board:
+        for piece in row:
+            if piece:
+                count += 1
+                if piece.piece_type == PieceType.KING:
+                    kings.append(piece.color)
+                elif piece.piece_type == PieceType.PAWN and piece.row in (0, 7):
+                    raise ValueError("a pawn can't stand on the first or last rank")
+    if kings.count(PieceColor.WHITE) != 1 or kings.count(PieceColor.BLACK) != 1:
+        raise ValueError("a game needs one king of each color")
+    if count > 32:
+        raise ValueError("more than 32 pieces")
+    waiting = PieceColor.BLACK if board.side_to_move == PieceColor.WHITE else PieceColor.WHITE
+    if board.is_king_in_check(waiting):
+        raise ValueError("the side not to move is in check")
+
+
+# Each executor thread or process reuses one board
+_local = threading.local()
+
+
+def analyse(position):
+    """Get (in check, legal moves in UCI notation) for the side to move of a Board.to_bytes position"""
+    board = getattr(_local, "board", None)
+    if board is None:
+        board = _local.board = Board()
+    board.load_bytes(position)
+    color = board.side_to_move
+    return board.is_king_in_check(color), [move_to_uci(move) for move in board.generate_legal_moves(color)]
+
+
+def max_rss_kb():
+    """Peak resident memory of this process in kilobytes, or 0 where it can't be read"""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class GameServer:
+    def __init__(self, executor=None, max_sessions=MAX_SESSIONS):
+        # None runs the analysis on the event loop itself
+        self.executor = executor
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.next_id = 1
+        self.commands = 0
+
+    async def handle(self, reader, writer):
+        """Serve one connection until it closes"""
+        owned = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write((await self.dispatch(line.decode(errors="replace").split(), owned) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for game_id in owned:
+                self.sessions.pop(game_id, None)
+            writer.close()
+
+    async def dispatch(self, words, owned):
+        """Run one command and return its reply line"""
+        self.commands += 1
+        if not words:
+            return "error empty command"
+        command, args = words[0], words[1:]
+        try:
+            if command == "new":
+                return self.new_game(" ".join(args) or None, owned)
+            if command == "stats":
+                return f"ok sessions={len(self.sessions)} commands={self.commands} maxrss_kb={max_rss_kb()}"
+            if command not in ("move", "moves", "fen", "close") or not args:
+                return f"error unknown command {' '.join(words)!r}"
+            # Other connections' games look the same as games that don't exist
+            if args[0] not in owned:
+                return f"error no game {args[0]}"
+            session = self.sessions[args[0]]
+            if command == "fen":
+                return "ok " + session.board.to_fen()
+            if command == "close":
+                del self.sessions[args[0]]
+                owned.discard(args[0])
+                return "ok"
+            if command == "moves":
+                _, moves = await self.analyse(session.board)
+                return " ".join(["ok"] + moves)
+            if len(args) != 2:
+                return "error usage: move <id> <uci>"
+            session.play(args[1])
+            try:
+                in_check, moves = await self.analyse(session.board)
+            except Exception:
+                # The client gets an error, so the move must not stay on the board
+                session.take_back()
+                raise
+            if not moves:
+                return "ok checkmate" if in_check else "ok stalemate"
+            return "ok check" if in_check else "ok"
+        except ValueError as error:
+            return f"error {error}"
+        except Exception as error:
+            # E.g. a broken process pool; the connection still gets its reply
+            return f"error {type(error).__name__}: {error}"
+
+    def new_game(self, fen, owned):
+        if len(self.sessions) >= self.max_sessions:
+            return "error too many games"
+        session = Session(fen)
+        game_id = str(self.next_id)
+        self.next_id += 1
+        self.sessions[game_id] = session
+        owned.add(game_id)
+        return "ok " + game_id
+
+    async def analyse(self, board):
+        if self.executor is None:
+            return analyse(board.to_bytes())
+        return await asyncio.get_running_loop().run_in_executor(self.executor, analyse, board.to_bytes())
+
+
+def make_executor(kind, workers=None):
+    if kind == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=workers)
+    return None
+
+
+async def serve(host="127.0.0.1", port=DEFAULT_PORT, executor=None, max_sessions=MAX_SESSIONS):
+    """Run a GameServer until cancelled"""
+    game_server = GameServer(executor, max_sessions)
+    if isinstance(executor, ProcessPoolExecutor):
+        # Start the workers before the socket is bound, so forked workers
+        # don't hold on to it
+        await asyncio.get_running_loop().run_in_executor(executor, analyse, Board().to_bytes())
+    server = await asyncio.start_server(game_server.handle, host, port)
+    for sock in server.sockets:
+        print(f"Serving games on {sock.getsockname()[0]}:{sock.getsockname()[1]}", flush=True)
+    try:
+        # A plain kill stops serving, so main() still shuts the executor down
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.close)
+    except NotImplementedError:
+        pass
+    async with server:
+        try:
+            await server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+
+
+def measure_sessions(count=1000, plies=40):
+    """Average tracemalloc bytes per game, fresh and after plies moves each"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = [Session() for _ in range(count)]
+    fresh = (tracemalloc.get_traced_memory()[0] - before) / count
+    for session in sessions:
+        for _ in range(plies):
+            _, moves = analyse(session.board.to_bytes())
+            if not moves:
+                break
+            # The same line in every game keeps the measurement repeatable
+            session.play(moves[len(session.moves) * 7 % len(moves)])
+    played = (tracemalloc.get_traced_memory()[0] - before) / count
+    tracemalloc.stop()
+    return fresh, played
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Host many chess games over a line protocol")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--executor", choices=["process", "thread", "none"], default="process",
+                        help="where legal moves and check are worked out (default process)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--max-sessions", type=int, default=MAX_SESSIONS)
+    parser.add_argument("--measure", type=int, nargs="?", const=1000, metavar="GAMES",
+                        help="report the memory per game and exit")
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        fresh, played = measure_sessions(args.measure)
+        print(f"{args.measure} games: {fresh:,.0f} bytes per new game, {played:,.0f} bytes after 40 plies")
+        return 0
+
+    executor = make_executor(args.executor, args.workers)
+    try:
+        asyncio.run(serve(args.host, args.port, executor, args.max_sessions))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,422 @@
+"""Endgame tablebases built by retrograde analysis.
+
+Covers the endings of a lone black king against a white king plus a queen
+(KQK), a rook (KRK), a pawn (KPK) or a bishop and knight (KBNK). Every
+position gets its distance to mate, found by working backwards from the
+checkmates with the attack tables of the bitboard backend.
+
+Tables are packed byte arrays, one byte per position and side to move:
+0 for a draw, 255 for an impossible position, otherwise the number of
+plies to mate plus one. Symmetry keeps them small: boards are mirrored and
+rotated until the white king is in the a1-d1-d4 triangle (10 squares), or
+for KPK only mirrored onto files a-d. Files are read back with mmap, so a
+probe is an index calculation and one byte read:
+
+    python tablebase.py build [KQK KRK KPK KBNK] [--dir tables]
+    python tablebase.py probe --fen "8/8/8/4k3/8/8/8/4K2R w - - 0 1" [--dir tables]
+
+    tables = TablebaseSet("tables")
+    tables.probe(board)       # ProbeResult(wdl, plies) for the side to move, or None
+
+Building KBNK takes a minute or two; the others take seconds.
+"""
+import argparse
+import itertools
+import mmap
+import os
+import struct
+import sys
+import time
+from collections import namedtuple
+
+from bitboard import (BISHOP, BISHOP_RAYS, KING, KING_ATTACKS, KNIGHT, KNIGHT_ATTACKS, PAWN, PAWN_ATTACKS, QUEEN,
+                      ROOK, ROOK_RAYS, WHITE, slider_attacks)
+from chess_app import Board, PieceColor, PieceType
+
+# White's pieces besides the king, in index order
+MATERIALS = {
+    "KQK": (QUEEN,),
+    "KRK": (ROOK,),
+    "KPK": (PAWN,),
+    "KBNK": (BISHOP, KNIGHT),
+}
+# KPK needs the tables of the pieces its pawn promotes to
+BUILD_ORDER = ["KQK", "KRK", "KPK", "KBNK"]
+PROMOTIONS = {QUEEN: "KQK", ROOK: "KRK"}
+
+DRAW, INVALID = 0, 255
+ProbeResult = namedtuple("ProbeResult", ["wdl", "plies"])
+HEADER = struct.Struct(">4s8sI")
+MAGIC = b"CTB1"
+
+# The 8 symmetries of the board, as square -> square tables
+_SYMMETRIES = [
+    lambda r, c: (r, c), lambda r, c: (r, 7 - c), lambda r, c: (7 - r, c), lambda r, c: (7 - r, 7 - c),
+    lambda r, c: (c, r), lambda r, c: (c, 7 - r), lambda r, c: (7 - c, r), lambda r, c: (7 - c, 7 - r),
+]
+TRANSFORMS = [[r * 8 + c for r, c in (f(*divmod(sq, 8)) for sq in range(64))] for f in _SYMMETRIES]
+
+# a1-d1-d4 triangle; rows count down from black's side, so rank = 7 - row
+TRIANGLE = [sq for sq in range(64) if sq % 8 <= 3 and 7 - sq // 8 <= sq % 8]
+# Files a-d, for tables with pawns, which only allow a left-right mirror
+QUEENSIDE = [sq for sq in range(64) if sq % 8 <= 3]
+
+
+def _white_attacks(kind, sq, occupied):
+    if kind == KNIGHT:
+        return KNIGHT_ATTACKS[sq]
+    if kind == BISHOP:
+        return slider_attacks(sq, occupied, BISHOP_RAYS)
+    if kind == ROOK:
+        return slider_attacks(sq, occupied, ROOK_RAYS)
+    if kind == QUEEN:
+        return slider_attacks(sq, occupied, ROOK_RAYS) | slider_attacks(sq, occupied, BISHOP_RAYS)
+    if kind == PAWN:
+        return PAWN_ATTACKS[WHITE][sq]
+    return KING_ATTACKS[sq]
+
+
+class _Layout:
+    """Maps positions (white king, black king, white pieces) to table indices"""
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+        has_pawn = PAWN in pieces
+        self.region = QUEENSIDE if has_pawn else TRIANGLE
+        transforms = TRANSFORMS[:2] if has_pawn else TRANSFORMS
+        region_index = {sq: i for i, sq in enumerate(self.region)}
+        # For every white king square: the transforms that bring it into the
+        # region, two for the squares on the triangle's diagonal
+        self.transforms = [[t for t in transforms if t[sq] in region_index] for sq in range(64)]
+        self.region_index = [region_index.get(sq) for sq in range(64)]
+        self.size = len(self.region) * 64 ** (1 + len(pieces))
+
+    def index(self, wk, bk, squares):
+        """Index of a position, applying the symmetry that puts the white king in the region
+
+        When two symmetries do, the lower index is the canonical one, so
+        mirrored positions always share an entry.
+        """
+        best = None
+        for transform in self.transforms[wk]:
+            index = self.region_index[transform[wk]] * 64 + transform[bk]
+            for sq in squares:
+                index = index * 64 + transform[sq]
+            if best is None or index < best:
+                best = index
+        return best
+
+    def decode(self, index):
+        """Get (white king, black king, white piece squares) of an index"""
+        squares = []
+        for _ in self.pieces:
+            index, sq = divmod(index, 64)
+            squares.append(sq)
+        region, bk = divmod(index, 64)
+        return self.region[region], bk, tuple(reversed(squares))
+
+    def positions(self):
+        """Yield (index, white king, black king, white piece squares) of every index in order"""
+        index = 0
+        for wk in self.region:
+            for bk in range(64):
+                for squares in itertools.product(range(64), repeat=len(self.pieces)):
+                    yield index, wk, bk, squares
+                    index += 1
+
+
+def _attacked(layout, wk, squares, occupied):
+    attacks = KING_ATTACKS[wk]
+    for kind, sq in zip(layout.pieces, squares):
+        attacks |= _white_attacks(kind, sq, occupied)
+    return attacks
+
+
+def generate(name, tables=None, log=None):
+    """Build the (white to move, black to move) tables of a material set as bytearrays
+
+    tables holds already built tables by name; KPK needs KQK and KRK there.
+    """
+    layout = _Layout(MATERIALS[name])
+    wtm = bytearray(layout.size)
+    btm = bytearray(layout.size)
+    # buckets[ply] lists the indices decided at that many plies from mate;
+    # even plies are black-to-move losses, odd ones white-to-move wins
+    buckets = {}
+
+    for index, wk, bk, squares in layout.positions():
+        occupied = 1 << wk | 1 << bk
+        for sq in squares:
+            occupied |= 1 << sq
+        # Entries that aren't canonical are never probed
+        if bin(occupied).count("1") != 2 + len(squares) or KING_ATTACKS[wk] >> bk & 1 \
+                or layout.index(wk, bk, squares) != index \
+                or any(layout.pieces[i] == PAWN and sq // 8 in (0, 7) for i, sq in enumerate(squares)):
+            wtm[index] = btm[index] = INVALID
+            continue
+        # Sliders see through the black king's square when it steps back along their line
+        attacked = _attacked(layout, wk, squares, occupied & ~(1 << bk))
+        if attacked >> bk & 1:
+            # White to move with black in check can't happen
+            wtm[index] = INVALID
+            if not KING_ATTACKS[bk] & ~attacked:
+                btm[index] = 1
+                buckets.setdefault(0, []).append(index)
+        elif name == "KPK" and squares[0] // 8 == 1:
+            _seed_promotion(layout, wtm, buckets, tables, wk, bk, squares[0], index)
+
+    btm_layout_index = layout.index
+    ply = 0
+    while buckets:
+        decided = buckets.pop(ply, [])
+        for index in decided:
+            wk, bk, squares = layout.decode(index)
+            occupied = 1 << wk | 1 << bk
+            for sq in squares:
+                occupied |= 1 << sq
+            if ply % 2 == 0:
+                # Black is mated in ply plies: every white move into this
+                # position wins in ply + 1
+                for predecessor in _white_unmoves(layout, wk, bk, squares, occupied):
+                    value = wtm[predecessor]
+                    if value == DRAW or (value != INVALID and value > ply + 2):
+                        wtm[predecessor] = ply + 2
+                        buckets.setdefault(ply + 1, []).append(predecessor)
+            elif wtm[index] == ply + 1:
+                # White wins in ply plies: black positions that can move
+                # here are lost if all their other moves lose too
+                free = KING_ATTACKS[bk] & ~occupied
+                while free:
+                    low = free & -free
+                    free ^= low
+                    origin = low.bit_length() - 1
+                    predecessor = btm_layout_index(wk, origin, squares)
+                    if btm[predecessor] == DRAW and _all_moves_lose(layout, wtm, wk, origin, squares, ply):
+                        btm[predecessor] = ply + 2
+                        buckets.setdefault(ply + 1, []).append(predecessor)
+        if log and decided:
+            log(f"{name}: {len(decided)} positions at {ply} plies")
+        ply += 1
+    return wtm, btm
+
+
+def _seed_promotion(layout, wtm, buckets, tables, wk, bk, pawn, index):
+    """Give a white-to-move KPK position with the pawn on the 7th rank the value of its best promotion"""
+    target = pawn - 8
+    if target in (wk, bk):
+        return
+    best = None
+    for kind, table_name in PROMOTIONS.items():
+        promoted_layout, (_, promoted_btm) = tables[table_name]
+        value = promoted_btm[promoted_layout.index(wk, bk, (target,))]
+        if value not in (DRAW, INVALID) and (best is None or value < best):
+            best = value
+    if best is not None:
+        # Black is lost in best - 1 plies after the promotion
+        wtm[index] = best + 1
+        buckets.setdefault(best, []).append(index)
+
+
+def _white_unmoves(layout, wk, bk, squares, occupied):
+    """Yield the white-to-move positions that reach this one with a white move"""
+    index = layout.index
+    for origin in _iter(KING_ATTACKS[wk] & ~occupied):
+        yield index(origin, bk, squares)
+    for i, (kind, sq) in enumerate(zip(layout.pieces, squares)):
+        if kind == PAWN:
+            # Pawns move towards row 0, so they came from the row below
+            origins = []
+            if sq // 8 < 6 and not occupied >> (sq + 8) & 1:
+                origins.append(sq + 8)
+                if sq // 8 == 4 and not occupied >> (sq + 16) & 1:
+                    origins.append(sq + 16)
+        else:
+            origins = _iter(_white_attacks(kind, sq, occupied) & ~occupied)
+        for origin in origins:
+            yield index(wk, bk, squares[:i] + (origin,) + squares[i + 1:])
+
+
+def _all_moves_lose(layout, wtm, wk, bk, squares, ply):
+    """Check that every legal black move leads to a white win in at most ply plies"""
+    occupied = 1 << wk
+    white = 0
+    for sq in squares:
+        white |= 1 << sq
+    occupied |= white
+    attacked = _attacked(layout, wk, squares, occupied)
+    moves = KING_ATTACKS[bk] & ~attacked
+    if moves & white:
+        # Taking an undefended piece leaves a draw
+        return False
+    for target in _iter(moves):
+        value = wtm[layout.index(wk, target, squares)]
+        if value in (DRAW, INVALID) or value > ply + 1:
+            return False
+    return True
+
+
+def _iter(bb):
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+def save(path, name, wtm, btm):
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, name.encode(), len(wtm)))
+        f.write(wtm)
+        f.write(btm)
+
+
+class Tablebase:
+    """One material set's tables, read through mmap"""
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, name, self.entries = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError(f"Not a tablebase file: {path}")
+        self.name = name.rstrip(b"\0").decode()
+        self.layout = _Layout(MATERIALS[self.name])
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def value(self, white_to_move, wk, bk, squares):
+        """Raw table byte of a position given with white as the stronger side"""
+        offset = HEADER.size + (0 if white_to_move else self.entries)
+        return self._map[offset + self.layout.index(wk, bk, squares)]
+
+
+class TablebaseSet:
+    """All tablebase files in a directory, probed by material"""
+
+    def __init__(self, directory):
+        self.tables = {}
+        for name in MATERIALS:
+            path = os.path.join(directory, name + ".tb")
+            if os.path.exists(path):
+                self.tables[name] = Tablebase(path)
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+
+    def probe(self, board):
+        """Look up the position for the side to move
+
+        Returns a ProbeResult: wdl is 1 if the side to move mates, -1 if it
+        gets mated and 0 for a draw, and plies is the number of plies to
+        mate. Returns None if the position isn't covered by a loaded table
+        (or can't arise in a game).
+        """
+        pieces = {PieceColor.WHITE: [], PieceColor.BLACK: []}
+        for row in range(8):
+            for col in range(8):
+                piece = board.get_piece_at(row, col)
+                if piece:
+                    pieces[piece.color].append((piece.piece_type, row, col))
+        strong = PieceColor.WHITE if len(pieces[PieceColor.WHITE]) > 1 else PieceColor.BLACK
+        weak = PieceColor.BLACK if strong == PieceColor.WHITE else PieceColor.WHITE
+        if len(pieces[weak]) != 1:
+            return None
+        # With black as the stronger side, flip the board so white is
+        flip = strong == PieceColor.BLACK
+        squares = {}
+        for piece_type, row, col in pieces[strong]:
+            squares.setdefault(piece_type, []).append(((7 - row) if flip else row) * 8 + col)
+        _, row, col = pieces[weak][0]
+        bk = ((7 - row) if flip else row) * 8 + col
+        wk = squares.pop(PieceType.KING)[0]
+
+        material = sorted(piece_type.value for piece_type, found in squares.items() for _ in found)
+        for name, table in self.tables.items():
+            kinds = [_PIECE_TYPES[kind] for kind in MATERIALS[name]]
+            if sorted(kind.value for kind in kinds) != material:
+                continue
+            strong_to_move = board.side_to_move == strong
+            value = table.value(strong_to_move, wk, bk, tuple(squares[kind][0] for kind in kinds))
+            if value == INVALID:
+                return None
+            if value == DRAW:
+                return ProbeResult(0, 0)
+            return ProbeResult(1 if strong_to_move else -1, value - 1)
+        return None
+
+    def best_move(self, board):
+        """Pick the legal move with the best table result for the side to move, or None"""
+        best, best_key = None, None
+        for move in list(board.generate_legal_moves(board.side_to_move)):
+            board.make_move(*move)
+            result = self.probe(board)
+            board.unmake_move()
+            if result is None:
+                # Leaves the tables, e.g. by capturing the last piece: a draw
+                result = ProbeResult(0, 0)
+            # result is for the opponent: prefer mating fast, then drawing, then losing slowly
+            key = (1 - result.wdl, -result.plies if result.wdl < 0 else result.plies)
+            if best_key is None or key > best_key:
+                best, best_key = move, key
+        return best
+
+
+_PIECE_TYPES = {PAWN: PieceType.PAWN, KNIGHT: PieceType.KNIGHT, BISHOP: PieceType.BISHOP,
+                ROOK: PieceType.ROOK, QUEEN: PieceType.QUEEN, KING: PieceType.KING}
+
+
+def build(names, directory, verbose=False):
+    """Generate and save the named tables, plus the tables they depend on"""
+    os.makedirs(directory, exist_ok=True)
+    built = {}
+    for name in BUILD_ORDER:
+        if name not in names and not (name in PROMOTIONS.values() and "KPK" in names):
+            continue
+        start = time.perf_counter()
+        wtm, btm = generate(name, built, print if verbose else None)
+        built[name] = (_Layout(MATERIALS[name]), (wtm, btm))
+        save(os.path.join(directory, name + ".tb"), name, wtm, btm)
+        longest = max(max(v for v in table if v != INVALID) for table in (wtm, btm)) - 1
+        print(f"{name}: {2 * len(wtm)} entries, longest mate {longest} plies, "
+            f"built in {time.perf_counter() - start:.1f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or probe endgame tablebases")
+    parser.add_argument("command", choices=["build", "probe"])
+    parser.add_argument("materials", nargs="*", default=BUILD_ORDER, help="material sets to build")
+    parser.add_argument("--dir", default="tables", help="directory of the table files")
+    parser.add_argument("--fen", help="position to probe")
+    parser.add_argument("--verbose", action="store_true", help="log every ply while building")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        unknown = set(args.materials) - set(MATERIALS)
+        if unknown:
+            parser.error(f"unknown material: {', '.join(sorted(unknown))}")
+        build(args.materials, args.dir, args.verbose)
+        return 0
+
+    if not args.fen:
+        parser.error("probe needs --fen")
+    board = Board()
+    board.load_fen(args.fen)
+    tables = TablebaseSet(args.dir)
+    start = time.perf_counter()
+    result = tables.probe(board)
+    elapsed = time.perf_counter() - start
+    if result is None:
+        print("not in the tables")
+    elif result.wdl == 0:
+        print("draw")
+    else:
+        print(f"{'win' if result.wdl > 0 else 'loss'} for the side to move, mate in {result.plies} plies")
+    print(f"probe took {elapsed * 1e6:.0f}us")
+    tables.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
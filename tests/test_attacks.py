@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+from bitboard import BitBoard
+from chess_app import Board, PieceColor
+
+COLORS = [PieceColor.WHITE, PieceColor.BLACK]
+
+
+def check_board(board):
+    assert board.attack_counts == board.compute_attack_counts()
+
+
+def check_bitboard(board, bitboard):
+    """BitBoard keeps no attack counts; its attack tests must agree with Board's"""
+    counts = board.attack_counts
+    for color in COLORS:
+        attacked = [bitboard.is_square_attacked(sq // 8, sq % 8, color) for sq in range(64)]
+        assert attacked == [count > 0 for count in counts[color.value - 1]]
+
+
+def play_random_game(seed, check, max_plies=80):
+    """Make and unmake every legal move of each position of a seeded random game, checking after each"""
+    rng = random.Random(seed)
+    board = Board()
+    bitboard = BitBoard.from_board(board)
+    for _ in range(max_plies):
+        moves = list(board.generate_legal_moves(board.side_to_move))
+        if not moves:
+            break
+        for move in moves:
+            board.make_move(*move)
+            bitboard.make_move(*move)
+            check(board, bitboard)
+            board.unmake_move()
+            bitboard.unmake_move()
+            check(board, bitboard)
+        move = rng.choice(moves)
+        board.make_move(*move)
+        bitboard.make_move(*move)
+        check(board, bitboard)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_attack_counts_match_recount(seed):
+    play_random_game(seed, lambda board, bitboard: check_board(board))
+
+
+@pytest.mark.parametrize("seed", range(2))
+def test_bitboard_attacks_match_attack_counts(seed):
+    play_random_game(seed, check_bitboard, max_plies=40)
+
+
+def test_attack_counts_match_recount_after_loading():
+    board = Board()
+    board.load_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+    check_board(board)
@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from chess_app import Board
+from evaluation import encode_positions, evaluate, evaluate_batch
+from perft import REFERENCE_POSITIONS
+
+# Positions the perft reference set doesn't cover: lone sliders on open
+# boards, promotions, doubled, isolated and passed pawns
+EXTRA_FENS = [
+    "4k3/8/8/3Q4/8/8/8/4K3 w - - 0 1",
+    "4k3/8/8/8/2b5/8/8/R3K3 b - - 0 1",
+    "7k/P7/8/8/8/8/p7/K7 w - - 0 1",
+    "4k3/1p2p3/1p6/8/3P4/3P4/P6P/4K3 w - - 0 1",
+    "r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4",
+]
+
+
+def load(fen):
+    board = Board()
+    board.load_fen(fen)
+    return board
+
+
+def random_positions(count, seed, max_plies=120):
+    rng = random.Random(seed)
+    boards = []
+    for _ in range(count):
+        board = Board()
+        for _ in range(rng.randrange(max_plies)):
+            moves = list(board.generate_legal_moves(board.side_to_move))
+            if not moves:
+                break
+            board.make_move(*rng.choice(moves))
+        boards.append(board)
+    return boards
+
+
+@pytest.mark.parametrize("fen", [fen for _, fen, _ in REFERENCE_POSITIONS] + EXTRA_FENS)
+def test_batch_matches_scalar(fen):
+    board = load(fen)
+    assert list(evaluate_batch(*encode_positions([board]))) == [evaluate(board)]
+
+
+def test_batch_matches_scalar_on_random_positions():
+    boards = random_positions(300, seed=11)
+    assert list(evaluate_batch(*encode_positions(boards))) == [evaluate(board) for board in boards]
+
+
+def test_batch_scores_each_position_independently():
+    boards = [load(fen) for _, fen, _ in REFERENCE_POSITIONS]
+    together = evaluate_batch(*encode_positions(boards))
+    alone = [evaluate_batch(*encode_positions([board]))[0] for board in boards]
+    assert list(together) == alone
+
+
+def test_score_is_for_the_side_to_move():
+    white = load("4k3/8/8/3Q4/8/8/8/4K3 w - - 0 1")
+    black = load("4k3/8/8/3Q4/8/8/8/4K3 b - - 0 1")
+    assert evaluate(white) > 0
+    assert evaluate(black) == -evaluate(white)
+    assert list(evaluate_batch(*encode_positions([white, black]))) == [evaluate(white), evaluate(black)]
+
+
+def test_empty_batch():
+    assert len(evaluate_batch(*encode_positions([]))) == 0
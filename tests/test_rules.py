@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+from bitboard import BitBoard
+from chess_app import POSITION_FORMAT, Board
+from perft import REFERENCE_POSITIONS, make_board, perft, perft_codes
+
+BACKENDS = ["board", "bitboard"]
+# Deepest reference counts that stay quick enough for every test run
+MAX_NODES = 50000
+PERFT_CASES = [(name, fen, depth, count) for name, fen, counts in REFERENCE_POSITIONS
+               for depth, count in enumerate(counts, 1) if count <= MAX_NODES]
+FENS = [fen for _, fen, _ in REFERENCE_POSITIONS]
+
+
+def random_boards(count, seed, max_plies=100):
+    """Boards after seeded random games, each played on its own Board"""
+    rng = random.Random(seed)
+    boards = []
+    for _ in range(count):
+        board = Board()
+        for _ in range(rng.randrange(max_plies)):
+            moves = list(board.generate_legal_moves(board.side_to_move))
+            if not moves:
+                break
+            board.make_move(*rng.choice(moves))
+        boards.append(board)
+    return boards
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("name, fen, depth, count", PERFT_CASES, ids=[f"{c[0]}-{c[2]}" for c in PERFT_CASES])
+def test_perft(backend, name, fen, depth, count):
+    assert perft(make_board(fen, backend), depth) == count
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("fen", FENS)
+def test_perft_codes_matches_perft(backend, fen):
+    assert perft_codes(make_board(fen, backend), 2) == perft(make_board(fen, backend), 2)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("fen", FENS)
+def test_make_unmake_restores_position(backend, fen):
+    board = make_board(fen, backend)
+    before = (board.to_fen(), board.zobrist_hash)
+    for move in list(board.generate_legal_moves(board.side_to_move)):
+        board.make_move(*move)
+        assert board.zobrist_hash == board.compute_hash()
+        for reply in list(board.generate_legal_moves(board.side_to_move)):
+            board.make_move(*reply)
+            assert board.zobrist_hash == board.compute_hash()
+            board.unmake_move()
+        board.unmake_move()
+        assert (board.to_fen(), board.zobrist_hash) == before
+    assert board.zobrist_hash == board.compute_hash()
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_hash_along_random_games(backend):
+    rng = random.Random(3)
+    for _ in range(5):
+        board = make_board(FENS[0], backend)
+        for _ in range(100):
+            moves = list(board.generate_legal_moves(board.side_to_move))
+            if not moves:
+                break
+            board.make_move(*rng.choice(moves))
+            assert board.zobrist_hash == board.compute_hash()
+        while board.undo_stack:
+            board.unmake_move()
+            assert board.zobrist_hash == board.compute_hash()
+        assert board.to_fen() == FENS[0]
+
+
+def test_fen_round_trip():
+    for fen in FENS + [board.to_fen() for board in random_boards(50, seed=7)]:
+        board = Board()
+        board.load_fen(fen)
+        assert board.to_fen() == fen
+        assert BitBoard.from_board(board).to_fen() == fen
+
+
+@pytest.mark.parametrize("fen", ["", "8/8/8 w - - 0 1", "rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                                 "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNX w KQkq - 0 1"])
+def test_bad_fen(fen):
+    with pytest.raises(ValueError):
+        Board().load_fen(fen)
+
+
+def test_bytes_round_trip():
+    for board in [make_board(fen) for fen in FENS] + random_boards(50, seed=8):
+        data = board.to_bytes()
+        assert len(data) == POSITION_FORMAT.size == 29
+        loaded = Board()
+        loaded.load_bytes(data)
+        assert loaded.to_fen() == board.to_fen()
+        assert loaded.zobrist_hash == board.zobrist_hash
+        assert loaded.to_bytes() == data
+        bitboard = BitBoard()
+        bitboard.load_bytes(data)
+        assert bitboard.to_bytes() == data
@@ -0,0 +1,264 @@
+"""Headless self-play tournaments on a process pool.
+
+Plays games between two players through ChessGame, without pygame, and
+writes one JSON line per game (players, seed, result, how it ended, plies,
+UCI moves and final FEN) to stdout or --output. The summary goes to stderr
+when the games go to stdout.
+
+A player is one of:
+
+- random: a uniformly random legal move
+- engine:DEPTH: the engine's best move from a search to DEPTH plies
+
+Games end in checkmate or stalemate, found the way the GUI finds them
+(ChessGame.game_status) and confirmed with Board.is_checkmate and
+Board.is_stalemate, by the fifty-move rule, by threefold repetition, or
+unfinished ("*") at --max-plies. Game N of a run with --seed S is seeded
+with S * 1000003 + N and is replayed exactly by --game-seed with the same
+players, on either --backend. --random-plies plays that many random moves first, so engine
+games don't all repeat the same line.
+
+Exits with status 1 if any game broke a rule check.
+
+    python tournament.py --games 1000 --workers 8 --output games.jsonl
+    python tournament.py --white engine:2 --black random --games 20 --swap
+    python tournament.py --white engine:2 --black random --game-seed 1000010
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from chess_app import START_FEN, Board, ChessGame, PieceColor, PositionCache, move_to_uci, unpack_move
+
+# Games per pool task; random games take only milliseconds each
+BATCH_SIZE = 8
+SEED_STRIDE = 1000003
+
+
+def game_seed(seed, number):
+    """The seed of game number (from 0) in a run"""
+    return seed * SEED_STRIDE + number
+
+
+def make_player(spec):
+    """Turn a player spec into a callable(game, legal_moves, rng) returning a move"""
+    name, _, arg = spec.partition(":")
+    if name == "random":
+        return lambda game, legal_moves, rng: rng.choice(legal_moves)
+    if name == "engine":
+        # engine imports chess_app, so it is only imported when needed
+        from engine import Searcher
+        depth = int(arg or 2)
+        searcher = Searcher()
+        return lambda game, legal_moves, rng: searcher.search(game.board, max_depth=depth).best_move
+    raise ValueError(f"unknown player {spec!r}")
+
+
+def play_game(white, black, seed, fen=START_FEN, max_plies=300, random_plies=0, backend="board", cache=None):
+    """Play one game and return its result as a JSON-serializable dict"""
+    rng = random.Random(seed)
+    board = Board()
+    board.load_fen(fen)
+    if backend == "bitboard":
+        from bitboard import BitBoard
+        board = BitBoard.from_board(board)
+    game = ChessGame(board=board, cache=cache)
+    players = {PieceColor.WHITE: make_player(white), PieceColor.BLACK: make_player(black)}
+
+    seen = {board.zobrist_hash: 1}
+    moves = []
+    result, reason, error = "*", "max plies", None
+    start = time.perf_counter()
+    while len(moves) < max_plies:
+        status = game.game_status()
+        color = game.current_player
+        if game.game_over:
+            if status.checkmate:
+                result = "0-1" if color == PieceColor.WHITE else "1-0"
+                reason = "checkmate"
+                if not board.is_checkmate(color):
+                    error = "checkmate not confirmed by Board.is_checkmate"
+            else:
+                result, reason = "1/2-1/2", "stalemate"
+                if not board.is_stalemate(color):
+                    error = "stalemate not confirmed by Board.is_stalemate"
+            break
+        if board.halfmove_clock >= 100:
+            result, reason = "1/2-1/2", "fifty-move rule"
+            break
+        if seen[board.zobrist_hash] >= 3:
+            result, reason = "1/2-1/2", "repetition"
+            break
+
+        # In move code order, so a seed plays the same game on either backend
+        legal_moves = [unpack_move(code) for code in sorted(status.legal_moves)]
+        if len(moves) < random_plies:
+            move = rng.choice(legal_moves)
+        else:
+            move = players[color](game, legal_moves, rng)
+        if move not in legal_moves:
+            error = f"{'white' if color == PieceColor.WHITE else 'black'} played an illegal move {move}"
+            break
+        moves.append(move_to_uci(move))
+        game.make_move(move)
+        seen[board.zobrist_hash] = seen.get(board.zobrist_hash, 0) + 1
+
+    return {
+        "seed": seed,
+        "white": white,
+        "black": black,
+        "result": result,
+        "reason": reason,
+        "plies": len(moves),
+        "seconds": round(time.perf_counter() - start, 4),
+        "moves": moves,
+        "fen": board.to_fen(),
+        "error": error,
+    }
+
+
+# One status cache per worker process, shared by the games it plays
+_cache = None
+
+
+def _play_batch(tasks, options):
+    """Play (number, white, black, seed) games in a worker; return their results"""
+    global _cache
+    if _cache is None:
+        _cache = PositionCache()
+    results = []
+    for number, white, black, seed in tasks:
+        result = play_game(white, black, seed, cache=_cache, **options)
+        result["game"] = number
+        results.append(result)
+    return results
+
+
+def schedule(games, white, black, seed, swap=False):
+    """List the (number, white, black, seed) of every game; swap alternates colors"""
+    tasks = []
+    for number in range(games):
+        players = (black, white) if swap and number % 2 else (white, black)
+        tasks.append((number, *players, game_seed(seed, number)))
+    return tasks
+
+
+def run(tasks, workers=1, on_result=None, **options):
+    """Play the scheduled games and call on_result with each result, in game order
+
+    With more than one worker, batches of games are played on a process
+    pool with only a few batches per worker in flight. Returns the results.
+    """
+    batches = [tasks[i:i + BATCH_SIZE] for i in range(0, len(tasks), BATCH_SIZE)]
+    results = []
+
+    def record(batch_results):
+        for result in batch_results:
+            results.append(result)
+            if on_result:
+                on_result(result)
+
+    if workers <= 1:
+        for batch in batches:
+            record(_play_batch(batch, options))
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for batch in batches:
+            pending.append(pool.submit(_play_batch, batch, options))
+            if len(pending) >= 2 * workers:
+                record(pending.pop(0).result())
+        for future in pending:
+            record(future.result())
+    return results
+
+
+def summarize(results, elapsed):
+    """Get games/s, plies/s and the result and reason counts of a run"""
+    plies = sum(result["plies"] for result in results)
+    summary = {
+        "games": len(results),
+        "plies": plies,
+        "seconds": round(elapsed, 3),
+        "games_per_second": len(results) / elapsed if elapsed > 0 else 0.0,
+        "plies_per_second": plies / elapsed if elapsed > 0 else 0.0,
+        "results": {},
+        "reasons": {},
+        "errors": sum(1 for result in results if result["error"]),
+    }
+    # Scores per player spec, from each game's white and black
+    scores = {}
+    for result in results:
+        summary["results"][result["result"]] = summary["results"].get(result["result"], 0) + 1
+        summary["reasons"][result["reason"]] = summary["reasons"].get(result["reason"], 0) + 1
+        points = {"1-0": (1, 0), "0-1": (0, 1), "1/2-1/2": (0.5, 0.5)}.get(result["result"], (0, 0))
+        for spec, point in zip((result["white"], result["black"]), points):
+            scores[spec] = scores.get(spec, 0) + point
+    summary["scores"] = scores
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play headless self-play games and report the results")
+    parser.add_argument("--white", default="random", help="white player: random or engine:DEPTH (default random)")
+    parser.add_argument("--black", default="random", help="black player (default random)")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--game-seed", type=int, help="replay the single game with this seed")
+    parser.add_argument("--swap", action="store_true", help="swap colors every other game")
+    parser.add_argument("--fen", default=START_FEN, help="start position")
+    parser.add_argument("--max-plies", type=int, default=300, help="stop unfinished games here (default 300)")
+    parser.add_argument("--random-plies", type=int, default=0, help="random moves played before the players")
+    parser.add_argument("--backend", choices=["board", "bitboard"], default="board")
+    parser.add_argument("--output", "-o", help="write the JSON lines here instead of stdout")
+    args = parser.parse_args(argv)
+
+    for spec in (args.white, args.black):
+        make_player(spec)
+    if args.game_seed is not None:
+        tasks = [(0, args.white, args.black, args.game_seed)]
+    else:
+        tasks = schedule(args.games, args.white, args.black, args.seed, args.swap)
+    options = {"fen": args.fen, "max_plies": args.max_plies, "random_plies": args.random_plies,
+               "backend": args.backend}
+
+    out = open(args.output, "w") if args.output else sys.stdout
+    report = sys.stdout if args.output else sys.stderr
+
+    def write(result):
+        out.write(json.dumps(result) + "\n")
+        if result["error"]:
+            print(f"game {result['game']} (seed {result['seed']}): {result['error']}", file=report)
+
+    start = time.perf_counter()
+    try:
+        results = run(tasks, args.workers, write, **options)
+    finally:
+        if args.output:
+            out.close()
+    summary = summarize(results, time.perf_counter() - start)
+
+    print(f"{summary['games']} games, {summary['plies']} plies in {summary['seconds']:.2f}s "
+          f"({summary['games_per_second']:,.1f} games/s, {summary['plies_per_second']:,.0f} plies/s) "
+          f"on {args.workers} workers", file=report)
+    games = summary["games"] or 1
+    print("results: " + ", ".join(f"{result} {count} ({count / games:.0%})"
+                                  for result, count in sorted(summary["results"].items())), file=report)
+    print("endings: " + ", ".join(f"{reason} {count}" for reason, count in sorted(summary["reasons"].items())),
+          file=report)
+    if len(summary["scores"]) > 1:
+        print("scores: " + ", ".join(f"{spec} {score:g}" for spec, score in summary["scores"].items()),
+              file=report)
+    if summary["errors"]:
+        print(f"{summary['errors']} games broke a rule check", file=report)
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""UCI front end for the engine, for use under tournament managers.
+
+Speaks the Universal Chess Interface over stdin/stdout with no display:
+
+    uci, isready, ucinewgame, quit
+    position startpos [moves e2e4 ...]
+    position fen <fen> [moves ...]
+    go [depth N] [movetime MS] [wtime MS btime MS [winc MS binc MS] [movestogo N]] [infinite]
+    stop
+
+The main thread keeps reading commands while a search runs on a worker
+thread, so stop and isready are answered mid-search. Every search ends
+with a bestmove line, including one that was stopped. Under go infinite
+the bestmove waits for stop, even when the search finishes first (a mate
+or the depth cap). A malformed command, or an illegal move in position,
+is ignored and reported with an info string line.
+
+    python uci.py [--book book.bin]
+"""
+import argparse
+import sys
+import threading
+import time
+
+from chess_app import START_FEN, Board, PieceColor, move_to_uci, uci_to_move
+from engine import MATE_SCORE, MAX_PLY, Searcher
+
+ENGINE_NAME = "Chess-Engine-Project"
+
+# Time kept in reserve when playing on a clock, in milliseconds
+MOVE_OVERHEAD_MS = 50
+# Moves assumed to be left in the game when the clock has no movestogo
+DEFAULT_MOVES_TO_GO = 30
+
+
+def format_score(score):
+    """Format a centipawn score as the UCI 'score' argument"""
+    if abs(score) >= MATE_SCORE - MAX_PLY:
+        plies = MATE_SCORE - abs(score)
+        return f"mate {(plies + 1) // 2 if score > 0 else -(plies // 2)}"
+    return f"cp {score}"
+
+
+def allocate_time(color, options):
+    """Work out the think time in ms for a go command, or None to search without a time limit"""
+    if "movetime" in options:
+        return options["movetime"]
+    remaining = options.get("wtime" if color == PieceColor.WHITE else "btime")
+    if remaining is None:
+        return None
+    increment = options.get("winc" if color == PieceColor.WHITE else "binc", 0)
+    moves_to_go = options.get("movestogo", DEFAULT_MOVES_TO_GO)
+    budget = remaining // max(moves_to_go, 1) + increment * 3 // 4
+    return max(1, min(budget, remaining - MOVE_OVERHEAD_MS))
+
+
+class UciEngine:
+    def __init__(self, output=sys.stdout, book=None):
+        self.output = output
+        # Positions in this book.OpeningBook are answered without searching
+        self.book = book
+        self.board = Board()
+        self.searcher = None
+        self.thread = None
+        # Set by stop(); a go infinite search holds its bestmove until then
+        self.stopped = threading.Event()
+        # Search info and bestmove are printed from the worker thread
+        self.output_lock = threading.Lock()
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def handle(self, line):
+        """Run one command; return False after quit"""
+        tokens = line.split()
+        if not tokens:
+            return True
+        try:
+            return self._run(tokens[0], tokens[1:])
+        except ValueError as error:
+            # A bad command mustn't take the engine down with it
+            self.send(f"info string ignored {line.strip()!r}: {error}")
+            return True
+
+    def _run(self, command, args):
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_NAME} authors")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "ucinewgame":
+            self.stop()
+            self.board = Board()
+        elif command == "position":
+            self.stop()
+            self.set_position(args)
+        elif command == "go":
+            self.go(args)
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            self.stop()
+            return False
+        return True
+
+    def set_position(self, args):
+        """Handle the arguments of a position command"""
+        if "moves" in args:
+            split = args.index("moves")
+            args, moves = args[:split], args[split + 1:]
+        else:
+            moves = []
+        if args and args[0] == "fen":
+            fen = " ".join(args[1:])
+        else:
+            fen = START_FEN
+        board = Board()
+        board.load_fen(fen)
+        for text in moves:
+            move = uci_to_move(text)
+            if move not in board.generate_legal_moves(board.side_to_move, move[:2]):
+                raise ValueError(f"illegal move {text}")
+            board.make_move(*move)
+        self.board = board
+
+    def go(self, args):
+        """Start searching the current position on the worker thread"""
+        options = {}
+        for name, value in zip(args, args[1:]):
+            if name in ("depth", "movetime", "wtime", "btime", "winc", "binc", "movestogo"):
+                options[name] = int(value)
+        self.stop()
+        infinite = "infinite" in args
+        time_limit_ms = None if infinite else allocate_time(self.board.side_to_move, options)
+        max_depth = options.get("depth", MAX_PLY)
+
+        self.searcher = Searcher()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._search,
+                                       args=(self.searcher, self.board, max_depth, time_limit_ms, infinite))
+        self.thread.start()
+
+    def stop(self):
+        """Stop a running search and wait for its bestmove"""
+        if self.thread is not None:
+            self.stopped.set()
+            self.searcher.stop()
+            self.thread.join()
+            self.thread = None
+
+    def _search(self, searcher, board, max_depth, time_limit_ms, infinite=False):
+        stopped = self.stopped
+        if self.book is not None:
+            move = self.book.choose(board)
+            if move is not None:
+                if infinite:
+                    stopped.wait()
+                self.send(f"bestmove {move_to_uci(move)}")
+                return
+        start = time.perf_counter()
+
+        def report(info):
+            # UCI wants totals for the whole search, not for the last depth
+            elapsed = time.perf_counter() - start
+            nps = searcher.nodes / elapsed if elapsed > 0 else 0
+            pv = f" pv {move_to_uci(info.best_move)}" if info.best_move else ""
+            self.send(f"info depth {info.depth} score {format_score(info.score)} nodes {searcher.nodes} "
+                      f"time {elapsed * 1000:.0f} nps {nps:.0f}{pv}")
+
+        result = searcher.search(board, max_depth, time_limit_ms, on_iteration=report)
+        if infinite:
+            # UCI only allows the bestmove after stop
+            stopped.wait()
+        self.send(f"bestmove {move_to_uci(result.best_move) if result.best_move else '0000'}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="UCI front end for the engine")
+    parser.add_argument("--book", help="opening book built with book.py")
+    args = parser.parse_args(argv)
+
+    book = None
+    if args.book:
+        from book import OpeningBook
+        book = OpeningBook(args.book)
+    engine = UciEngine(book=book)
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    engine.stop()
+
+
+if __name__ == "__main__":
+    main()